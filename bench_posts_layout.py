@@ -0,0 +1,166 @@
+"""
+מדידת פריסות האחסון של הפוסטים ב-MongoDB: קולקציה רגילה בלי אינדקסים מלבד _id (כמו posts היום),
+קולקציה רגילה עם אינדקס על (channel, date), וקולקציית time-series (MONGO_POSTS_LAYOUT=timeseries).
+כל הפריסות מקבלות אותם פוסטים סינתטיים (על פני שנה, מחולקים בין כמה ערוצים) ואותה שאילתה מסוננת לפי ערוץ,
+כך שכל שאילתת חלון מחזירה אותן שורות בכל פריסה. נמדדים זמן הטעינה, זמני שאילתת חלון (7 ו-30 ימים, p50/p95)
+ונפח האחסון והאינדקסים.
+
+שימוש:
+    python bench_posts_layout.py
+    python bench_posts_layout.py --sizes 10000,100000 --queries 50 --database sammery_bench
+
+שים לב: הבנצ'מרק מוחק ויוצר מחדש קולקציות במסד שצוין - אין להריץ אותו על telegram_bot_db.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, MongoClient
+
+from storage import ensure_timeseries_collection
+
+logger = logging.getLogger(__name__)
+
+LAYOUTS = ("plain", "plain+index", "timeseries")
+WINDOWS_DAYS = (7, 30)
+SPAN_DAYS = 365
+BENCH_CHANNELS = ("AndroidAndAI", "bench-channel-2", "bench-channel-3")
+SAMPLE_TEXT = "פוסט בדיקה על אנדרואיד ובינה מלאכותית עם קישור https://example.com/post ועוד קצת טקסט. " * 3
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _prepare(db, layout: str, name: str):
+    db.drop_collection(name)
+    if layout == "timeseries":
+        return ensure_timeseries_collection(db, name)
+    collection = db[name]
+    if layout == "plain+index":
+        collection.create_index([('channel', ASCENDING), ('date', ASCENDING)])
+    return collection
+
+
+def _documents(count: int, end: datetime, batch_size: int):
+    """פוסטים סינתטיים בסדר כרונולוגי לאורך SPAN_DAYS, במקבצים, מחולקים בין הערוצים - זהים בכל הפריסות."""
+    step = timedelta(days=SPAN_DAYS) / count
+    start = end - timedelta(days=SPAN_DAYS)
+    batch = []
+    for i in range(count):
+        batch.append({
+            'channel': BENCH_CHANNELS[i % len(BENCH_CHANNELS)],
+            'message_id': i + 1,
+            'date': start + step * i,
+            'text': SAMPLE_TEXT,
+        })
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _sizes(db, name: str, layout: str) -> Dict:
+    # בקולקציית time-series הנתונים עצמם יושבים ב-system.buckets.<name>
+    try:
+        stats = db.command('collStats', name)
+    except Exception:
+        stats = {}
+    if layout == "timeseries" and not stats.get('storageSize'):
+        stats = db.command('collStats', f"system.buckets.{name}")
+    return {'storage_mb': stats.get('storageSize', 0) / 1_048_576, 'index_mb': stats.get('totalIndexSize', 0) / 1_048_576}
+
+
+def _window_queries(end: datetime, days: int, queries: int, seed: int = 7) -> List[Dict]:
+    """
+    שאילתות חלון בנקודות אקראיות בשנה (כדי לא למדוד רק את הנתונים החמים ביותר).
+    ה-seed קבוע, כך שכל הפריסות מריצות בדיוק אותן שאילתות.
+    """
+    rng = random.Random(seed + days)
+    result = []
+    for _ in range(queries):
+        window_end = end - timedelta(days=rng.uniform(0, SPAN_DAYS - days))
+        result.append({'channel': BENCH_CHANNELS[0], 'date': {'$gte': window_end - timedelta(days=days), '$lt': window_end}})
+    return result
+
+
+def bench_layout(db, layout: str, count: int, queries: int, batch_size: int, end: datetime) -> Dict:
+    name = f"bench_{layout.replace('+', '_').replace('-', '_')}"
+    collection = _prepare(db, layout, name)
+
+    started = time.monotonic()
+    for batch in _documents(count, end, batch_size):
+        collection.insert_many(batch, ordered=False)
+    ingest_seconds = time.monotonic() - started
+
+    result = {'layout': layout, 'posts': count, 'ingest_seconds': ingest_seconds, 'windows': {}}
+    for days in WINDOWS_DAYS:
+        latencies = []
+        for query in _window_queries(end, days, queries):
+            began = time.monotonic()
+            list(collection.find(query).sort('date', 1))
+            latencies.append(time.monotonic() - began)
+        latencies.sort()
+        result['windows'][days] = {
+            'p50_ms': _percentile(latencies, 0.50) * 1000,
+            'p95_ms': _percentile(latencies, 0.95) * 1000,
+        }
+    result.update(_sizes(db, name, layout))
+    db.drop_collection(name)
+    return result
+
+
+def format_results(results: List[Dict]) -> str:
+    header = f"{'layout':<18} {'posts':>9} {'ingest':>9}"
+    for days in WINDOWS_DAYS:
+        header += f" {f'{days}d p50':>9} {f'{days}d p95':>9}"
+    header += f" {'storage':>10} {'indexes':>10}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        line = f"{r['layout']:<18} {r['posts']:>9} {r['ingest_seconds']:>8.1f}s"
+        for days in WINDOWS_DAYS:
+            line += f" {r['windows'][days]['p50_ms']:>7.1f}ms {r['windows'][days]['p95_ms']:>7.1f}ms"
+        line += f" {r['storage_mb']:>8.1f}MB {r['index_mb']:>8.1f}MB"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare plain and time-series layouts for the posts collection.")
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI"), help="MongoDB URI (default: MONGODB_URI)")
+    parser.add_argument("--database", default="sammery_bench", help="scratch database (collections are dropped)")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated post counts")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS), help=f"comma separated layouts: {','.join(LAYOUTS)}")
+    parser.add_argument("--queries", type=int, default=30, help="window queries per window size")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    if not args.uri:
+        parser.error("MongoDB URI is required (--uri or MONGODB_URI)")
+    if args.database == "telegram_bot_db":
+        parser.error("Refusing to run against the bot database; use a scratch database")
+
+    db = MongoClient(args.uri)[args.database]
+    # אותו זמן סיום לכל הריצות, כדי שהנתונים והשאילתות יהיו זהים בין הפריסות
+    end = datetime.now(timezone.utc)
+    results = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        for layout in args.layouts.split(","):
+            if layout not in LAYOUTS:
+                parser.error(f"Unknown layout '{layout}'")
+            logger.info(f"Benchmarking {layout} with {size} posts...")
+            results.append(bench_layout(db, layout, size, args.queries, args.batch_size, end))
+    print(format_results(results))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    main()
@@ -0,0 +1,17 @@
+"""
+הגדרות gunicorn לכיבוי מסודר. ב-redeploy נשלח SIGTERM: ה-worker מפסיק לקבל בקשות ו-worker_exit
+מריץ את הכיבוי המסודר של הבוט (main.shutdown_bot) לפני שהתהליך יוצא.
+graceful_timeout גדול מזמן ההמתנה של shutdown_bot (SHUTDOWN_TIMEOUT_SECONDS ועוד 5 שניות לשמירה ולסגירה)
+כדי ש-gunicorn לא יהרוג את ה-worker באמצע, וקטן מ-30 השניות ש-Render ממתין לפני SIGKILL (בברירת המחדל: 23).
+"""
+import os
+import sys
+
+graceful_timeout = int(float(os.getenv('SHUTDOWN_TIMEOUT_SECONDS', '15'))) + 8
+
+
+def worker_exit(server, worker):
+    # המודול כבר נטען כחלק מהאפליקציה (main:app) - לא מייבאים מחדש כדי לא להפעיל בוט חדש
+    main = sys.modules.get('main')
+    if main is not None:
+        main.shutdown_bot()
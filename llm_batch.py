@@ -0,0 +1,164 @@
+"""
+יצירה במצב batch לסיכומים שאינם דחופים (הסיכום המתוזמן של יום שישי).
+הבקשה נשלחת כמשימת batch אסינכרונית כמה שעות לפני מועד הפרסום, נבדקת מדי פעם עד שהיא מוכנה,
+והתוצאה נשמרת עד שהמועד מגיע. ב-OpenAI משימות batch מחויבות בחצי מחיר.
+הספק ניתן להחלפה: OpenAIBatchProvider מול ה-Batch API, ו-LocalBatchProvider שמדמה אותו לבדיקות והרצה מקומית.
+"""
+import io
+import json
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import openai
+
+from llm_client import LLMError, LLMResult
+
+logger = logging.getLogger(__name__)
+
+STATE_PENDING = "pending"
+STATE_COMPLETED = "completed"
+STATE_FAILED = "failed"
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+
+@dataclass
+class BatchStatus:
+    """מצב משימה: pending / completed / failed. results ממופה לפי ה-custom_id של כל בקשה."""
+    state: str
+    results: Dict[str, LLMResult] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def _result_from_completion(body: Dict) -> LLMResult:
+    """המרת גוף תשובה של Chat Completions (כ-dict) ל-LLMResult."""
+    usage = body.get("usage") or {}
+    texts = [((choice.get("message") or {}).get("content") or "").strip() for choice in body.get("choices", [])]
+    if not texts:
+        raise LLMError("Batch response contained no choices")
+    return LLMResult(
+        text=texts[0],
+        texts=texts,
+        model=body.get("model", ""),
+        prompt_tokens=usage.get("prompt_tokens", 0) or 0,
+        completion_tokens=usage.get("completion_tokens", 0) or 0,
+        cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0,
+        raw=body
+    )
+
+
+class OpenAIBatchProvider:
+    """Batch API של OpenAI: קובץ JSONL עם בקשות, משימה עם חלון השלמה של 24 שעות והורדת קובץ התוצאות."""
+
+    name = "openai"
+
+    def __init__(self, client: openai.OpenAI):
+        self.client = client
+
+    def submit(self, requests: List[Dict]) -> str:
+        """requests: רשימת {'custom_id', 'body'} כאשר body הוא גוף בקשת Chat Completions. מחזיר מזהה משימה."""
+        lines = [
+            json.dumps({"custom_id": request["custom_id"], "method": "POST", "url": CHAT_COMPLETIONS_ENDPOINT,
+                        "body": request["body"]}, ensure_ascii=False)
+            for request in requests
+        ]
+        payload = io.BytesIO("\n".join(lines).encode("utf-8"))
+        try:
+            input_file = self.client.files.create(file=("summary-batch.jsonl", payload), purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=CHAT_COMPLETIONS_ENDPOINT,
+                completion_window="24h"
+            )
+        except openai.OpenAIError as e:
+            raise LLMError(f"Failed to submit OpenAI batch: {e}") from e
+        return batch.id
+
+    def poll(self, batch_id: str) -> BatchStatus:
+        try:
+            batch = self.client.batches.retrieve(batch_id)
+        except openai.OpenAIError as e:
+            raise LLMError(f"Failed to retrieve OpenAI batch {batch_id}: {e}") from e
+
+        if batch.status in ("validating", "in_progress", "finalizing"):
+            return BatchStatus(STATE_PENDING)
+        if batch.status != "completed":
+            return BatchStatus(STATE_FAILED, error=f"Batch ended with status '{batch.status}'")
+        if not batch.output_file_id:
+            return BatchStatus(STATE_FAILED, error="Batch completed without an output file")
+
+        results, errors = {}, []
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                errors.append(f"{record.get('custom_id')}: {record.get('error') or response.get('status_code')}")
+                continue
+            results[record["custom_id"]] = _result_from_completion(response.get("body") or {})
+        if not results:
+            return BatchStatus(STATE_FAILED, error="; ".join(errors) or "Batch output was empty")
+        return BatchStatus(STATE_COMPLETED, results=results)
+
+    def cancel(self, batch_id: str):
+        try:
+            self.client.batches.cancel(batch_id)
+        except openai.OpenAIError as e:
+            logger.warning(f"Failed to cancel OpenAI batch {batch_id}: {e}")
+
+
+class LocalBatchProvider:
+    """
+    ספק batch מקומי: המשימה "מוכנה" אחרי ready_after שניות מהשליחה, עם התוצאה שנקבעה ב-outcome:
+      completed - תשובה תקינה (כמספר ה-n שהתבקש)
+      failed    - המשימה נכשלה
+      pending   - המשימה לא מסתיימת אף פעם (לבדיקת המעבר לנתיב הרגיל במועד הפרסום)
+    """
+
+    name = "stub"
+
+    def __init__(self, ready_after: float = 5.0, outcome: str = STATE_COMPLETED,
+                 response_text: str = "<b>סיכום בדיקה</b>\nזהו סיכום שנוצר במצב batch על ידי ספק מקומי."):
+        self.ready_after = ready_after
+        self.outcome = outcome
+        self.response_text = response_text
+        self.jobs: Dict[str, Dict] = {}
+
+    def submit(self, requests: List[Dict]) -> str:
+        batch_id = f"local-batch-{len(self.jobs) + 1}-{int(time.time())}"
+        self.jobs[batch_id] = {"requests": requests, "submitted": time.monotonic(), "cancelled": False}
+        return batch_id
+
+    def poll(self, batch_id: str) -> BatchStatus:
+        job = self.jobs.get(batch_id)
+        if job is None:
+            # משימה שנשלחה לפני הפעלה מחדש של התהליך - אין לה תוצאה בספק המקומי
+            return BatchStatus(STATE_FAILED, error=f"Unknown local batch '{batch_id}'")
+        if job["cancelled"]:
+            return BatchStatus(STATE_FAILED, error="Batch was cancelled")
+        if self.outcome == STATE_PENDING or time.monotonic() - job["submitted"] < self.ready_after:
+            return BatchStatus(STATE_PENDING)
+        if self.outcome == STATE_FAILED:
+            return BatchStatus(STATE_FAILED, error="Stub batch failed")
+
+        results = {}
+        for request in job["requests"]:
+            body = request["body"]
+            n = body.get("n", 1)
+            texts = [self.response_text] + [f"{self.response_text}\n(גרסה {i + 1})" for i in range(1, n)]
+            prompt_chars = sum(len(message.get("content", "")) for message in body.get("messages", []))
+            results[request["custom_id"]] = LLMResult(
+                text=texts[0],
+                texts=texts,
+                model=body.get("model", ""),
+                prompt_tokens=prompt_chars // 4,
+                completion_tokens=sum(len(text) for text in texts) // 4
+            )
+        return BatchStatus(STATE_COMPLETED, results=results)
+
+    def cancel(self, batch_id: str):
+        if batch_id in self.jobs:
+            self.jobs[batch_id]["cancelled"] = True
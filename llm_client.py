@@ -0,0 +1,328 @@
+"""
+שכבת קריאות LLM עמידה: deadline לכל ניסיון ולכלל הקריאה, ניסיונות חוזרים עם jitter על 429/5xx,
+בקשת גידור (hedging) למודל מהיר יותר אחרי סף השהיה, ו-circuit breaker שנכשל מהר כשהספק לא תקין.
+כולל ספק מקומי (stub) שמדמה כל אחד ממצבי הכשל לצורך בדיקות והרצה מקומית.
+"""
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """שגיאה בקריאה לספק ה-LLM. retryable מציין אם כדאי לנסות שוב."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+class CircuitOpenError(LLMError):
+    """ה-circuit breaker פתוח - הספק נחשב לא תקין ולא נשלחת בקשה."""
+
+
+class DeadlineExceededError(LLMError):
+    """חלף ה-deadline הכולל של הקריאה."""
+
+
+@dataclass
+class LLMResult:
+    text: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # טוקני קלט שנענו ממטמון הקידומת של הספק (מתוך prompt_tokens)
+    latency: float = 0.0
+    attempts: int = 1
+    hedged: bool = False
+    raw: Optional[object] = field(default=None, repr=False)
+    texts: List[str] = field(default_factory=list)  # כל התשובות כשהתבקשו כמה (n>1). text היא הראשונה
+
+    def __post_init__(self):
+        if not self.texts:
+            self.texts = [self.text]
+
+
+# ===============================================
+# ספקים
+# ===============================================
+
+class OpenAIChatProvider:
+    """ספק Chat Completions של OpenAI. הניסיונות החוזרים מנוהלים אצלנו ולא בספרייה."""
+
+    def __init__(self, client: openai.OpenAI):
+        self.client = client.with_options(max_retries=0)
+
+    def complete(self, model: str, messages: List[Dict], timeout: float, **params) -> LLMResult:
+        started = time.monotonic()
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=timeout,
+                **params
+            )
+        except openai.APITimeoutError as e:
+            raise LLMError(f"OpenAI request timed out: {e}", retryable=True) from e
+        except openai.APIConnectionError as e:
+            raise LLMError(f"OpenAI connection error: {e}", retryable=True) from e
+        except openai.APIStatusError as e:
+            retryable = e.status_code == 429 or e.status_code >= 500
+            raise LLMError(f"OpenAI returned {e.status_code}: {e}", status_code=e.status_code, retryable=retryable) from e
+
+        usage = getattr(response, 'usage', None)
+        prompt_details = getattr(usage, 'prompt_tokens_details', None)
+        texts = [(choice.message.content or "").strip() for choice in response.choices]
+        return LLMResult(
+            text=texts[0],
+            texts=texts,
+            model=getattr(response, 'model', model),
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+            cached_tokens=getattr(prompt_details, 'cached_tokens', 0) or 0,
+            latency=time.monotonic() - started,
+            raw=response
+        )
+
+
+class LocalStubProvider:
+    """
+    ספק מקומי שמדמה התנהגויות של ספק אמיתי, לפי תסריט של מצבים לכל קריאה:
+      ok        - תשובה תקינה
+      slow:<s>  - תשובה תקינה אחרי s שניות
+      hang      - לא עונה עד שחולף ה-timeout של הניסיון
+      429 / 500 / 503 - שגיאת HTTP מתאימה
+      error     - שגיאה שאינה ניתנת לניסיון חוזר (כמו 400)
+    אפשר להגדיר תסריט נפרד לכל מודל (לבדיקת hedging). כשהתסריט נגמר חוזרים ל-default_mode.
+    מטמון הקידומת מדומה: הודעת system שכבר נראתה נספרת כ-cached_tokens.
+    """
+
+    def __init__(self, script: Optional[List[str]] = None, per_model: Optional[Dict[str, List[str]]] = None,
+                 default_mode: str = "ok", response_text: str = "<b>סיכום בדיקה</b>\nזהו סיכום שנוצר על ידי ספק מקומי."):
+        self.script = list(script or [])
+        self.per_model = {model: list(modes) for model, modes in (per_model or {}).items()}
+        self.default_mode = default_mode
+        self.response_text = response_text
+        self.calls: List[Dict] = []
+        self._seen_prefixes = set()
+
+    def _next_mode(self, model: str) -> str:
+        queue = self.per_model.get(model)
+        if queue:
+            return queue.pop(0)
+        if queue is None and self.script:
+            return self.script.pop(0)
+        return self.default_mode
+
+    def complete(self, model: str, messages: List[Dict], timeout: float, **params) -> LLMResult:
+        mode = self._next_mode(model)
+        self.calls.append({"model": model, "mode": mode})
+        started = time.monotonic()
+
+        if mode == "hang":
+            time.sleep(timeout)
+            raise LLMError("Stub request timed out", retryable=True)
+        if mode.startswith("slow:"):
+            delay = float(mode.split(":", 1)[1])
+            if delay >= timeout:
+                time.sleep(timeout)
+                raise LLMError("Stub request timed out", retryable=True)
+            time.sleep(delay)
+        elif mode.isdigit():
+            status = int(mode)
+            raise LLMError(f"Stub returned {status}", status_code=status, retryable=status == 429 or status >= 500)
+        elif mode == "error":
+            raise LLMError("Stub returned 400", status_code=400, retryable=False)
+
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        prefix = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+        cached_chars = len(prefix) if prefix in self._seen_prefixes else 0
+        if prefix:
+            self._seen_prefixes.add(prefix)
+        # n>1: מספר תשובות שונות בקריאה אחת, כמו ב-Chat Completions
+        texts = [self.response_text] + [f"{self.response_text}\n(גרסה {i + 1})" for i in range(1, params.get("n", 1))]
+        return LLMResult(
+            text=texts[0],
+            texts=texts,
+            model=model,
+            prompt_tokens=prompt_chars // 4,
+            completion_tokens=sum(len(text) for text in texts) // 4,
+            cached_tokens=cached_chars // 4,
+            latency=time.monotonic() - started
+        )
+
+
+# ===============================================
+# Circuit breaker
+# ===============================================
+
+class CircuitBreaker:
+    """
+    מונה כשלים רצופים. אחרי failure_threshold כשלים המעגל נפתח לזמן reset_timeout,
+    ואז עובר למצב half-open שבו נשלחת בקשת ניסיון אחת בלבד.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("LLM circuit breaker closed after a successful trial request.")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """שחרור בקשת הניסיון במצב half-open בלי לקבוע את מצב הספק."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            logger.warning(f"LLM circuit breaker opened after {self.failures} consecutive failures.")
+
+
+# ===============================================
+# הלקוח העמיד
+# ===============================================
+
+class ResilientLLMClient:
+    """עוטף ספק LLM סינכרוני ומריץ אותו ב-thread, עם deadlines, retries, hedging ו-circuit breaker."""
+
+    def __init__(self, provider, model: str, fallback_model: Optional[str] = None,
+                 attempt_timeout: float = 60.0, total_deadline: float = 180.0, max_retries: int = 3,
+                 backoff_base: float = 1.0, backoff_cap: float = 20.0, hedge_after: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.model = model
+        self.fallback_model = fallback_model
+        self.attempt_timeout = attempt_timeout
+        self.total_deadline = total_deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff עם full jitter."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def _call(self, model: str, messages: List[Dict], timeout: float, params: Dict) -> LLMResult:
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(self.provider.complete, model, messages, timeout, **params),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise LLMError(f"{model} did not respond within {timeout:.1f}s", retryable=True) from e
+
+    async def _attempt(self, model: str, messages: List[Dict], timeout: float, params: Dict) -> LLMResult:
+        """ניסיון בודד. אם הוגדר hedging והבקשה מתעכבת, נשלחת במקביל בקשה למודל הגיבוי."""
+        primary = asyncio.ensure_future(self._call(model, messages, timeout, params))
+        hedge_model = self.fallback_model
+        if not hedge_model or hedge_model == model or self.hedge_after is None or self.hedge_after >= timeout:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        logger.info(f"{model} is slower than {self.hedge_after:.1f}s. Sending hedged request to {hedge_model}.")
+        hedge = asyncio.ensure_future(self._call(hedge_model, messages, timeout - self.hedge_after, params))
+        pending = {primary, hedge}
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        result = task.result()
+                        result.hedged = task is hedge
+                        return result
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, messages: List[Dict], model: Optional[str] = None,
+                       deadline: Optional[float] = None, **params) -> LLMResult:
+        """שליחת בקשה עם כל מנגנוני ההגנה. זורק LLMError אם לא התקבלה תשובה."""
+        model = model or self.model
+        deadline_at = time.monotonic() + (deadline or self.total_deadline)
+        last_error: Optional[LLMError] = None
+
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError("LLM circuit breaker is open - skipping request.")
+
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = min(self.attempt_timeout, remaining)
+            started = time.monotonic()
+            try:
+                result = await self._attempt(model, messages, timeout, params)
+            except LLMError as e:
+                last_error = e
+                if not e.retryable:
+                    # שגיאת בקשה (כמו 400) אינה מעידה על תקינות הספק
+                    raise
+                self.breaker.record_failure()
+                logger.warning(f"LLM attempt {attempt + 1}/{self.max_retries + 1} failed: {e}")
+                if attempt == self.max_retries:
+                    break
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline_at:
+                    break
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                # שגיאה לא צפויה מהספק נספרת ככישלון, כמו שגיאת שרת
+                self.breaker.record_failure()
+                raise
+            finally:
+                # בקשת הניסיון ב-half-open משתחררת בכל יציאה, גם בביטול (CancelledError)
+                self.breaker.release_trial()
+
+            self.breaker.record_success()
+            result.attempts = attempt + 1
+            result.latency = time.monotonic() - started
+            return result
+
+        if last_error and time.monotonic() < deadline_at:
+            raise last_error
+        raise DeadlineExceededError(f"LLM request exceeded its deadline. Last error: {last_error}")
@@ -0,0 +1,260 @@
+"""
+מחולל עומס: משדר עדכוני Update מוקלטים (RECORD_UPDATES_PATH) או סינתטיים (פוסטים בערוץ, הודעות מועברות,
+לחיצות כפתורים) אל Application.process_update בקצב נתון, ומודד זמני טיפול לפי סוג עדכון.
+בשילוב עם LOOP_WATCHDOG_THRESHOLD_MS רואים גם איזה handler חוסם את ה-event loop.
+
+שימוש:
+    python load_replay.py --synthetic 1000 --rate 100
+    python load_replay.py --file updates.jsonl --rate 20 --concurrency 4
+
+שים לב: הודעות מועברות ולחיצות כפתורים גורמות לבוט לענות דרך ה-Bot API - מומלץ להריץ עם טוקן של בוט בדיקות.
+כברירת מחדל הבוט רץ על מאגר SQLite זמני, כדי שפוסטים סינתטיים לא ייכנסו לסיכום האמיתי ולא ישנו את המונים.
+--use-configured-storage מריץ על המאגר שמוגדר בסביבה (למדידת המאגר עצמו - רק מול מסד בדיקות).
+"""
+import os
+import json
+import time
+import queue
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from typing import List, Dict, Iterable, Optional
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_WORDS = [
+    "אנדרואיד", "גוגל", "בינה", "מלאכותית", "מודל", "עדכון", "חדש", "אפליקציה", "Gemini", "OpenAI",
+    "GPT", "Pixel", "סמסונג", "תכונה", "מהיר", "חינם", "גרסה", "בטא", "מפתחים", "כלי",
+]
+UPDATE_KINDS = ("channel_post", "forward", "callback")
+
+
+def _random_text(words: int = 40) -> str:
+    return " ".join(random.choices(SAMPLE_WORDS, k=words)) + "."
+
+
+def synthetic_updates(count: int, channel_username: str, admin_id: int,
+                      kinds: Iterable[str] = ("channel_post",), start_message_id: int = 1_000_000) -> List[Dict]:
+    """יצירת עדכונים סינתטיים בפורמט JSON של ה-Bot API, בחלוקה שווה בין סוגי העדכונים."""
+    kinds = list(kinds)
+    channel_chat = {"id": -1001000000000, "type": "channel", "username": channel_username, "title": channel_username}
+    admin_user = {"id": admin_id, "is_bot": False, "first_name": "Load"}
+    admin_chat = {"id": admin_id, "type": "private", "first_name": "Load"}
+    now = int(time.time())
+    updates = []
+
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        message_id = start_message_id + i
+        if kind == "channel_post":
+            payload = {"channel_post": {
+                "message_id": message_id, "date": now, "chat": channel_chat, "text": _random_text()
+            }}
+        elif kind == "forward":
+            payload = {"message": {
+                "message_id": message_id, "date": now, "chat": admin_chat, "from": admin_user,
+                "forward_origin": {"type": "channel", "chat": channel_chat, "message_id": message_id, "date": now},
+                "text": _random_text()
+            }}
+        elif kind == "callback":
+            payload = {"callback_query": {
+                "id": str(message_id), "from": admin_user, "chat_instance": "load-replay", "data": "preview",
+                "message": {"message_id": message_id, "date": now, "chat": admin_chat, "text": "load"}
+            }}
+        else:
+            raise ValueError(f"Unknown update kind '{kind}'")
+        updates.append({"update_id": message_id, **payload})
+    return updates
+
+
+class UpdateRecorder:
+    """
+    הקלטת עדכונים לקובץ (שורת JSON לכל עדכון) מ-thread נפרד, כך שכתיבה לדיסק לא חוסמת את ה-event loop.
+    record() רק מכניס לתור. close() כותב את מה שנשאר וסוגר את הקובץ.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, name="UpdateRecorderThread", daemon=True)
+        self._thread.start()
+
+    def record(self, data: Dict):
+        self._queue.put(data)
+
+    def _write_loop(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    break
+                try:
+                    f.write(json.dumps(data, ensure_ascii=False) + "\n")
+                except Exception as e:
+                    logger.error(f"Failed to record update: {e}")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self, timeout: float = 5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+def load_recorded_updates(path: str) -> List[Dict]:
+    """קריאת עדכונים שהוקלטו על ידי הבוט (שורת JSON לכל עדכון)."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def update_kind(data: Dict) -> str:
+    if "channel_post" in data:
+        return "channel_post"
+    if "callback_query" in data:
+        return "callback"
+    message = data.get("message") or {}
+    if "forward_origin" in message:
+        return "forward"
+    if (message.get("text") or "").startswith("/"):
+        return "command"
+    return "message"
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def replay(application, updates: List[Dict], rate: float, concurrency: int = 1) -> Dict:
+    """
+    שידור העדכונים ל-application.process_update בקצב rate לשנייה.
+    מחזיר סטטיסטיקות: קצב בפועל, השהיית שיגור (מעידה על לולאה עמוסה) וזמני טיפול לפי סוג.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    latencies: Dict[str, List[float]] = {}
+    dispatch_delays: List[float] = []
+    errors = 0
+    started = time.monotonic()
+
+    async def handle(data: Dict):
+        nonlocal errors
+        async with slots:
+            update = Update.de_json(data, application.bot)
+            began = time.monotonic()
+            try:
+                await application.process_update(update)
+            except Exception as e:
+                errors += 1
+                logger.warning(f"Update {data.get('update_id')} failed during replay: {e}")
+            latencies.setdefault(update_kind(data), []).append(time.monotonic() - began)
+
+    tasks = []
+    for i, data in enumerate(updates):
+        scheduled_at = started + i / rate
+        delay = scheduled_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        dispatch_delays.append(max(0.0, time.monotonic() - scheduled_at))
+        tasks.append(asyncio.create_task(handle(data)))
+    await asyncio.gather(*tasks)
+
+    elapsed = time.monotonic() - started
+    report = {
+        "updates": len(updates),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "target_rate": rate,
+        "achieved_rate": len(updates) / elapsed if elapsed else 0.0,
+        "max_dispatch_delay_ms": max(dispatch_delays, default=0.0) * 1000,
+        "kinds": {},
+    }
+    for kind, values in latencies.items():
+        values.sort()
+        report["kinds"][kind] = {
+            "count": len(values),
+            "p50_ms": _percentile(values, 0.50) * 1000,
+            "p95_ms": _percentile(values, 0.95) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+    return report
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f"Replayed {report['updates']} updates in {report['elapsed_seconds']:.2f}s "
+        f"(target {report['target_rate']:.1f}/s, achieved {report['achieved_rate']:.1f}/s, errors: {report['errors']})",
+        f"Max dispatch delay: {report['max_dispatch_delay_ms']:.1f}ms",
+    ]
+    for kind, stats in sorted(report["kinds"].items()):
+        lines.append(
+            f"  {kind:<13} n={stats['count']:<6} p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms "
+            f"p99={stats['p99_ms']:.1f}ms max={stats['max_ms']:.1f}ms"
+        )
+    return "\n".join(lines)
+
+
+async def _run_cli(args):
+    # ייבוא הבוט ללא הפעלת ה-thread של ה-polling ברמת המודול
+    os.environ["SAMMERY_AUTOSTART"] = "false"
+    # השידור החוזר לא מקליט את עצמו
+    os.environ.pop("RECORD_UPDATES_PATH", None)
+    scratch_dir = None
+    if not args.use_configured_storage:
+        scratch_dir = tempfile.mkdtemp(prefix="sammery-replay-")
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(scratch_dir, "replay.db")
+        logger.info(f"Replaying against a scratch SQLite store at {os.environ['SQLITE_PATH']}.")
+    import main as bot_module
+
+    # דיווח הפעילות נכתב למסד הניטור של הפרודקשן - אינטראקציות מדומות לא נרשמות שם
+    bot_module.reporter.connected = False
+    bot = bot_module.TelegramSummaryBot()
+    if args.file:
+        updates = load_recorded_updates(args.file)
+    else:
+        admin_id = int(bot.admin_chat_id or 0)
+        updates = synthetic_updates(args.synthetic, bot.channel_username, admin_id, kinds=args.kinds.split(","))
+
+    watchdog = None
+    try:
+        await bot.application.initialize()
+        watchdog = bot.start_loop_watchdog()
+        report = await replay(bot.application, updates, rate=args.rate, concurrency=args.concurrency)
+    finally:
+        if watchdog:
+            watchdog.stop()
+        await bot.application.shutdown()
+        bot.storage.close()
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(format_report(report))
+    if watchdog and watchdog.stalls:
+        print(f"Event loop stalls detected: {len(watchdog.stalls)} (max lag {watchdog.max_lag * 1000:.0f}ms) - see log for stacks.")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay Telegram updates into the bot to measure ingest throughput.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="JSONL file of recorded updates (see RECORD_UPDATES_PATH)")
+    source.add_argument("--synthetic", type=int, help="number of synthetic updates to generate")
+    parser.add_argument("--kinds", default="channel_post", help=f"comma separated kinds for synthetic updates: {','.join(UPDATE_KINDS)}")
+    parser.add_argument("--rate", type=float, default=50.0, help="updates per second")
+    parser.add_argument("--concurrency", type=int, default=1, help="updates processed concurrently")
+    parser.add_argument("--use-configured-storage", action="store_true",
+                        help="write to the storage configured in the environment instead of a scratch SQLite file")
+    args = parser.parse_args(argv)
+    asyncio.run(_run_cli(args))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    main()
@@ -0,0 +1,86 @@
+"""
+גלאי תקיעות של ה-event loop.
+משימה בתוך הלולאה "מתקתקת" כל interval שניות ומודדת את ההשהיה (lag) שלה, ו-thread צופה בודק
+שהתקתוק לא נעצר. אם callback חוסם את הלולאה יותר מ-threshold, ה-thread הצופה לוכד את ה-stack
+של ה-thread של הלולאה באותו רגע - כלומר את הקוד שחוסם בפועל (pymongo, OpenAI וכו').
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional, Callable, Awaitable, List, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopWatchdog:
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float, interval: float = 0.1,
+                 on_stall: Optional[Callable[[float, str], Awaitable[None]]] = None, max_history: int = 20):
+        """
+        threshold: משך חסימה (בשניות) שמעליו נחשבת תקיעה.
+        on_stall: קורוטינה שנקראת (בתוך הלולאה) כשהתקיעה מסתיימת, עם משך התקיעה וה-stack שנלכד.
+        """
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.on_stall = on_stall
+        self.max_history = max_history
+
+        self.max_lag = 0.0
+        self.stalls: List[Dict] = []
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._captured_stack: Optional[str] = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+
+    def start(self):
+        """הפעלה מתוך ה-event loop (למשל ב-run של הבוט)."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._task = self.loop.create_task(self._ticker())
+        self._monitor = threading.Thread(target=self._watch, name="LoopWatchdogThread", daemon=True)
+        self._monitor.start()
+        logger.info(f"Event loop watchdog started (threshold: {self.threshold * 1000:.0f}ms).")
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _ticker(self):
+        while not self._stop.is_set():
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - expected
+            self.max_lag = max(self.max_lag, lag)
+            self._last_tick = now
+
+            stack = self._captured_stack
+            if stack is not None and lag >= self.threshold:
+                self._captured_stack = None
+                self._record_stall(lag, stack)
+            elif stack is not None:
+                self._captured_stack = None
+
+    def _record_stall(self, duration: float, stack: str):
+        logger.warning(f"Event loop was blocked for {duration * 1000:.0f}ms. Blocking stack:\n{stack}")
+        self.stalls.append({'duration': duration, 'stack': stack, 'at': time.time()})
+        del self.stalls[:-self.max_history]
+        if self.on_stall:
+            self.loop.create_task(self.on_stall(duration, stack))
+
+    def _watch(self):
+        """רץ ב-thread נפרד: לוכד את ה-stack של ה-thread של הלולאה כשהתקתוק מתעכב."""
+        while not self._stop.wait(self.interval / 2):
+            blocked_for = time.monotonic() - self._last_tick - self.interval
+            if blocked_for < self.threshold or self._captured_stack is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._captured_stack = "".join(traceback.format_stack(frame))
@@ -1,13 +1,13 @@
 import os
-import re
+import html
 import logging
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Dict
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Tuple
 import json
 import openai
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, filters
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, ContextTypes, filters
 from telegram.constants import ParseMode
 import schedule
 import time
@@ -15,8 +15,18 @@ from threading import Thread
 import pytz
 import threading
 from flask import Flask
-from pymongo import MongoClient, DESCENDING
 from activity_reporter import create_reporter
+from summarizers import ExtractiveSummarizer, create_summarizer
+from llm_client import ResilientLLMClient, OpenAIChatProvider, LocalStubProvider, CircuitBreaker, LLMResult
+from llm_batch import OpenAIBatchProvider, LocalBatchProvider, STATE_PENDING, STATE_COMPLETED
+from search_index import SearchIndex
+from rollups import RollupEngine, parse_window, LEVEL_DAY
+from loop_watchdog import EventLoopWatchdog
+from load_replay import UpdateRecorder
+from telegram_html import repair_telegram_html
+from usage_tracker import UsageTracker, BudgetGuard, period_starts
+from storage import MongoStorage, SQLiteStorage
+from prompts import WEEKLY_SUMMARY, ROLLUP, ROLLUP_DAY_INSTRUCTION, ROLLUP_MERGE_INSTRUCTION, weekly_summary_suffix
 
 # הגדרה חד-פעמית של ה-Reporter
 reporter = create_reporter(
@@ -57,7 +67,11 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram.ext").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
-BR_TAG_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+SEARCH_PAGE_SIZE = 5
+BATCH_STATE_KEY = "summary_batch"
+POSTS_CLEARED_KEY = "posts_cleared"
+ROLLUPS_USED_KEY = "rollups_used"
+LLM_SUMMARY_ENGINE = "openai"
 
 class TelegramSummaryBot:
     def __init__(self):
@@ -71,32 +85,143 @@ class TelegramSummaryBot:
         raw_schedule_time = os.getenv('DEFAULT_SCHEDULE_TIME')
         self.default_schedule_time = raw_schedule_time.strip() if raw_schedule_time else None  # ברירת־מחדל: ללא תזמון
         self.auto_publish_on_start = os.getenv('AUTO_PUBLISH_ON_START', 'false').lower() in ("1", "true", "yes", "on")
+        # שמירת הפוסטים במאגר גם אחרי פרסום (לחיפוש ולהיסטוריה). ברירת מחדל: מחיקה אחרי פרסום
+        self.retain_posts = os.getenv('RETAIN_POSTS', 'false').lower() in ("1", "true", "yes", "on")
+        # גלאי תקיעות של ה-event loop (כבוי כברירת מחדל) והקלטת עדכונים לשידור חוזר ב-load_replay.py
+        watchdog_threshold = os.getenv('LOOP_WATCHDOG_THRESHOLD_MS')
+        self.loop_watchdog_threshold = float(watchdog_threshold) / 1000 if watchdog_threshold else None
+        self.record_updates_path = os.getenv('RECORD_UPDATES_PATH') or None
+        self.update_recorder = UpdateRecorder(self.record_updates_path) if self.record_updates_path else None
+        # זמן מקסימלי (בשניות) להמתנה ל-OpenAI לפני מעבר למנוע הגיבוי
+        self.summary_deadline = float(os.getenv('SUMMARY_DEADLINE_SECONDS', '180'))
         
-        if not self.openai_api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set!")
-        # אתחול לקוח OpenAI החדש
-        self.openai_client = openai.OpenAI(api_key=self.openai_api_key)
+        # אתחול ספק ה-LLM. LLM_PROVIDER=stub מאפשר הרצה מקומית ללא OpenAI (לבדיקות)
+        self.llm_provider_name = os.getenv('LLM_PROVIDER', 'openai').strip().lower()
+        if self.llm_provider_name == 'stub':
+            self.openai_client = None
+            stub_script = [mode.strip() for mode in os.getenv('LLM_STUB_SCRIPT', '').split(',') if mode.strip()]
+            llm_provider = LocalStubProvider(script=stub_script)
+            logger.warning(f"Using local LLM stub provider (script: {stub_script or 'ok'}).")
+        else:
+            if not self.openai_api_key:
+                raise ValueError("OPENAI_API_KEY environment variable not set!")
+            # אתחול לקוח OpenAI החדש
+            self.openai_client = openai.OpenAI(api_key=self.openai_api_key)
+            llm_provider = OpenAIChatProvider(self.openai_client)
+
+        # שכבת קריאות עמידה: timeouts, retries עם jitter, hedging ו-circuit breaker
+        hedge_after = os.getenv('LLM_HEDGE_AFTER_SECONDS')
+        self.llm_client = ResilientLLMClient(
+            llm_provider,
+            model=os.getenv('LLM_MODEL', 'gpt-4-turbo'),
+            fallback_model=os.getenv('LLM_FALLBACK_MODEL') or None,
+            attempt_timeout=float(os.getenv('LLM_ATTEMPT_TIMEOUT_SECONDS', '90')),
+            total_deadline=self.summary_deadline,
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', '3')),
+            hedge_after=float(hedge_after) if hedge_after else None,
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', '5')),
+                reset_timeout=float(os.getenv('LLM_BREAKER_RESET_SECONDS', '300'))
+            )
+        )
+
+        # מצב batch לסיכום המתוזמן: שליחה כמה שעות לפני מועד הפרסום במקום קריאה חיה (ריק = כבוי)
+        batch_lead_hours = os.getenv('SUMMARY_BATCH_LEAD_HOURS')
+        self.batch_lead_hours = float(batch_lead_hours) if batch_lead_hours else None
+        self.batch_poll_interval = float(os.getenv('SUMMARY_BATCH_POLL_SECONDS', '300'))
+        if self.llm_provider_name == 'stub':
+            self.batch_provider = LocalBatchProvider(
+                ready_after=float(os.getenv('LLM_STUB_BATCH_READY_SECONDS', '5')),
+                outcome=os.getenv('LLM_STUB_BATCH_OUTCOME', 'completed')
+            )
+        else:
+            self.batch_provider = OpenAIBatchProvider(self.openai_client)
+        self._batch_poll_task: Optional[asyncio.Task] = None
+        # מחיקת הפוסטים שפורסמו (ושמירת התקצירים היומיים לפניה) רצה ברקע אחרי הפרסום
+        self._post_publish_task: Optional[asyncio.Task] = None
+        self._rollups_marked = False
+
+        # מנועי סיכום מקומיים: טיוטה מיידית לאדמין וגיבוי כש-OpenAI לא זמין
+        self.draft_summarizer = ExtractiveSummarizer(channel_username=self.channel_username)
+        self.fallback_summarizer = create_summarizer(
+            os.getenv('SUMMARY_FALLBACK_ENGINE', 'extractive'),
+            channel_username=self.channel_username
+        )
         
         # אתחול הבוט
         self.application = Application.builder().token(self.bot_token).build()
         self.loop = asyncio.get_event_loop()
         
-        # אתחול MongoDB
-        mongo_uri = os.getenv('MONGODB_URI')
-        if not mongo_uri:
-            raise ValueError("MONGODB_URI environment variable not set!")
-        self.mongo_client = MongoClient(mongo_uri)
-        self.db = self.mongo_client.telegram_bot_db
-        self.posts_collection = self.db.posts
-        logger.info("Successfully connected to MongoDB.")
+        # אתחול שכבת האחסון: MongoDB (ברירת מחדל) או SQLite מקומי
+        storage_backend = os.getenv('STORAGE_BACKEND', 'mongo').lower()
+        if storage_backend == 'sqlite':
+            self.storage = SQLiteStorage(
+                os.getenv('SQLITE_PATH', 'sammery.db'),
+                batch_size=int(os.getenv('SQLITE_BATCH_SIZE', '50')),
+                flush_interval=float(os.getenv('SQLITE_FLUSH_SECONDS', '1.0'))
+            )
+        elif storage_backend == 'mongo':
+            mongo_uri = os.getenv('MONGODB_URI')
+            if not mongo_uri:
+                raise ValueError("MONGODB_URI environment variable not set!")
+            self.storage = MongoStorage(
+                mongo_uri,
+                posts_layout=os.getenv('MONGO_POSTS_LAYOUT', 'plain').lower(),
+                channel=self.channel_username
+            )
+            logger.info(f"Successfully connected to MongoDB ({self.storage.name}).")
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND '{storage_backend}' (expected 'mongo' or 'sqlite')")
+
+        # אינדקס חיפוש בזיכרון, נבנה מחדש מהמאגר בעלייה ומתעדכן בכל קליטת פוסט
+        self.search_index = SearchIndex()
+        self.last_search_query = None
         
         # משתני מצב
         self.pending_summary = None
+        self.summary_window_days = None  # חלון הזמן של הסיכום הממתין (None = 7 ימים מפוסטים גולמיים)
+        # סיכומים חלופיים מוכנים ל"צור סיכום חדש", ומשימת רקע שמכינה את הבאים בתור
+        self.candidate_queue: List[str] = []
+        self._prefetch_task: Optional[asyncio.Task] = None
+        # המנוע שהפיק את הסיכום האחרון (OpenAI או שם המנוע המקומי כשהופעל הגיבוי)
+        self.last_summary_engine = LLM_SUMMARY_ENGINE
+        self.summary_candidates = max(1, int(os.getenv('SUMMARY_CANDIDATES', '1')))
+        self.summary_candidates_mode = os.getenv('SUMMARY_CANDIDATES_MODE', 'n').lower()
         self.israel_tz = pytz.timezone('Asia/Jerusalem')
         self.auto_publish_enabled = False  # הוספת משתנה למצב פרסום אוטומטי (כבוי כברירת מחדל)
         # נעילות למניעת הרצות כפולות במקביל
         self.publish_lock = asyncio.Lock()
         self.scheduled_job_lock = asyncio.Lock()
+        # כיבוי מסודר (SIGTERM / יציאת ה-worker של gunicorn): זמן מקסימלי להמתנה לעבודה שבאמצע
+        self.shutdown_timeout = float(os.getenv('SHUTDOWN_TIMEOUT_SECONDS', '15'))
+        self.stopping = False
+        self._stop_requested = asyncio.Event()
+        self._scheduler_stop = threading.Event()
+        self._scheduled_jobs = set()  # ריצות מתוזמנות שנשלחו ל-event loop ועדיין לא הסתיימו
+        self.loop_watchdog = None
+        self._last_stall_alert = 0.0
+
+        # סיכומים מדורגים: תקצירים יומיים/שבועיים/חודשיים שנשמרים במטמון לחלונות זמן שרירותיים
+        self.rollups = RollupEngine(
+            self.storage,
+            fetch_posts=self.get_posts_between,
+            summarize=self._summarize_rollup,
+            tz=self.israel_tz,
+            # שינוי בתבנית התקצירים פוסל את התקצירים השמורים שנוצרו בגרסה הקודמת
+            cache_tag=ROLLUP.prompt_id,
+            history_start=self._posts_history_start
+        )
+
+        # מעקב צריכת טוקנים ועלות, ושומר תקציב חודשי אופציונלי
+        self.usage_tracker = UsageTracker(self.storage)
+        monthly_budget = os.getenv('LLM_MONTHLY_BUDGET_USD')
+        self.budget_guard = BudgetGuard(
+            self.usage_tracker,
+            monthly_budget=float(monthly_budget) if monthly_budget else None,
+            cheap_model=os.getenv('LLM_BUDGET_MODEL', 'gpt-4o-mini'),
+            tz=self.israel_tz
+        )
+        self.budget_compact_chars = int(os.getenv('LLM_BUDGET_COMPACT_CHARS', '600'))
         
         # הוספת handlers
         self._setup_handlers()
@@ -106,31 +231,106 @@ class TelegramSummaryBot:
             self.auto_publish_enabled = True
             logger.info("Auto-publish mode enabled on startup via env variable AUTO_PUBLISH_ON_START=true.")
 
-        # שחזור תזמון ברירת־מחדל אם סופק
+        # שחזור תזמון ברירת־מחדל אם סופק, אחרת התזמון האחרון שנשמר במאגר
         if self.default_schedule_time:
             try:
                 self.set_weekly_schedule(self.default_schedule_time)
                 logger.info(f"Default weekly schedule restored from env. Friday at {self.default_schedule_time} (Israel Time).")
             except Exception as schedule_error:
                 logger.error(f"Failed to restore default schedule from env DEFAULT_SCHEDULE_TIME: {schedule_error}")
+        else:
+            try:
+                stored_schedule = self.storage.load_schedule()
+                if stored_schedule:
+                    self.set_weekly_schedule(stored_schedule)
+                    logger.info(f"Weekly schedule restored from storage. Friday at {stored_schedule} (Israel Time).")
+            except Exception as schedule_error:
+                logger.error(f"Failed to restore weekly schedule from storage: {schedule_error}")
+
+        # שחזור טיוטת הסיכום שהמתינה לאישור לפני ההפעלה מחדש
+        try:
+            draft = self.storage.load_draft()
+            if draft:
+                self.pending_summary = draft['text']
+                self.summary_window_days = draft.get('window_days')
+                self.candidate_queue = list(draft.get('candidates') or [])
+                logger.info(f"Pending summary draft restored from storage ({len(self.candidate_queue)} spare candidates).")
+        except Exception as draft_error:
+            logger.error(f"Failed to restore pending summary draft: {draft_error}")
+
+    def _set_draft(self, summary: Optional[str], window_days: Optional[int] = None,
+                   candidates: Optional[List[str]] = None):
+        """עדכון טיוטת הסיכום הממתינה (והמועמדים החלופיים) ושמירתה במאגר, כך שהיא שורדת הפעלה מחדש."""
+        self.pending_summary = summary
+        self.summary_window_days = window_days
+        self.candidate_queue = list(candidates or [])
+        self._save_draft()
+
+    def _save_draft(self):
+        try:
+            self.storage.save_draft(self.pending_summary, self.summary_window_days, self.candidate_queue)
+        except Exception as e:
+            logger.error(f"Failed to persist pending summary draft: {e}")
+
+    def _cancel_prefetch(self):
+        """ביטול הכנת מועמדים ברקע כשהטיוטה מתחלפת או מתפרסמת - התוצאה כבר לא רלוונטית."""
+        if self._prefetch_task and not self._prefetch_task.done():
+            self._prefetch_task.cancel()
+            logger.info("Cancelled background summary prefetch.")
+        self._prefetch_task = None
+
+    def _maybe_prefetch_candidates(self):
+        """כשהאדמין צופה במועמד האחרון המוכן, מכינים ברקע את הסבב הבא כדי ש"צור סיכום חדש" יהיה מיידי."""
+        if self.summary_candidates <= 1 or self.candidate_queue or not self.pending_summary:
+            return
+        if self._prefetch_task and not self._prefetch_task.done():
+            return
+        self._prefetch_task = asyncio.create_task(self._prefetch_candidates(self.summary_window_days))
+
+    async def _prefetch_candidates(self, window_days: Optional[int]):
+        try:
+            summaries, _ = await self.build_summary(window_days, purpose="prefetch",
+                                                    candidates=self.summary_candidates, fallback=False)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # בלי גיבוי מקומי: לחיצה על "צור סיכום חדש" פשוט תיצור סיכום כרגיל
+            logger.warning(f"Background summary prefetch failed: {e}")
+            return
+        if not self.pending_summary or window_days != self.summary_window_days:
+            logger.info("Discarding prefetched summaries - the draft changed meanwhile.")
+            return
+        self.candidate_queue.extend(summaries)
+        self._save_draft()
+        logger.info(f"Prefetched {len(summaries)} summary candidates in the background.")
 
     def _sanitize_html_for_telegram(self, text: str) -> str:
-        """החלפת תגיות <br> בשבירות שורה שתומכות בטלגרם."""
+        """
+        תיקון ה-HTML לתת-הקבוצה שטלגרם תומך בה: <br> לשבירת שורה, המרת שאריות Markdown,
+        איזון תגיות, הסרת תגיות לא נתמכות ו-escape ל-< ו-& בודדים.
+        """
         if not text:
             return text
-        return BR_TAG_RE.sub("\n", text)
+        return repair_telegram_html(text)
     
     def _setup_handlers(self):
         """הגדרת handlers לבוט"""
+        # הקלטת כל העדכונים הנכנסים (קבוצה -1 רצה לפני כל ה-handlers האחרים)
+        if self.update_recorder:
+            self.application.add_handler(TypeHandler(Update, self.record_update), group=-1)
+
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("generate_summary", self.generate_summary_command))
         self.application.add_handler(CommandHandler("preview", self.preview_command))
+        self.application.add_handler(CommandHandler("quick_summary", self.quick_summary_command))
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
 
         # --- פקודות ניהול חדשות ---
         self.application.add_handler(CommandHandler("schedule_summary", self.schedule_summary_command))
         self.application.add_handler(CommandHandler("show_schedule", self.show_schedule_command))
         self.application.add_handler(CommandHandler("stats", self.show_stats))
+        self.application.add_handler(CommandHandler("search", self.search_command))
+        self.application.add_handler(CommandHandler("usage", self.usage_command))
         # שים לב: הפקודה cancel_schedule_command הוסרה כי היא מטופלת עכשיו בכפתור.
 
         # --- הוספת handler למפסק האוטומטי ---
@@ -161,6 +361,41 @@ class TelegramSummaryBot:
             response_text = f"קיבלתי קובץ.\nה-file_id שלו הוא:\n<code>{file_id}</code>"
             await update.message.reply_text(response_text, parse_mode=ParseMode.HTML)
     
+    async def record_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """שומר את העדכון כשורת JSON, לשידור חוזר עם load_replay.py. הכתיבה לקובץ נעשית ב-thread של המקליט."""
+        try:
+            self.update_recorder.record(update.to_dict())
+        except Exception as e:
+            logger.error(f"Failed to record update: {e}")
+
+    def start_loop_watchdog(self) -> Optional[EventLoopWatchdog]:
+        """הפעלת גלאי התקיעות אם הוגדר LOOP_WATCHDOG_THRESHOLD_MS. חייב לרוץ מתוך ה-event loop."""
+        if not self.loop_watchdog_threshold:
+            return None
+        self.loop_watchdog = EventLoopWatchdog(
+            asyncio.get_running_loop(),
+            threshold=self.loop_watchdog_threshold,
+            on_stall=self._report_loop_stall
+        )
+        self.loop_watchdog.start()
+        return self.loop_watchdog
+
+    async def _report_loop_stall(self, duration: float, stack: str):
+        """שולח לאדמין את ה-stack של הקוד שחסם את ה-event loop (לכל היותר פעם ב-10 דקות)."""
+        if not self.admin_chat_id or time.monotonic() - self._last_stall_alert < 600:
+            return
+        self._last_stall_alert = time.monotonic()
+        # החלק הרלוונטי הוא סוף ה-stack - הפונקציה שחוסמת בפועל
+        stack_tail = stack[-3000:]
+        try:
+            await self.application.bot.send_message(
+                chat_id=self.admin_chat_id,
+                text=f"🐢 ה-event loop נחסם למשך {duration * 1000:.0f}ms.\n<b>Stack:</b>\n<pre>{html.escape(stack_tail)}</pre>",
+                parse_mode=ParseMode.HTML
+            )
+        except Exception as e:
+            logger.error(f"Failed to send loop stall alert to admin: {e}")
+
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
         """רושם שגיאות ושולח הודעת טלגרם לאדמין כאשר מתרחשת שגיאה."""
         logger.error("Exception while handling an update:", exc_info=context.error)
@@ -186,14 +421,14 @@ class TelegramSummaryBot:
             logger.error(f"Failed to send error notification to admin: {e}")
     
     async def handle_new_channel_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """תופס פוסטים חדשים מהערוץ ושומר אותם ל-MongoDB"""
+        """תופס פוסטים חדשים מהערוץ ושומר אותם במאגר"""
         message = update.channel_post
         # בדוק אם יש תוכן טקסטואלי. אם לא, אין מה לשמור.
         post_content = message.text or message.caption
         if not post_content:
             return
 
-        logger.info(f"New post {message.message_id} detected in channel. Saving to MongoDB.")
+        logger.info(f"New post {message.message_id} detected in channel. Saving to storage.")
 
         new_post = {
             'message_id': message.message_id,
@@ -202,14 +437,15 @@ class TelegramSummaryBot:
         }
 
         try:
-            self.posts_collection.insert_one(new_post)
+            await asyncio.to_thread(self._save_post, new_post, False)
+            self.search_index.add(new_post)
             logger.info(f"Post {message.message_id} saved successfully.")
         except Exception as e:
-            logger.error(f"Error saving new post to MongoDB: {e}", exc_info=True)
+            logger.error(f"Error saving new post to storage: {e}", exc_info=True)
     
     async def handle_forwarded_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
-        תופס הודעות המועברות לבוט, בודק אם הן מהערוץ הנכון, ושומר אותן ב-MongoDB.
+        תופס הודעות המועברות לבוט, בודק אם הן מהערוץ הנכון, ושומר אותן במאגר.
         זה מאפשר "מילוי לאחור" (backfill) ידני של פוסטים ישנים.
         """
         reporter.report_activity(update.effective_user.id)
@@ -236,7 +472,7 @@ class TelegramSummaryBot:
         original_message_id = message.forward_origin.message_id
         original_date = message.forward_origin.date
 
-        logger.info(f"Manual backfill: Received forwarded post {original_message_id}. Saving to MongoDB.")
+        logger.info(f"Manual backfill: Received forwarded post {original_message_id}. Saving to storage.")
         
         post_document = {
             'message_id': original_message_id,
@@ -245,19 +481,57 @@ class TelegramSummaryBot:
         }
         
         try:
-            # שימוש ב-update_one עם upsert=True כדי למנוע כפילויות
-            self.posts_collection.update_one(
-                {'message_id': original_message_id},
-                {'$setOnInsert': post_document},
-                upsert=True
-            )
+            # שמירה רק אם הפוסט לא קיים, כדי למנוע כפילויות
+            is_new = await asyncio.to_thread(self._save_post, post_document, True)
+            if is_new:
+                self.search_index.add(post_document)
             logger.info(f"Post {original_message_id} saved/updated successfully via forward.")
             await message.reply_text(f"✅ הפוסט נשמר/עודכן בהצלחה!")
             
         except Exception as e:
-            logger.error(f"Error saving forwarded post to MongoDB: {e}", exc_info=True)
+            logger.error(f"Error saving forwarded post to storage: {e}", exc_info=True)
             await message.reply_text("❌ אירעה שגיאה בשמירת הפוסט.")
     
+    def _save_post(self, post: Dict, forwarded: bool) -> bool:
+        """
+        שמירת פוסט ועדכון מוני הקליטה. רץ ב-thread, כך ששתי הכתיבות למאגר לא מעכבות את ה-event loop.
+        פוסט מועבר נשמר רק אם הוא לא קיים. מחזיר True אם הפוסט נוסף.
+        """
+        if forwarded:
+            is_new = self.storage.upsert_post(post)
+        else:
+            self.storage.insert_post(post)
+            is_new = True
+        self._record_ingest(post, new=is_new, forwarded=forwarded)
+        return is_new
+
+    def _record_ingest(self, post: Dict, new: bool, forwarded: bool):
+        """
+        עדכון מוני הקליטה במסמך הסטטיסטיקה בפעולת $inc אחת: היסטוגרמות לפי יום ושעה (שעון ישראל),
+        סך התווים לחישוב אורך ממוצע, מוני העברות/כפילויות/מילוי לאחור וזמן הקליטה האחרון.
+        """
+        counters = {'ingest.forwards': 1} if forwarded else {}
+        if new:
+            post_date = post['date']
+            if post_date.tzinfo is None:
+                post_date = pytz.UTC.localize(post_date)
+            local_date = post_date.astimezone(self.israel_tz)
+            counters.update({
+                'stored_posts': 1,
+                'ingest.total': 1,
+                'ingest.backfill' if forwarded else 'ingest.channel': 1,
+                'ingest.chars': len(post['text']),
+                f"per_day.{local_date.strftime('%Y-%m-%d')}": 1,
+                f"per_hour.{local_date.strftime('%H')}": 1,
+            })
+        else:
+            counters['ingest.duplicates'] = 1
+        try:
+            self.storage.increment_stats('bot', counters, {'last_ingest_at': datetime.now(pytz.UTC)})
+        except Exception as e:
+            # הסטטיסטיקה לא אמורה להכשיל את שמירת הפוסט
+            logger.error(f"Failed to update ingest stats: {e}")
+
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """פקודת start"""
         reporter.report_activity(update.effective_user.id)
@@ -268,10 +542,13 @@ class TelegramSummaryBot:
 
 <b>פקודות זמינות:</b>
 📊 /generate_summary - יצירת סיכום ידני מיידי.
+⚡ /quick_summary - טיוטת סיכום מיידית ללא AI (מנוע מקומי).
 👀 /preview - תצוגה מקדימה של הסיכום האחרון שנוצר.
 ⏰ /schedule_summary - הגדרת שעת שליחה אוטומטית ביום שישי.
 📋 /show_schedule - הצגת סטטוס התזמון האוטומטי.
 📈 /stats - הצגת סטטיסטיקות על כמות הפוסטים השמורים.
+🔎 /search &lt;מילים&gt; - חיפוש בפוסטים השמורים.
+💰 /usage - צריכת טוקנים ועלות של קריאות ה-AI.
 
 <b>פקודות מתקדמות:</b>
 ⚙️ /toggle_autopublish - הפעלה/כיבוי של מצב פרסום אוטומטי. במצב זה, הסיכום המתוזמן יפורסם ישירות לערוץ ללא צורך באישור ידני (שימושי כשאתה לא זמין).
@@ -279,96 +556,273 @@ class TelegramSummaryBot:
         await update.message.reply_text(welcome_message, parse_mode=ParseMode.HTML)
     
     async def get_channel_posts(self, days_back: int = 7) -> List[Dict]:
-        """קריאת פוסטים מהימים האחרונים מ-MongoDB"""
-        logger.info("--- Starting get_channel_posts (Reading from MongoDB) ---")
+        """קריאת פוסטים מהימים האחרונים מהמאגר"""
+        logger.info(f"--- Starting get_channel_posts (Reading from {self.storage.name}) ---")
         try:
             since_date = datetime.now(pytz.UTC) - timedelta(days=days_back)
             logger.info(f"Searching for posts since (UTC): {since_date.strftime('%Y-%m-%d %H:%M:%S')}")
 
-            # בניית שאילתה ל-MongoDB
-            query = {'date': {'$gte': since_date}}
-            
             # שליפת הפוסטים ומיון מהישן לחדש
-            posts_cursor = self.posts_collection.find(query).sort('date', 1)
-            
-            relevant_posts = list(posts_cursor)
+            relevant_posts = self.storage.posts_between(since_date)
             
-            logger.info(f"Found {len(relevant_posts)} posts from the last {days_back} days in MongoDB.")
+            logger.info(f"Found {len(relevant_posts)} posts from the last {days_back} days in {self.storage.name}.")
             return relevant_posts
             
         except Exception as e:
             logger.error(f"FATAL ERROR in get_channel_posts: {e}", exc_info=True)
             return []
     
-    async def create_summary_with_gpt4(self, posts: List[Dict]) -> str:
-        """יצירת סיכום עם GPT-4 באמצעות התחביר החדש של OpenAI"""
-        if not posts:
-            return "לא נמצאו פוסטים רלוונטיים לסיכום."
-        
-        # הכנת הטקסט לסיכום
-        posts_text = "\n\n".join([f"תאריך: {post['date'].strftime('%Y-%m-%d')}\nתוכן: {post['text']}" for post in posts])
+    async def get_posts_between(self, start: datetime, end: datetime) -> List[Dict]:
+        """קריאת פוסטים בטווח תאריכים [start, end) מהמאגר, מהישן לחדש"""
+        return await asyncio.to_thread(self.storage.posts_between, start, end)
+
+    async def _summarize_rollup(self, level: str, items: List[Dict]) -> str:
+        """יצירת תקציר ביניים (יומי משפוסטים, שבועי/חודשי מתקצירים) עבור מנוע ה-rollups."""
+        if level == LEVEL_DAY:
+            source = "\n".join(
+                f"- {post['text'][:1500]} (קישור: https://t.me/{self.channel_username}/{post['message_id']})"
+                for post in items
+            )
+            instruction = ROLLUP_DAY_INSTRUCTION
+        else:
+            source = "\n\n".join(f"[{item['start']}]\n{item['text']}" for item in items)
+            instruction = ROLLUP_MERGE_INSTRUCTION
+
+        budget_model, _ = self.budget_guard.decide()
+        result = await self.complete_llm(
+            f"rollup:{level}",
+            messages=ROLLUP.messages(f"{instruction}\n\n{source}"),
+            prompt_version=ROLLUP.prompt_id,
+            post_count=len(items) if level == LEVEL_DAY else sum(item['post_count'] for item in items),
+            model=budget_model,
+            max_tokens=1200,
+            temperature=0.3
+        )
+        return result.text
+
+    def _posts_history_start(self) -> Optional[datetime]:
+        """הזמן (UTC) של המחיקה האחרונה של הפוסטים אחרי פרסום, או None אם הם מעולם לא נמחקו."""
+        state = self.storage.get_state(POSTS_CLEARED_KEY)
+        return datetime.fromisoformat(state['at']) if state else None
+
+    def _rollups_in_use(self) -> bool:
+        """האם האדמין ביקש אי פעם סיכום לחלון זמן (ולכן כדאי לשמור תקצירים יומיים לפני מחיקת פוסטים)."""
+        return bool(self.storage.get_state(ROLLUPS_USED_KEY))
+
+    async def _mark_rollups_used(self):
+        if self._rollups_marked:
+            return
+        try:
+            await asyncio.to_thread(self.storage.set_state, ROLLUPS_USED_KEY, {'at': datetime.now(pytz.UTC).isoformat()})
+            self._rollups_marked = True
+        except Exception as e:
+            logger.error(f"Failed to record that window summaries are in use: {e}")
+
+    def _clear_posts_before(self, published_at: datetime) -> int:
+        """מחיקת הפוסטים שלפני published_at ועדכון גבול ההיסטוריה ומונה הפוסטים השמורים. רץ ב-thread."""
+        deleted_count = self.storage.clear_posts(before=published_at)
+        self.storage.set_state(POSTS_CLEARED_KEY, {'at': published_at.isoformat()})
+        self.storage.increment_stats('bot', {}, {'stored_posts': self.storage.count_posts()})
+        return deleted_count
+
+    async def _clear_published_posts(self, published_at: datetime):
+        """
+        מחיקת הפוסטים שפורסמו, ברקע ומחוץ לנעילת הפרסום. אם נעשה שימוש בסיכומי חלון זמן, קודם נשמרים
+        תקצירים יומיים לימים שהסתיימו. פוסטים שנקלטו אחרי הפרסום נשארים לסיכום הבא.
+        """
+        try:
+            if await asyncio.to_thread(self._rollups_in_use):
+                await self._cache_rollups_before_clear()
+        finally:
+            # גם אם שמירת התקצירים נכשלה או בוטלה בכיבוי, הפוסטים שפורסמו לא ייכללו שוב בסיכום הבא
+            try:
+                deleted_count = await asyncio.to_thread(self._clear_posts_before, published_at)
+                self.search_index.remove_before(published_at)
+                logger.info(f"Cleared {deleted_count} published posts from {self.storage.name}.")
+            except Exception as e:
+                logger.error(f"Failed to clear published posts: {e}", exc_info=True)
+
+    async def _cache_rollups_before_clear(self):
+        """שמירת תקצירים יומיים לימים שהסתיימו לפני מחיקת הפוסטים, כדי שסיכומי חלון זמן ימשיכו לכסות אותם."""
+        history_start = self._posts_history_start()
+        since = history_start.astimezone(self.israel_tz).date() if history_start else date.min
+        try:
+            cached_days = await self.rollups.cache_completed_days(since)
+            logger.info(f"Cached daily rollups for {cached_days} days before clearing posts.")
+        except Exception as e:
+            # המחיקה ממשיכה - סיכומי חלון זמן יסומנו כחלקיים עבור הימים האלה
+            logger.error(f"Failed to cache daily rollups before clearing posts: {e}", exc_info=True)
+
+    def _window_gap_notice(self, window_days: Optional[int]) -> str:
+        """אזהרה לאדמין כשחלון הזמן מתחיל לפני מחיקת פוסטים, ולכן ימים שלא נשמר להם תקציר חסרים."""
+        history_start = self._posts_history_start() if window_days else None
+        if not history_start:
+            return ""
+        window_start = self.rollups.today() - timedelta(days=window_days - 1)
+        if history_start.astimezone(self.israel_tz).date() < window_start:
+            return ""
+        return (
+            f"\n\n⚠️ הפוסטים נמחקו מהמאגר ב-{self._format_israel_time(history_start)} (RETAIN_POSTS כבוי). "
+            f"ימים שלפני המועד הזה נכללים רק אם התקציר היומי שלהם נשמר לפני המחיקה, "
+            f"ולכן חלק מהתקופה עשוי להיות חסר. לכיסוי מלא הגדר RETAIN_POSTS=true."
+        )
+
+    async def create_window_summary(self, days: int, purpose: str = "manual", candidates: int = 1,
+                                    fallback: bool = True) -> Tuple[List[str], int]:
+        """
+        יצירת סיכום לחלון של N ימים מתקצירים מדורגים.
+        מחזיר (מועמדים לסיכום, מספר פוסטים). אם בניית התקצירים נכשלת, חוזרים לסיכום מפוסטים גולמיים.
+        """
+        # מעכשיו נשמרים תקצירים יומיים לפני כל מחיקת פוסטים, כדי שחלונות הבאים יכסו גם אותם
+        await self._mark_rollups_used()
+        try:
+            digests = await self.rollups.window_digests(days)
+        except Exception as e:
+            logger.error(f"Failed to build rollups for {days} days, using raw posts instead: {e}", exc_info=True)
+            posts = await self.get_channel_posts(days_back=days)
+            summaries = await self.create_summary_candidates(
+                posts, period_label=f"{days} הימים האחרונים", purpose=f"{purpose}:{days}d",
+                candidates=candidates, fallback=fallback
+            )
+            return summaries, len(posts)
+
+        post_count = sum(digest['post_count'] for digest in digests)
+        partial = [digest['start'] for digest in digests if digest.get('partial')]
+        if partial:
+            logger.warning(f"Window summary for {days} days includes partial rollups: {partial}")
+        # כל תקציר מוצג למודל כ"פוסט" עם תאריך תחילת היחידה
+        digest_posts = [
+            {'date': datetime.fromisoformat(digest['start']), 'text': digest['text']}
+            for digest in digests
+        ]
+        summaries = await self.create_summary_candidates(
+            digest_posts, period_label=f"{days} הימים האחרונים", purpose=f"{purpose}:{days}d", post_count=post_count,
+            candidates=candidates, fallback=fallback
+        )
+        return summaries, post_count
+
+    async def build_summary(self, window_days: Optional[int] = None, purpose: str = "manual",
+                            candidates: int = 1, fallback: bool = True) -> Tuple[List[str], int]:
+        """
+        יצירת סיכום לשבוע האחרון מפוסטים גולמיים, או לחלון זמן אחר מתקצירים מדורגים.
+        מחזיר (מועמדים לסיכום, מספר פוסטים).
+        """
+        if window_days:
+            return await self.create_window_summary(window_days, purpose=purpose, candidates=candidates,
+                                                    fallback=fallback)
+        posts = await self.get_channel_posts()
+        summaries = await self.create_summary_candidates(posts, purpose=purpose, candidates=candidates,
+                                                         fallback=fallback)
+        return summaries, len(posts)
+
+    async def complete_llm(self, purpose: str, messages: List[Dict], post_count: int = 0,
+                           model: Optional[str] = None, prompt_version: Optional[str] = None,
+                           **params) -> LLMResult:
+        """קריאה ל-LLM דרך השכבה העמידה, עם רישום טוקנים, עלות, השהיה וגודל הקלט לכל קריאה."""
+        input_bytes = sum(len(message['content'].encode('utf-8')) for message in messages)
+        started = time.monotonic()
+        try:
+            result = await self.llm_client.complete(messages, model=model, **params)
+        except Exception as e:
+            self.usage_tracker.record(
+                purpose, model or self.llm_client.model, time.monotonic() - started,
+                post_count=post_count, input_bytes=input_bytes, success=False, error=str(e)[:500],
+                prompt_version=prompt_version
+            )
+            raise
+
+        self.usage_tracker.record(
+            purpose, result.model, time.monotonic() - started,
+            post_count=post_count, input_bytes=input_bytes,
+            prompt_tokens=result.prompt_tokens, completion_tokens=result.completion_tokens,
+            cached_tokens=result.cached_tokens, attempts=result.attempts, hedged=result.hedged,
+            prompt_version=prompt_version
+        )
+        # ההוצאה השתנתה - שומר התקציב קורא אותה מחדש בהחלטה הבאה במקום לחכות לסוף המטמון
+        self.budget_guard.invalidate()
+        return result
+
+    def _build_summary_messages(self, posts: List[Dict], period_label: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """הודעות פרומפט הסיכום, והמודל החלופי אם שומר התקציב החליט לעבור למודל זול."""
+        # שומר התקציב: מעל הסף החודשי עוברים למודל זול יותר ומקצרים כל פוסט בפרומפט
+        budget_model, compact = self.budget_guard.decide()
+        def post_body(post):
+            text = post['text']
+            return text[:self.budget_compact_chars] if compact else text
         
-        prompt = f"""
-אתה כותב סיכום שבועי לערוץ טלגרם שמתמקד באנדרואיד ובינה מלאכותית.
-
-הפוסטים של השבוע מצורפים בהמשך. 
-המטרה שלך היא לכתוב סיכום בסגנון קליל, סוחף ומעניין – לא רשמי מדי, אבל גם לא יבש. תשתמש באימוג'ים, משפטים זורמים, פתיחה חמה וסיום שמזמין לעקוב גם לשבוע הבא.
-
-חשוב:
-- כל פסקה צריכה להתחיל באימוג'י + <b>שם הנושא</b>
-- תן לכל נושא תיאור ברור ומעניין
-- אל תכניס כותרות כמו "סטטיסטיקות" או "תובנות"
-- אל תשתמש ב-tldr
-- אל תכתוב כמו רובוט
-- כל פוסט צריך לקבל סיכום נפרד - אל תחבר 2 פוסטים יחד באותה פסקה
-- אל תכתוב שורה כללית על "חידושים טכנולוגיים מרהיבים" או דומה - היכנס ישר לעניין
-
-🚨 **הנחיות קריטיות לפורמט (חובה לפעול לפיהן):**
-1. **פורמט טכני:** הבוט משתמש ב-HTML.
-   - **אסור** להשתמש בסימני Markdown כמו `**` או `[]()`.
-   - להדגשת כותרות השתמש בתגית: <b>כותרת</b>.
-   - ליצירת קישורים השתמש אך ורק בתגית: <a href="URL">טקסט הקישור</a>.
-
-2. **מבנה כל פסקה:**
-   [אימוג'י] <b>שם הנושא</b>
-   הסבר קצר, קליל ומעניין על מה מדובר.
-   [מעבר שורה (לא שורה ריקה, רק "אנטר" אחד] 
-   משפט הנעה לפעולה עם הקישור בתוכו (למשל: "כל הפרטים ב-GenSpark Review" כאשר השם הוא הקישור הלחיץ).
-
-פורמט הסיכום:
-<b>אז מה היה לנו השבוע? 🔥</b>
-
-[כאן יבוא הסיכום - עם אימוג'י בתחילת כל פסקה]
-
-מוזמנים לעקוב גם בשבוע הבא 🙌
-
-להלן הפוסטים שיש לסכם:
-{posts_text}
-"""
+        # הכנת הטקסט לסיכום - זה החלק היחיד בפרומפט שמשתנה בין קריאות
+        posts_text = "\n\n".join([f"תאריך: {post['date'].strftime('%Y-%m-%d')}\nתוכן: {post_body(post)}" for post in posts])
+        return WEEKLY_SUMMARY.messages(weekly_summary_suffix(posts_text, period_label)), budget_model
+
+    async def create_summary_candidates(self, posts: List[Dict], period_label: Optional[str] = None,
+                                        purpose: str = "manual", post_count: Optional[int] = None,
+                                        candidates: int = 1, fallback: bool = True) -> List[str]:
+        """
+        יצירת סיכום אחד או יותר עם GPT-4. כמה מועמדים נוצרים בבקשה אחת (n>1) או בבקשות מקבילות,
+        לפי SUMMARY_CANDIDATES_MODE. אם הקריאה נכשלת מוחזר סיכום מהמנוע המקומי, אלא אם fallback=False.
+        המנוע שהפיק את הסיכום נשמר ב-last_summary_engine.
+        """
+        self.last_summary_engine = LLM_SUMMARY_ENGINE
+        if not posts:
+            return ["לא נמצאו פוסטים רלוונטיים לסיכום."]
+
+        messages, budget_model = self._build_summary_messages(posts, period_label)
+
+        async def request(n: int) -> LLMResult:
+            # הקריאה עוברת דרך שכבת ה-LLM העמידה (deadline, retries, hedging, circuit breaker)
+            params = {'n': n} if n > 1 else {}
+            return await self.complete_llm(
+                purpose,
+                messages=messages,
+                prompt_version=WEEKLY_SUMMARY.prompt_id,
+                post_count=len(posts) if post_count is None else post_count,
+                model=budget_model,
+                max_tokens=4000,  # הגדלת מגבלת התווים ל-4000 עבור סיכומים מפורטים יותר
+                temperature=0.7,
+                **params
+            )
         
         try:
-            logger.info("Sending request to OpenAI API...")
-            # שימוש בתחביר החדש
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4-turbo",  # שימוש במודל המעודכן
-                messages=[
-                    {"role": "system", "content": "אתה מומחה לטכנולוגיה ו-AI שכותב סיכומים שבועיים בעברית לערוץ טלגרם."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=4000,  # הגדלת מגבלת התווים ל-4000 עבור סיכומים מפורטים יותר
-                temperature=0.7
+            logger.info(f"Sending request to OpenAI API for {candidates} candidate(s)...")
+            if candidates > 1 and self.summary_candidates_mode == 'parallel':
+                outcomes = await asyncio.gather(*[request(1) for _ in range(candidates)], return_exceptions=True)
+                results = [outcome for outcome in outcomes if isinstance(outcome, LLMResult)]
+                if not results:
+                    raise outcomes[0]
+            else:
+                results = [await request(candidates)]
+
+            summaries = [self._sanitize_html_for_telegram(text) for result in results for text in result.texts if text]
+            if not summaries:
+                raise ValueError("OpenAI returned an empty summary")
+            result = results[0]
+            logger.info(
+                f"Successfully received {len(summaries)} summary candidate(s) from {result.model} in {result.latency:.1f}s "
+                f"(attempts: {result.attempts}, hedged: {result.hedged}, "
+                f"cached prompt tokens: {result.cached_tokens}/{result.prompt_tokens})."
             )
-            
-            summary = response.choices[0].message.content.strip()
-            summary = self._sanitize_html_for_telegram(summary)
-            logger.info("Successfully received summary from OpenAI.")
-            return summary
+            return summaries
             
         except Exception as e:
             logger.error(f"Error creating summary with OpenAI: {e}", exc_info=True)
+            if not fallback:
+                raise
+            if self.fallback_summarizer:
+                logger.warning(f"Using local '{self.fallback_summarizer.name}' summarizer as fallback.")
+                self.last_summary_engine = self.fallback_summarizer.name
+                return [self.fallback_summarizer.summarize(posts)]
             # החזרת הודעת השגיאה המקורית כדי שנדע מה קרה
-            return f"שגיאה ביצירת הסיכום: \n\n{e}"
+            return [f"שגיאה ביצירת הסיכום: \n\n{html.escape(str(e))}"]
     
+    def _engine_notice(self) -> str:
+        """הערה לאדמין כשהסיכום האחרון הופק במנוע המקומי ולא ב-OpenAI."""
+        if self.last_summary_engine == LLM_SUMMARY_ENGINE:
+            return ""
+        return (
+            f"\n\n⚠️ OpenAI לא היה זמין, ולכן הסיכום הופק במנוע המקומי ({self.last_summary_engine}) "
+            f"ולא ב-GPT."
+        )
+
     async def generate_summary_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """פקודה ליצירת סיכום ידני"""
         reporter.report_activity(update.effective_user.id)
@@ -376,14 +830,25 @@ class TelegramSummaryBot:
             await update.message.reply_text("אין לך הרשאה להשתמש בפקודה זו")
             return
         
+        # חלון זמן אופציונלי: /generate_summary 3d|14d|2w|month
+        window_days = None
+        if context.args:
+            try:
+                window_days = parse_window(context.args[0])
+            except ValueError:
+                await update.message.reply_text("חלון זמן לא תקין. דוגמאות: /generate_summary 3d | 14d | 2w | month")
+                return
+
         await update.message.reply_text("יוצר סיכום... ⏳")
+        self._cancel_prefetch()
         
-        # קריאת פוסטים ויצירת סיכום
-        posts = await self.get_channel_posts()
-        summary = await self.create_summary_with_gpt4(posts)
+        # קריאת פוסטים ויצירת סיכום (ומועמדים חלופיים אם הוגדר SUMMARY_CANDIDATES)
+        summaries, post_count = await self.build_summary(window_days, candidates=self.summary_candidates)
         
-        # שמירת הסיכום למשתנה
-        self.pending_summary = summary
+        # שמירת הסיכום כטיוטה ממתינה
+        self._set_draft(summaries[0], window_days, summaries[1:])
+        self._maybe_prefetch_candidates()
+        period_text = f"מ-{window_days} הימים האחרונים" if window_days else "מהשבוע האחרון"
         
         # יצירת כפתורים לתצוגה מקדימה
         keyboard = InlineKeyboardMarkup([
@@ -395,7 +860,35 @@ class TelegramSummaryBot:
         ])
         
         await update.message.reply_text(
-            f"הסיכום נוצר בהצלחה! ✅\nנמצאו {len(posts)} פוסטים מהשבוע האחרון.\n\nמה תרצה לעשות?",
+            f"הסיכום נוצר בהצלחה! ✅\nנמצאו {post_count} פוסטים {period_text}."
+            f"{self._engine_notice()}{self._window_gap_notice(window_days)}\n\nמה תרצה לעשות?",
+            reply_markup=keyboard
+        )
+    
+    async def quick_summary_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """פקודה ליצירת טיוטת סיכום מיידית עם המנוע המקומי (ללא קריאה ל-OpenAI)"""
+        reporter.report_activity(update.effective_user.id)
+        if str(update.effective_user.id) != self.admin_chat_id:
+            await update.message.reply_text("אין לך הרשאה להשתמש בפקודה זו")
+            return
+
+        self._cancel_prefetch()
+        posts = await self.get_channel_posts()
+        started = time.perf_counter()
+        self._set_draft(self.draft_summarizer.summarize(posts))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Local draft summary created in {elapsed_ms:.1f}ms from {len(posts)} posts.")
+
+        keyboard = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton("👀 תצוגה מקדימה", callback_data="preview"),
+                InlineKeyboardButton("📢 פרסם עכשיו", callback_data="publish")
+            ],
+            [InlineKeyboardButton("🔄 צור סיכום עם AI", callback_data="regenerate")]
+        ])
+
+        await update.message.reply_text(
+            f"טיוטה מקומית נוצרה תוך {elapsed_ms:.0f}ms ⚡\nנמצאו {len(posts)} פוסטים מהשבוע האחרון.\n\nמה תרצה לעשות?",
             reply_markup=keyboard
         )
     
@@ -453,8 +946,17 @@ class TelegramSummaryBot:
             await query.edit_message_text(f"✅ הסיכום תזומן בהצלחה ליום שישי בשעה {time_str} (שעון ישראל).")
             return
 
+        if data.startswith("search_page:"):
+            page = int(data.split(":")[1])
+            text, keyboard = self._render_search_page(self.last_search_query, page)
+            await query.edit_message_text(text, reply_markup=keyboard, parse_mode=ParseMode.HTML,
+                                          disable_web_page_preview=True)
+            return
+
         if data == "schedule_cancel_existing":
             schedule.clear('weekly-summary')
+            schedule.clear('weekly-batch')
+            self.storage.save_schedule(None)
             logger.info("Weekly summary schedule has been cancelled by the admin via button.")
             await query.edit_message_text("✅ התזמון האוטומטי בוטל.")
             return
@@ -491,16 +993,41 @@ class TelegramSummaryBot:
                 success = await self.publish_summary()
                 if success:
                     await query.message.reply_text("הסיכום פורסם בהצלחה! ✅")
-                    self.pending_summary = None
+                    self._cancel_prefetch()
+                    self._set_draft(None)
                 else:
                     await query.message.reply_text("שגיאה בפרסום הסיכום ❌")
             else:
                 await query.message.reply_text("אין סיכום לפרסום")
         
         elif query.data == "regenerate":
-            await query.message.reply_text("יוצר סיכום חדש... ⏳")
-            posts = await self.get_channel_posts()
-            self.pending_summary = await self.create_summary_with_gpt4(posts)
+            # אם הסבב הבא כבר בהכנה ברקע, עדיף לחכות לו מאשר לשלוח בקשה נוספת
+            if not self.candidate_queue and self._prefetch_task and not self._prefetch_task.done():
+                await query.message.reply_text("סיכומים חדשים כבר בהכנה, עוד רגע... ⏳")
+                prefetch = self._prefetch_task
+                try:
+                    await asyncio.shield(prefetch)
+                except asyncio.CancelledError:
+                    # ההכנה ברקע בוטלה (למשל כי הטיוטה התחלפה) - ממשיכים ליצירה רגילה.
+                    # ביטול של ה-handler עצמו עובר הלאה
+                    if not prefetch.cancelled():
+                        raise
+                except Exception:
+                    pass
+
+            if self.candidate_queue:
+                # מועמד מוכן - מעבר מיידי בלי קריאה ל-API
+                summary, remaining = self.candidate_queue[0], self.candidate_queue[1:]
+                self._set_draft(summary, self.summary_window_days, remaining)
+                status_text = f"סיכום חלופי מוכן! ✅ (נותרו עוד {len(remaining)} מוכנים)"
+            else:
+                await query.message.reply_text("יוצר סיכום חדש... ⏳")
+                # יצירה מחדש לאותו חלון זמן. בחלון מדורג רק הקריאה המסכמת רצה שוב - התקצירים שמורים
+                summaries, _ = await self.build_summary(self.summary_window_days, purpose="regenerate",
+                                                        candidates=self.summary_candidates)
+                self._set_draft(summaries[0], self.summary_window_days, summaries[1:])
+                status_text = f"סיכום חדש נוצר! ✅{self._engine_notice()}"
+            self._maybe_prefetch_candidates()
             
             keyboard = InlineKeyboardMarkup([
                 [
@@ -510,7 +1037,7 @@ class TelegramSummaryBot:
             ])
             
             await query.message.reply_text(
-                "סיכום חדש נוצר! ✅",
+                status_text,
                 reply_markup=keyboard
             )
     
@@ -548,14 +1075,22 @@ class TelegramSummaryBot:
                 logger.info("Sending summary text to the channel...")
                 await self.application.bot.send_message(
                     chat_id=f"@{self.channel_username}",
-                    text=self.pending_summary,
+                    text=self._sanitize_html_for_telegram(self.pending_summary),
                     parse_mode=ParseMode.HTML
                 )
 
-                # שלב 3: ניקוי הפוסטים מהמאגר (הקוד הקיים שלך)
-                logger.info("Summary published successfully. Clearing posts from the database...")
-                delete_result = self.posts_collection.delete_many({})
-                logger.info(f"Cleared {delete_result.deleted_count} posts from the collection.")
+                # שלב 3: ניקוי הפוסטים מהמאגר (הקוד הקיים שלך), אלא אם הוגדרה שמירה שלהם
+                if self.retain_posts:
+                    logger.info("Summary published successfully. RETAIN_POSTS is on - keeping posts in the database.")
+                else:
+                    logger.info("Summary published successfully. Clearing published posts in the background...")
+                    self._post_publish_task = asyncio.create_task(self._clear_published_posts(datetime.now(pytz.UTC)))
+
+                try:
+                    self.storage.increment_stats('bot', {'summaries_published': 1},
+                                                 {'last_published_at': datetime.now(pytz.UTC)})
+                except Exception as stats_error:
+                    logger.error(f"Failed to update publish stats: {stats_error}")
 
                 # --- תוספת קריטית: איפוס ותזמון מחדש ---
                 jobs = schedule.get_jobs('weekly-summary')
@@ -598,6 +1133,7 @@ class TelegramSummaryBot:
 
         async with self.scheduled_job_lock:
             try:
+                self._cancel_prefetch()
                 posts = await self.get_channel_posts()
                 if not posts:
                     logger.info("No new posts found for scheduled summary. Aborting.")
@@ -607,8 +1143,17 @@ class TelegramSummaryBot:
                     )
                     return
 
-                summary = await self.create_summary_with_gpt4(posts)
-                self.pending_summary = summary
+                # תוצאת batch שנשלח מראש, ואם היא לא מוכנה - הנתיב הרגיל
+                summaries = await self._take_batch_summaries()
+                if summaries:
+                    self.last_summary_engine = LLM_SUMMARY_ENGINE
+                else:
+                    # בפרסום אוטומטי אין מי שיבחר בין מועמדים - מספיק סיכום אחד
+                    candidates = 1 if self.auto_publish_enabled else self.summary_candidates
+                    summaries = await self.create_summary_candidates(posts, purpose="scheduled", candidates=candidates)
+                engine_notice = self._engine_notice()
+                summary = summaries[0]
+                self._set_draft(summary, candidates=summaries[1:])
 
                 # --- לוגיקת המפסק ---
                 if self.auto_publish_enabled:
@@ -617,7 +1162,7 @@ class TelegramSummaryBot:
                     if success:
                         await self.application.bot.send_message(
                             chat_id=self.admin_chat_id,
-                            text="✅ הסיכום השבועי פורסם אוטומטית בהצלחה!"
+                            text=f"✅ הסיכום השבועי פורסם אוטומטית בהצלחה!{engine_notice}"
                         )
                         # כבה את המצב האוטומטי חזרה לברירת המחדל הבטוחה
                         self.auto_publish_enabled = False
@@ -637,7 +1182,7 @@ class TelegramSummaryBot:
                             await self.application.bot.send_photo(
                                 chat_id=self.admin_chat_id,
                                 photo=image_file_id,
-                                caption=f"סיכום שבועי אוטומטי מוכן! 📊\n\nתצוגה מקדימה:\n\n{summary}",
+                                caption=f"סיכום שבועי אוטומטי מוכן! 📊{engine_notice}\n\nתצוגה מקדימה:\n\n{summary}",
                                 reply_markup=keyboard,
                                 parse_mode=ParseMode.HTML
                             )
@@ -646,14 +1191,14 @@ class TelegramSummaryBot:
                             # אם נכשלה שליחת התמונה, נשלח רק טקסט
                             await self.application.bot.send_message(
                                 chat_id=self.admin_chat_id,
-                                text=f"סיכום שבועי אוטומטי מוכן! 📊\n\nתצוגה מקדימה:\n\n{summary}",
+                                text=f"סיכום שבועי אוטומטי מוכן! 📊{engine_notice}\n\nתצוגה מקדימה:\n\n{summary}",
                                 reply_markup=keyboard,
                                 parse_mode=ParseMode.HTML
                             )
                     else:
                         await self.application.bot.send_message(
                             chat_id=self.admin_chat_id,
-                            text=f"סיכום שבועי אוטומטי מוכן! 📊\n\nתצוגה מקדימה:\n\n{summary}",
+                            text=f"סיכום שבועי אוטומטי מוכן! 📊{engine_notice}\n\nתצוגה מקדימה:\n\n{summary}",
                             reply_markup=keyboard,
                             parse_mode=ParseMode.HTML
                         )
@@ -667,7 +1212,7 @@ class TelegramSummaryBot:
             finally:
                 # אל תנקה את pending_summary כאן, כי במצב ידני הוא נחוץ ללחיצת הכפתור
                 if self.auto_publish_enabled:  # נקה רק אם היינו במצב אוטומטי
-                    self.pending_summary = None
+                    self._set_draft(None)
     
     async def schedule_summary_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """מציג לאדמין כפתורים לבחירת שעת התזמון."""
@@ -713,7 +1258,10 @@ class TelegramSummaryBot:
             friendly_text = f"📊 <b>קיים תזמון אוטומטי פעיל</b>\n\n"
             friendly_text += f"🔹 <b>תדירות:</b> כל שבוע\n"
             friendly_text += f"🔹 <b>יום:</b> {day_info}\n"
-            friendly_text += f"🔹 <b>שעה (שעון ישראל):</b> {time_info}\n\n"
+            friendly_text += f"🔹 <b>שעה (שעון ישראל):</b> {time_info}\n"
+            if self.batch_lead_hours:
+                friendly_text += f"🔹 <b>מצב batch:</b> הסיכום נשלח ליצירה {self.batch_lead_hours:g} שעות מראש\n"
+            friendly_text += "\n"
             
             # חישוב זמן מאובטח מפני שגיאות timezone
             try:
@@ -738,6 +1286,12 @@ class TelegramSummaryBot:
         else:
             await update.message.reply_text("❌ לא קיים תזמון אוטומטי פעיל.")
 
+    def _format_israel_time(self, value: datetime) -> str:
+        # תאריכים מ-MongoDB חוזרים ללא אזור זמן (UTC)
+        if value.tzinfo is None:
+            value = pytz.UTC.localize(value)
+        return value.astimezone(self.israel_tz).strftime('%d/%m/%Y %H:%M')
+
     async def show_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """שולח לאדמין סטטיסטיקות על הבוט, כמו מספר הפוסטים השמורים."""
         reporter.report_activity(update.effective_user.id)
@@ -749,14 +1303,48 @@ class TelegramSummaryBot:
             return
 
         try:
-            # ביצוע שאילתת ספירה של כל המסמכים בקולקציה
-            post_count = self.posts_collection.count_documents({})
+            # קריאה של מסמך סטטיסטיקה אחד שמתעדכן בכל קליטה, במקום ספירה על כל הקולקציה
+            bot_stats = self.storage.get_stats('bot')
+            ingest = bot_stats.get('ingest', {})
             
             # הרכבת הודעת התשובה
             response_text = (
                 f"📊 <b>סטטיסטיקות הבוט</b> 📊\n\n"
-                f"נכון לעכשיו, שמורים במאגר הנתונים <b>{post_count}</b> פוסטים."
+                f"נכון לעכשיו, שמורים במאגר הנתונים <b>{bot_stats.get('stored_posts', 0)}</b> פוסטים."
             )
+            if ingest.get('total'):
+                response_text += (
+                    f"\n\n📥 <b>קליטה:</b>\n"
+                    f"🔹 פוסטים שנקלטו: {ingest['total']} (מהערוץ: {ingest.get('channel', 0)}, "
+                    f"מילוי לאחור: {ingest.get('backfill', 0)})\n"
+                    f"🔹 הודעות מועברות: {ingest.get('forwards', 0)} (כפולות: {ingest.get('duplicates', 0)})\n"
+                    f"🔹 אורך פוסט ממוצע: {ingest.get('chars', 0) / ingest['total']:.0f} תווים\n"
+                    f"🔹 קליטה אחרונה: {self._format_israel_time(bot_stats['last_ingest_at'])}"
+                )
+
+                # היסטוגרמה של 7 הימים האחרונים
+                per_day = bot_stats.get('per_day', {})
+                today = datetime.now(self.israel_tz).date()
+                days = [today - timedelta(days=offset) for offset in range(6, -1, -1)]
+                counts = [per_day.get(day.strftime('%Y-%m-%d'), 0) for day in days]
+                peak = max(counts) or 1
+                day_letters = ['ב', 'ג', 'ד', 'ה', 'ו', 'ש', 'א']  # לפי weekday(): שני עד ראשון
+                rows = [
+                    f"{day_letters[day.weekday()]} {day.strftime('%d/%m')} {'▇' * round(10 * count / peak):<10} {count}"
+                    for day, count in zip(days, counts)
+                ]
+                response_text += f"\n\n📅 <b>7 הימים האחרונים:</b>\n<pre>{chr(10).join(rows)}</pre>"
+
+                per_hour = bot_stats.get('per_hour', {})
+                if per_hour:
+                    top_hours = sorted(per_hour.items(), key=lambda item: item[1], reverse=True)[:3]
+                    response_text += "\n🕐 <b>שעות שיא:</b> " + ", ".join(f"{hour}:00 ({count})" for hour, count in top_hours)
+
+            if bot_stats.get('summaries_published'):
+                response_text += (
+                    f"\n\nסיכומים שפורסמו: <b>{bot_stats['summaries_published']}</b> "
+                    f"(אחרון: {self._format_israel_time(bot_stats['last_published_at'])})."
+                )
             
             await update.message.reply_text(response_text, parse_mode=ParseMode.HTML)
             
@@ -764,6 +1352,88 @@ class TelegramSummaryBot:
             logger.error(f"Failed to retrieve stats from database: {e}", exc_info=True)
             await update.message.reply_text("שגיאה בקבלת הסטטיסטיקות ממאגר הנתונים.")
 
+    def _render_search_page(self, search_query: str, page: int):
+        """בניית עמוד תוצאות חיפוש (טקסט HTML + כפתורי דפדוף)."""
+        if not search_query:
+            return "אין חיפוש פעיל. שלח /search ואחריו מילות חיפוש.", None
+
+        total, results = self.search_index.search(search_query, limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE)
+        if not total:
+            return f"🔎 לא נמצאו פוסטים עבור: <b>{html.escape(search_query)}</b>", None
+
+        pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+        lines = [f"🔎 <b>{total}</b> תוצאות עבור: <b>{html.escape(search_query)}</b> (עמוד {page + 1}/{pages})\n"]
+        for position, post in enumerate(results, start=page * SEARCH_PAGE_SIZE + 1):
+            date_str = post['date'].astimezone(self.israel_tz).strftime('%d/%m/%Y') if post['date'] else "?"
+            snippet = " ".join(post['text'].split())
+            if len(snippet) > 120:
+                snippet = snippet[:120].rsplit(" ", 1)[0] + "…"
+            link = f"https://t.me/{self.channel_username}/{post['message_id']}"
+            lines.append(f"{position}. 📅 {date_str} - {html.escape(snippet)}\n<a href=\"{link}\">לפוסט</a>")
+
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("⬅️ הקודם", callback_data=f"search_page:{page - 1}"))
+        if page + 1 < pages:
+            buttons.append(InlineKeyboardButton("הבא ➡️", callback_data=f"search_page:{page + 1}"))
+        keyboard = InlineKeyboardMarkup([buttons]) if buttons else None
+        return "\n\n".join(lines), keyboard
+
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """חיפוש טקסט מלא בפוסטים השמורים, עם דירוג ודפדוף."""
+        reporter.report_activity(update.effective_user.id)
+        if str(update.effective_user.id) != self.admin_chat_id:
+            await update.message.reply_text("אין לך הרשאה להשתמש בפקודה זו.")
+            return
+
+        if not context.args:
+            await update.message.reply_text("שימוש: /search <מילות חיפוש>")
+            return
+
+        self.last_search_query = " ".join(context.args)
+        text, keyboard = self._render_search_page(self.last_search_query, 0)
+        await update.message.reply_text(text, reply_markup=keyboard, parse_mode=ParseMode.HTML,
+                                        disable_web_page_preview=True)
+
+    async def usage_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """דוח צריכת טוקנים ועלות של קריאות ה-LLM לשבוע ולחודש האחרונים."""
+        reporter.report_activity(update.effective_user.id)
+        if str(update.effective_user.id) != self.admin_chat_id:
+            await update.message.reply_text("אין לך הרשאה להשתמש בפקודה זו.")
+            return
+
+        try:
+            starts = period_starts()
+            lines = ["💰 <b>צריכת AI</b>\n"]
+            for period, title in (('week', "7 הימים האחרונים"), ('month', "30 הימים האחרונים")):
+                usage = self.usage_tracker.summarize_since(starts[period])
+                lines.append(
+                    f"<b>{title}:</b>\n"
+                    f"🔹 קריאות: {usage['calls']} (נכשלו: {usage['failed']})\n"
+                    f"🔹 טוקנים: {usage['prompt_tokens']:,} קלט ({usage['cached_tokens']:,} ממטמון) / {usage['completion_tokens']:,} פלט\n"
+                    f"🔹 עלות משוערת: ${usage['cost_usd']:.2f}\n"
+                    f"🔹 זמן תגובה ממוצע: {usage['avg_latency']:.1f} שניות\n"
+                    f"🔹 פוסטים שסוכמו: {usage['posts']} ({usage['input_bytes'] / 1024:.0f}KB קלט)"
+                )
+                if period == 'month' and usage['by_purpose']:
+                    breakdown = sorted(usage['by_purpose'].items(), key=lambda item: item[1]['cost_usd'], reverse=True)
+                    lines.append("<b>לפי סוג:</b>\n" + "\n".join(
+                        f"▫️ {html.escape(purpose)}: {stats['calls']} קריאות, ${stats['cost_usd']:.2f}"
+                        for purpose, stats in breakdown
+                    ))
+
+            if self.budget_guard.monthly_budget:
+                spend = self.budget_guard.month_spend()
+                status = "🔴 חריגה - מודל זול ופרומפט מכווץ" if spend >= self.budget_guard.monthly_budget else "🟢 בתקציב"
+                lines.append(
+                    f"<b>תקציב חודשי:</b> ${spend:.2f} / ${self.budget_guard.monthly_budget:.2f} ({status})"
+                )
+
+            await update.message.reply_text("\n\n".join(lines), parse_mode=ParseMode.HTML)
+        except Exception as e:
+            logger.error(f"Failed to build usage report: {e}", exc_info=True)
+            await update.message.reply_text("שגיאה בהפקת דוח הצריכה.")
+
     async def toggle_autopublish_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """פקודה להפעלה/כיבוי של מצב פרסום אוטומטי."""
         reporter.report_activity(update.effective_user.id)
@@ -801,27 +1471,180 @@ class TelegramSummaryBot:
             self.run_async_job, 
             self.scheduled_summary
         ).tag('weekly-summary')
+        self.storage.save_schedule(time_str)
         
         logger.info(f"Weekly summary has been set for Friday at {time_str} (Israel Time).")
+
+        # שליחת משימת ה-batch כמה שעות לפני מועד הפרסום
+        schedule.clear('weekly-batch')
+        if self.batch_lead_hours:
+            hour, minute = map(int, time_str.split(':'))
+            # 5.1.2024 הוא יום שישי - משמש רק לחישוב היום והשעה שלפני המועד
+            submit_at = datetime(2024, 1, 5, hour, minute) - timedelta(hours=self.batch_lead_hours)
+            submit_day = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'][submit_at.weekday()]
+            getattr(schedule.every(), submit_day).at(submit_at.strftime('%H:%M'), self.israel_tz).do(
+                self.run_async_job,
+                self.submit_summary_batch
+            ).tag('weekly-batch')
+            logger.info(f"Summary batch will be submitted on {submit_day} at {submit_at.strftime('%H:%M')} (Israel Time).")
+
+    async def submit_summary_batch(self):
+        """שליחת הסיכום המתוזמן כמשימת batch, כדי שתוצאה זולה תהיה מוכנה כשמגיע מועד הפרסום."""
+        logger.info("--- Summary batch submission started ---")
+        try:
+            posts = await self.get_channel_posts()
+            if not posts:
+                logger.info("No posts found for the summary batch. The scheduled run will handle it.")
+                return
+
+            messages, budget_model = self._build_summary_messages(posts)
+            candidates = 1 if self.auto_publish_enabled else self.summary_candidates
+            body = {
+                'model': budget_model or self.llm_client.model,
+                'messages': messages,
+                'max_tokens': 4000,
+                'temperature': 0.7,
+            }
+            if candidates > 1:
+                body['n'] = candidates
+
+            batch_id = await asyncio.to_thread(
+                self.batch_provider.submit, [{'custom_id': 'weekly-summary', 'body': body}]
+            )
+            self.storage.set_state(BATCH_STATE_KEY, {
+                'batch_id': batch_id,
+                'status': STATE_PENDING,
+                'submitted_at': datetime.now(pytz.UTC).isoformat(),
+                'model': body['model'],
+                'prompt_version': WEEKLY_SUMMARY.prompt_id,
+                'post_count': len(posts),
+                'input_bytes': sum(len(message['content'].encode('utf-8')) for message in messages),
+            })
+            logger.info(f"Submitted summary batch {batch_id} with {len(posts)} posts ({candidates} candidate(s)).")
+            self._start_batch_polling()
+        except Exception as e:
+            # הנתיב הרגיל במועד הפרסום עדיין יעבוד - רק מדווחים
+            logger.error(f"Failed to submit summary batch: {e}", exc_info=True)
+
+    def _start_batch_polling(self):
+        if self._batch_poll_task and not self._batch_poll_task.done():
+            return
+        self._batch_poll_task = asyncio.create_task(self._poll_summary_batch())
+
+    async def _poll_summary_batch(self):
+        """בדיקה מחזורית של משימת ה-batch עד שהיא מסתיימת. התוצאה נשמרת במאגר עד מועד הפרסום."""
+        while True:
+            job = self.storage.get_state(BATCH_STATE_KEY)
+            if not job or job['status'] != STATE_PENDING:
+                return
+            try:
+                status = await asyncio.to_thread(self.batch_provider.poll, job['batch_id'])
+            except Exception as e:
+                logger.warning(f"Failed to poll summary batch {job['batch_id']}: {e}")
+                status = None
+
+            if status and status.state != STATE_PENDING:
+                # ייתכן שמועד הפרסום הגיע בזמן הבדיקה והמשימה כבר נוקתה
+                current = self.storage.get_state(BATCH_STATE_KEY)
+                if not current or current['batch_id'] != job['batch_id']:
+                    return
+                current['status'] = status.state
+                if status.state == STATE_COMPLETED:
+                    result = status.results['weekly-summary']
+                    current.update(self._batch_result_fields(result))
+                    logger.info(f"Summary batch {job['batch_id']} completed with {len(result.texts)} candidate(s).")
+                else:
+                    current['error'] = status.error
+                    logger.warning(f"Summary batch {job['batch_id']} failed: {status.error}")
+                self.storage.set_state(BATCH_STATE_KEY, current)
+                return
+
+            await asyncio.sleep(self.batch_poll_interval)
+
+    @staticmethod
+    def _batch_result_fields(result: LLMResult) -> Dict:
+        return {
+            'texts': result.texts,
+            'result_model': result.model,
+            'prompt_tokens': result.prompt_tokens,
+            'completion_tokens': result.completion_tokens,
+            'cached_tokens': result.cached_tokens,
+        }
+
+    async def _take_batch_summaries(self) -> Optional[List[str]]:
+        """
+        במועד הפרסום: החזרת הסיכומים ממשימת ה-batch אם היא הסתיימה בזמן.
+        משימה שעדיין רצה מבוטלת (כדי לא לשלם פעמיים) ומוחזר None - והסיכום נוצר בנתיב הרגיל.
+        """
+        job = self.storage.get_state(BATCH_STATE_KEY)
+        if not job:
+            return None
+        self.storage.set_state(BATCH_STATE_KEY, None)
+        if self._batch_poll_task and not self._batch_poll_task.done():
+            self._batch_poll_task.cancel()
+
+        # תוצאה ישנה (למשל ממועד שהוחמץ כשהבוט היה כבוי) לא מתאימה לסיכום של השבוע הזה
+        submitted_at = datetime.fromisoformat(job['submitted_at'])
+        if datetime.now(pytz.UTC) - submitted_at > timedelta(hours=(self.batch_lead_hours or 0) + 12):
+            logger.warning(f"Ignoring stale summary batch {job['batch_id']} submitted at {job['submitted_at']}.")
+            return None
+
+        if job['status'] == STATE_PENDING:
+            # בדיקה אחרונה - ייתכן שהמשימה הסתיימה מאז הבדיקה הקודמת
+            try:
+                status = await asyncio.to_thread(self.batch_provider.poll, job['batch_id'])
+            except Exception as e:
+                logger.warning(f"Final poll of summary batch {job['batch_id']} failed: {e}")
+                status = None
+            if status and status.state == STATE_COMPLETED:
+                job.update(self._batch_result_fields(status.results['weekly-summary']), status=STATE_COMPLETED)
+            else:
+                logger.warning(f"Summary batch {job['batch_id']} was not ready by the deadline. Using the live path.")
+                await asyncio.to_thread(self.batch_provider.cancel, job['batch_id'])
+                return None
+
+        if job['status'] != STATE_COMPLETED:
+            logger.warning(f"Summary batch {job['batch_id']} failed ({job.get('error')}). Using the live path.")
+            return None
+
+        # זמן התגובה של batch נמדד בשעות ולא נכלל בממוצע זמני התגובה
+        self.usage_tracker.record(
+            "scheduled:batch", job.get('result_model') or job['model'], 0.0,
+            post_count=job['post_count'], input_bytes=job['input_bytes'],
+            prompt_tokens=job.get('prompt_tokens', 0), completion_tokens=job.get('completion_tokens', 0),
+            cached_tokens=job.get('cached_tokens', 0), prompt_version=job['prompt_version'], batch=True
+        )
+        self.budget_guard.invalidate()
+        summaries = [self._sanitize_html_for_telegram(text) for text in job['texts'] if text]
+        if summaries:
+            logger.info(f"Using {len(summaries)} summary candidate(s) from batch {job['batch_id']}.")
+        return summaries or None
     
     def run_async_job(self, async_func):
         """
         מריץ פונקציה אסינכרונית מה-thread של schedule
         באמצעות ה-event loop הראשי של הבוט.
         """
+        if self.stopping:
+            logger.warning(f"Shutdown in progress. Skipping scheduled job: {async_func.__name__}")
+            return
         logger.info(f"Scheduler is triggering async job: {async_func.__name__}")
         # זה הקוד הקריטי: הוא שולח את המשימה לביצוע בלולאה הנכונה
-        asyncio.run_coroutine_threadsafe(async_func(), self.loop)
+        future = asyncio.run_coroutine_threadsafe(async_func(), self.loop)
+        # מעקב אחרי הריצה כדי שכיבוי מסודר ימתין לה
+        self._scheduled_jobs.add(future)
+        future.add_done_callback(self._scheduled_jobs.discard)
         
     def run_scheduler(self):
-        """מריץ את לולאת התזמונים ב-thread נפרד."""
+        """מריץ את לולאת התזמונים ב-thread נפרד, עד לכיבוי."""
         logger.info("Scheduler thread started.")
         
         # אין תיזמון ברירת מחדל כאן. התיזמון מוגדר רק דרך set_weekly_schedule() כדי למנוע כפילויות.
 
-        while True:
+        while not self._scheduler_stop.is_set():
             schedule.run_pending()
-            time.sleep(1)
+            self._scheduler_stop.wait(1)
+        logger.info("Scheduler thread stopped.")
 
     def run_background_tasks(self):
         """
@@ -880,34 +1703,139 @@ class TelegramSummaryBot:
             scheduler_thread.daemon = True
             scheduler_thread.start()
             
+            # בניית אינדקס החיפוש מהפוסטים השמורים
+            try:
+                self.search_index.rebuild(self.storage.all_posts())
+            except Exception as index_error:
+                logger.error(f"Failed to build search index from {self.storage.name}: {index_error}", exc_info=True)
+
+            # סנכרון מונה הפוסטים השמורים פעם אחת בעלייה (למשל במאגר קיים שנוצר לפני המונים)
+            try:
+                self.storage.increment_stats('bot', {}, {'stored_posts': self.storage.count_posts()})
+            except Exception as stats_error:
+                logger.error(f"Failed to sync stored posts counter: {stats_error}", exc_info=True)
+
             logger.info("הבוט מתחיל...")
             await self.application.initialize()
             await self.application.start()
             await self.application.updater.start_polling()
+            self.start_loop_watchdog()
+
+            # המשך בדיקת משימת batch שנשלחה לפני ההפעלה מחדש
+            pending_batch = self.storage.get_state(BATCH_STATE_KEY)
+            if pending_batch and pending_batch['status'] == STATE_PENDING:
+                logger.info(f"Resuming polling of summary batch {pending_batch['batch_id']}.")
+                self._start_batch_polling()
             
-            # שמירה על הבוט פעיל
-            while True:
-                await asyncio.sleep(1)
+            # שמירה על הבוט פעיל עד לבקשת כיבוי
+            await self._stop_requested.wait()
                 
         except Exception as e:
             logger.error(f"שגיאה בהרצת הבוט: {e}")
         finally:
-            await self.application.stop()
+            await self.shutdown()
+
+    def request_shutdown(self):
+        """בקשת כיבוי מסודר. בטוח לקריאה מכל thread (למשל מ-worker_exit של gunicorn)."""
+        self.loop.call_soon_threadsafe(self._stop_requested.set)
+
+    def _busy(self) -> bool:
+        if self._post_publish_task and not self._post_publish_task.done():
+            return True
+        return self.publish_lock.locked() or any(not future.done() for future in list(self._scheduled_jobs))
+
+    async def shutdown(self):
+        """
+        כיבוי מסודר לפני הפעלה מחדש: עצירת הקליטה והתזמונים, המתנה לפרסום או לריצה מתוזמנת שבאמצע
+        (עד SHUTDOWN_TIMEOUT_SECONDS), שמירת הטיוטה והתזמון, ביטול משימות הרקע וכתיבת מה שממתין במאגר.
+        משימת batch שממתינה נשארת שמורה, והבדיקה שלה ממשיכה בעלייה הבאה במקום לשלוח אותה שוב.
+        """
+        if self.stopping:
+            return
+        self.stopping = True
+        deadline = time.monotonic() + self.shutdown_timeout
+        logger.info(f"Graceful shutdown started (timeout: {self.shutdown_timeout:.0f}s).")
+
+        # 1. עצירת הקליטה: תזמונים חדשים לא מופעלים, וה-polling נעצר אחרי אישור העדכונים שכבר טופלו מול טלגרם
+        self._scheduler_stop.set()
+        try:
+            if self.application.updater and self.application.updater.running:
+                await self.application.updater.stop()
+        except Exception as e:
+            logger.error(f"Failed to stop polling: {e}", exc_info=True)
+
+        # 2. המתנה לפרסום ולריצה מתוזמנת שבאמצע, ואז לעדכונים שכבר בטיפול
+        while self._busy() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        if self._busy():
+            logger.warning("Shutdown deadline reached while a publish or scheduled job was still running.")
+        if self.application.running:
+            try:
+                await asyncio.wait_for(self.application.stop(), timeout=max(0.1, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                logger.warning("Shutdown deadline reached while update handlers were still running.")
+            except Exception as e:
+                logger.error(f"Failed to stop the application: {e}", exc_info=True)
+
+        # 3. ביטול משימות רקע - הכנת מועמדים מתחילה מחדש לפי הצורך, ובדיקת ה-batch ממשיכה בעלייה הבאה
+        self._cancel_prefetch()
+        if self._batch_poll_task and not self._batch_poll_task.done():
+            self._batch_poll_task.cancel()
+        if self._post_publish_task and not self._post_publish_task.done():
+            # התקצירים שלא נשמרו יסומנו כחלקיים, אבל הפוסטים שפורסמו נמחקים לפני סגירת המאגר
+            self._post_publish_task.cancel()
+            await asyncio.wait({self._post_publish_task}, timeout=3)
+        if self.loop_watchdog:
+            self.loop_watchdog.stop()
+
+        # 4. שמירת נקודת ביקורת: הטיוטה (עם המועמדים שכבר מוכנים) והתזמון השבועי
+        self._save_draft()
+        try:
+            jobs = schedule.get_jobs('weekly-summary')
+            if jobs:
+                self.storage.save_schedule(jobs[0].at_time.strftime('%H:%M'))
+        except Exception as e:
+            logger.error(f"Failed to checkpoint the weekly schedule: {e}")
+
+        # 5. סגירת החיבור לטלגרם וכתיבת כל מה שממתין במאגר
+        try:
+            await self.application.shutdown()
+        except Exception as e:
+            logger.error(f"Failed to shut down the application: {e}", exc_info=True)
+        try:
+            self.storage.close()
+        except Exception as e:
+            logger.error(f"Failed to flush and close {self.storage.name}: {e}", exc_info=True)
+        if self.update_recorder:
+            self.update_recorder.close()
+        logger.info("Graceful shutdown completed.")
+
+bot_instance: Optional[TelegramSummaryBot] = None
+bot_thread: Optional[threading.Thread] = None
 
 def start_bot_logic():
     # נקודת כניסה
     async def main():
-        bot = TelegramSummaryBot()
-        await bot.run()
+        global bot_instance
+        bot_instance = TelegramSummaryBot()
+        await bot_instance.run()
     
     asyncio.run(main())
 
+def shutdown_bot(timeout: Optional[float] = None):
+    """כיבוי מסודר מבחוץ (worker_exit ב-gunicorn.conf.py): בקשת כיבוי מהבוט והמתנה לסיום ה-thread שלו."""
+    if bot_instance is None:
+        return
+    bot_instance.request_shutdown()
+    if bot_thread is not None:
+        bot_thread.join(timeout if timeout is not None else bot_instance.shutdown_timeout + 5)
+        if bot_thread.is_alive():
+            logging.warning("Bot thread did not finish shutting down in time.")
+
 # =================================================================
 # הפעלת הבוט בתהליך רקע ברמה הגלובלית של המודול
 # כך ש-Gunicorn יפעיל אותו בעת הייבוא.
 # =================================================================
-logging.info("Creating bot thread to run in the background...")
-
 # עטיפה בהגנת חריגות כדי שלא נישאר בלי לוגים במקרה של כישלון אתחול
 def _safe_start_bot_logic():
     try:
@@ -917,8 +1845,12 @@ def _safe_start_bot_logic():
     except Exception as e:
         logging.critical(f"Bot background thread failed to start: {e}", exc_info=True)
 
-bot_thread = threading.Thread(target=_safe_start_bot_logic)
-bot_thread.daemon = True
-bot_thread.start()
+# SAMMERY_AUTOSTART=false מאפשר לייבא את המודול (למשל מ-load_replay.py) בלי להפעיל polling
+if os.getenv('SAMMERY_AUTOSTART', 'true').lower() in ("1", "true", "yes", "on"):
+    logging.info("Creating bot thread to run in the background...")
+
+    bot_thread = threading.Thread(target=_safe_start_bot_logic)
+    bot_thread.daemon = True
+    bot_thread.start()
 
-logging.info("Background bot thread started. The main thread will now be managed by Gunicorn.")
+    logging.info("Background bot thread started. The main thread will now be managed by Gunicorn.")
@@ -0,0 +1,95 @@
+"""
+העברת הפוסטים מהקולקציה הרגילה (posts) לקולקציית time-series (posts_ts) עבור MONGO_POSTS_LAYOUT=timeseries.
+ההעברה נעשית במקבצים, מדלגת על פוסטים שכבר הועברו (אפשר להריץ שוב אחרי הפסקה) ומשאירה את המקור כפי שהוא.
+
+שימוש:
+    python migrate_posts_timeseries.py
+    python migrate_posts_timeseries.py --channel AndroidAndAI --batch-size 2000 --dry-run
+
+אחרי ההעברה: להגדיר MONGO_POSTS_LAYOUT=timeseries ולהפעיל מחדש. את posts אפשר למחוק ידנית אחרי אימות.
+"""
+import os
+import time
+import logging
+import argparse
+from typing import List, Optional
+
+from pymongo import MongoClient
+
+from storage import TIMESERIES_COLLECTION, ensure_timeseries_collection
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(db, channel: str, source: str = "posts", batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """העברת כל הפוסטים מ-source ל-posts_ts עם הערוץ כ-metaField. מחזיר ספירות."""
+    source_collection = db[source]
+    total = source_collection.count_documents({})
+    target = None if dry_run else ensure_timeseries_collection(db)
+
+    # מזהי הפוסטים שכבר הועברו, כדי שהרצה חוזרת לא תיצור כפילויות
+    existing = set()
+    if target is not None:
+        existing = {doc['message_id'] for doc in target.find({'channel': channel}, {'message_id': 1, '_id': 0})}
+
+    migrated = skipped = 0
+    batch: List[dict] = []
+    started = time.monotonic()
+
+    def write(documents):
+        if documents and target is not None:
+            target.insert_many(documents, ordered=False)
+
+    for post in source_collection.find({}, {'message_id': 1, 'date': 1, 'text': 1}).sort('date', 1):
+        if post['message_id'] in existing or not post.get('date'):
+            skipped += 1
+            continue
+        existing.add(post['message_id'])
+        batch.append({'channel': channel, 'date': post['date'], 'message_id': post['message_id'], 'text': post['text']})
+        if len(batch) >= batch_size:
+            write(batch)
+            migrated += len(batch)
+            batch = []
+            logger.info(f"Migrated {migrated}/{total} posts...")
+    write(batch)
+    migrated += len(batch)
+
+    result = {
+        'source_count': total,
+        'migrated': migrated,
+        'skipped': skipped,
+        'target_count': target.count_documents({'channel': channel}) if target is not None else None,
+        'seconds': time.monotonic() - started,
+    }
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Copy posts into a MongoDB time-series collection.")
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI"), help="MongoDB URI (default: MONGODB_URI)")
+    parser.add_argument("--database", default="telegram_bot_db")
+    parser.add_argument("--source", default="posts", help="source collection")
+    parser.add_argument("--channel", default=os.getenv("CHANNEL_USERNAME", "AndroidAndAI"),
+                        help="channel stored as the metaField (default: CHANNEL_USERNAME)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="count what would be migrated without writing")
+    args = parser.parse_args(argv)
+
+    if not args.uri:
+        parser.error("MongoDB URI is required (--uri or MONGODB_URI)")
+
+    db = MongoClient(args.uri)[args.database]
+    result = migrate(db, args.channel, source=args.source, batch_size=args.batch_size, dry_run=args.dry_run)
+    print(
+        f"{'Dry run: ' if args.dry_run else ''}{result['migrated']} posts migrated to '{TIMESERIES_COLLECTION}', "
+        f"{result['skipped']} skipped, in {result['seconds']:.1f}s."
+    )
+    if result['target_count'] is not None:
+        print(f"Source '{args.source}': {result['source_count']} posts. Target for '{args.channel}': {result['target_count']} posts.")
+        if result['target_count'] < result['source_count']:
+            print("Warning: the target has fewer posts than the source (posts without a date are skipped).")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    main()
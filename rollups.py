@@ -0,0 +1,175 @@
+"""
+סיכומים מדורגים (rollups) לחלונות זמן שרירותיים.
+תקציר יומי נוצר פעם אחת מהפוסטים ונשמר במטמון, תקציר שבועי מורכב מ-7 תקצירים יומיים,
+ותקציר "חודשי" (4 שבועות) מורכב מ-4 תקצירים שבועיים. חלון מבוקש מפורק ליחידות הגדולות ביותר
+שנכנסות בו במלואן, כך שסיכום של חודש עולה קריאה קטנה אחת על כמה תקצירים שמורים.
+"""
+import re
+import asyncio
+import logging
+from datetime import datetime, date, timedelta, timezone
+from typing import List, Dict, Optional, Callable, Awaitable, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEVEL_DAY = "day"
+LEVEL_WEEK = "week"
+LEVEL_MONTH = "month"
+
+UNIT_DAYS = {LEVEL_DAY: 1, LEVEL_WEEK: 7, LEVEL_MONTH: 28}
+CHILD_LEVEL = {LEVEL_WEEK: LEVEL_DAY, LEVEL_MONTH: LEVEL_WEEK}
+
+# עוגן ליישור יחידות: יום ראשון, כך ששבוע מתחיל בראשון כמו בלוח הישראלי
+ALIGNMENT_EPOCH = date(2024, 1, 7)
+MAX_WINDOW_DAYS = 120
+
+WINDOW_RE = re.compile(r"^(\d+)\s*([dw])$")
+NAMED_WINDOWS = {"day": 1, "week": 7, "month": 30}
+
+
+def parse_window(arg: str) -> int:
+    """המרת ארגומנט כמו 3d / 2w / 14d / month למספר ימים. זורק ValueError על קלט לא תקין."""
+    arg = arg.strip().lower()
+    if arg in NAMED_WINDOWS:
+        return NAMED_WINDOWS[arg]
+    match = WINDOW_RE.match(arg)
+    if not match:
+        raise ValueError(f"Unsupported window '{arg}'")
+    days = int(match.group(1)) * (7 if match.group(2) == "w" else 1)
+    if not 1 <= days <= MAX_WINDOW_DAYS:
+        raise ValueError(f"Window must be between 1 and {MAX_WINDOW_DAYS} days")
+    return days
+
+
+def plan_units(start: date, end: date, today: date) -> List[Tuple[str, date]]:
+    """
+    פירוק טווח הימים [start, end] ליחידות. יחידה גדולה נבחרת רק אם היא מיושרת,
+    נכנסת כולה בטווח והסתיימה לפני היום (כדי שאפשר יהיה לשמור אותה במטמון).
+    """
+    units = []
+    cursor = start
+    while cursor <= end:
+        for level in (LEVEL_MONTH, LEVEL_WEEK):
+            length = UNIT_DAYS[level]
+            unit_end = cursor + timedelta(days=length - 1)
+            if (cursor - ALIGNMENT_EPOCH).days % length == 0 and unit_end <= end and unit_end < today:
+                units.append((level, cursor))
+                cursor += timedelta(days=length)
+                break
+        else:
+            units.append((LEVEL_DAY, cursor))
+            cursor += timedelta(days=1)
+    return units
+
+
+class RollupEngine:
+    """
+    בונה ושומר תקצירים מדורגים.
+    store הוא שכבת האחסון (get_rollup/save_rollup). fetch_posts(start_utc, end_utc) מחזיר את הפוסטים בטווח,
+    ו-summarize(level, items) מחזיר תקציר טקסטואלי מרשימת פריטים (פוסטים ליום, תקצירים ליחידות גבוהות יותר).
+    history_start() מחזיר את הזמן (UTC) שממנו המאגר מחזיק את כל הפוסטים, או None אם שום פוסט לא נמחק.
+    יחידה שמתחילה לפני הזמן הזה ואין לה תקציר שמור נבנית מחלק מהפוסטים - היא מסומנת partial ולא נשמרת,
+    וכך גם יחידה גבוהה יותר שאחד מהילדים שלה חלקי או חסר.
+    """
+
+    def __init__(self, store, fetch_posts: Callable[[datetime, datetime], Awaitable[List[Dict]]],
+                 summarize: Callable[[str, List[Dict]], Awaitable[str]], tz, cache_tag: str = "",
+                 max_concurrency: int = 4, history_start: Optional[Callable[[], Optional[datetime]]] = None):
+        self.store = store
+        self.fetch_posts = fetch_posts
+        self.summarize = summarize
+        self.tz = tz
+        self.cache_tag = cache_tag
+        self.history_start = history_start
+        # הגבלת מספר קריאות ה-LLM המקבילות בבניית מטמון ריק (למשל חודש שלם בפעם הראשונה)
+        self._summarize_slots = asyncio.Semaphore(max_concurrency)
+
+    def today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    def _day_bounds_utc(self, start: date, days: int) -> Tuple[datetime, datetime]:
+        local_start = self.tz.localize(datetime.combine(start, datetime.min.time()))
+        local_end = self.tz.localize(datetime.combine(start + timedelta(days=days), datetime.min.time()))
+        return local_start.astimezone(timezone.utc), local_end.astimezone(timezone.utc)
+
+    def _cache_key(self, level: str, start: date) -> str:
+        key = f"{level}:{start.isoformat()}"
+        return f"{key}:{self.cache_tag}" if self.cache_tag else key
+
+    def _truncated(self, start: date) -> bool:
+        """האם פוסטים מהיחידה שמתחילה ב-start אולי נמחקו מהמאגר."""
+        boundary = self.history_start() if self.history_start else None
+        return boundary is not None and self._day_bounds_utc(start, 1)[0] < boundary
+
+    async def get_digest(self, level: str, start: date) -> Optional[Dict]:
+        """מחזיר תקציר ליחידה ({'level','start','text','post_count','partial'}) או None אם אין בה פוסטים."""
+        length = UNIT_DAYS[level]
+        complete = start + timedelta(days=length - 1) < self.today()
+        key = self._cache_key(level, start)
+
+        if complete:
+            cached = self.store.get_rollup(key)
+            if cached:
+                return cached
+
+        if level == LEVEL_DAY:
+            start_utc, end_utc = self._day_bounds_utc(start, 1)
+            items = await self.fetch_posts(start_utc, end_utc)
+            post_count = len(items)
+            partial = self._truncated(start)
+        else:
+            child_level = CHILD_LEVEL[level]
+            child_length = UNIT_DAYS[child_level]
+            child_starts = [start + timedelta(days=offset) for offset in range(0, length, child_length)]
+            children = await asyncio.gather(*[self.get_digest(child_level, child_start) for child_start in child_starts])
+            items = [child for child in children if child]
+            post_count = sum(child['post_count'] for child in items)
+            # ילד ריק מתקופה שנמחקה אולי איבד את כל הפוסטים שלו - אי אפשר להבחין ביום שקט באמת
+            partial = any(child.get('partial') for child in items) or any(
+                child is None and self._truncated(child_start) for child, child_start in zip(children, child_starts)
+            )
+
+        if not items:
+            return None
+
+        async with self._summarize_slots:
+            text = await self.summarize(level, items)
+
+        digest = {
+            '_id': key,
+            'level': level,
+            'start': start.isoformat(),
+            'text': text,
+            'post_count': post_count,
+            'partial': partial,
+            'created_at': datetime.now(timezone.utc),
+        }
+        # רק יחידות שהסתיימו ונבנו מכל הפוסטים שלהן נשמרות - היום הנוכחי עוד מתעדכן
+        if complete and not partial:
+            self.store.save_rollup(digest)
+            logger.info(f"Cached {level} rollup for {start.isoformat()} ({post_count} posts).")
+        elif partial:
+            logger.warning(f"{level} rollup for {start.isoformat()} was built from partial posts and was not cached.")
+        return digest
+
+    async def cache_completed_days(self, since: date) -> int:
+        """
+        בניית תקצירים יומיים לכל הימים שהסתיימו מ-since ועד אתמול ושמירתם, לפני שהפוסטים נמחקים מהמאגר.
+        מחזיר את מספר הימים שיש להם תקציר.
+        """
+        today = self.today()
+        since = max(since, today - timedelta(days=MAX_WINDOW_DAYS))
+        # יום שחלק מהפוסטים שלו כבר נמחקו לא יישמר ממילא - לא משלמים עליו קריאה
+        days = [since + timedelta(days=offset) for offset in range((today - since).days)]
+        days = [day for day in days if not self._truncated(day)]
+        digests = await asyncio.gather(*[self.get_digest(LEVEL_DAY, day) for day in days])
+        return sum(1 for digest in digests if digest)
+
+    async def window_digests(self, days: int) -> List[Dict]:
+        """תקצירים לכל היחידות שמכסות את N הימים האחרונים (כולל היום), מהישן לחדש."""
+        today = self.today()
+        start = today - timedelta(days=days - 1)
+        units = plan_units(start, today, today)
+        logger.info(f"Rollup plan for {days} days: {[f'{level}:{unit_start}' for level, unit_start in units]}")
+        digests = await asyncio.gather(*[self.get_digest(level, unit_start) for level, unit_start in units])
+        return [digest for digest in digests if digest]
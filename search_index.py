@@ -0,0 +1,175 @@
+"""
+אינדקס הפוך (inverted index) בזיכרון לחיפוש טקסט מלא בפוסטים השמורים.
+כולל נרמול מותאם לעברית: הסרת ניקוד, איחוד אותיות סופיות והסרת אותיות שימוש בתחילת מילה (ו/ה/ב/כ/ל/מ/ש).
+האינדקס נבנה מחדש מקולקציית הפוסטים בעלייה ומתעדכן בכל קליטת פוסט חדש.
+"""
+import re
+import math
+import bisect
+import logging
+from datetime import datetime, timezone
+from typing import List, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+NIQQUD_RE = re.compile(r"[\u0591-\u05C7]")
+TOKEN_RE = re.compile(r"[a-z0-9\u05D0-\u05EA]+")
+FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+HEBREW_PREFIXES = "ובהכלמש"
+MIN_STEM_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def normalize(text: str) -> str:
+    """הסרת ניקוד, המרה לאותיות קטנות ואיחוד אותיות סופיות."""
+    return NIQQUD_RE.sub("", text).lower().translate(FINAL_LETTERS)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(normalize(text))
+
+
+def term_variants(token: str) -> Set[str]:
+    """המילה עצמה + גרסאות ללא אותיות שימוש (עד שתיים), למשל 'והאנדרואיד' -> 'האנדרואיד', 'אנדרואיד'."""
+    variants = {token}
+    stem = token
+    for _ in range(2):
+        if len(stem) - 1 >= MIN_STEM_LENGTH and stem[0] in HEBREW_PREFIXES:
+            stem = stem[1:]
+            variants.add(stem)
+        else:
+            break
+    return variants
+
+
+class SearchIndex:
+    """אינדקס הפוך עם דירוג BM25. מזהה המסמך הוא ה-message_id של הפוסט."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.documents: Dict[int, Dict] = {}
+        self._total_length = 0
+        self._sorted_terms: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def clear(self):
+        self.postings.clear()
+        self.documents.clear()
+        self._total_length = 0
+        self._sorted_terms = None
+
+    def rebuild(self, posts: Iterable[Dict]) -> int:
+        self.clear()
+        for post in posts:
+            self.add(post)
+        logger.info(f"Search index rebuilt with {len(self.documents)} posts and {len(self.postings)} terms.")
+        return len(self.documents)
+
+    def add(self, post: Dict):
+        """הוספה (או עדכון) של פוסט לאינדקס."""
+        doc_id = post.get('message_id')
+        text = post.get('text')
+        if doc_id is None or not text:
+            return
+        if doc_id in self.documents:
+            self.remove(doc_id)
+
+        tokens = tokenize(text)
+        term_counts: Dict[str, int] = {}
+        for token in tokens:
+            for term in term_variants(token):
+                term_counts[term] = term_counts.get(term, 0) + 1
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+        # תאריכים מ-MongoDB חוזרים ללא אזור זמן (UTC), ומטלגרם עם אזור זמן - מאחדים ל-UTC
+        date = post.get('date')
+        if date is not None and date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+
+        self.documents[doc_id] = {
+            'message_id': doc_id,
+            'date': date,
+            'text': text,
+            'length': len(tokens),
+            'terms': list(term_counts),
+        }
+        self._total_length += len(tokens)
+        self._sorted_terms = None
+
+    def remove(self, doc_id: int):
+        document = self.documents.pop(doc_id, None)
+        if not document:
+            return
+        for term in document['terms']:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self._total_length -= document['length']
+        self._sorted_terms = None
+
+    def remove_before(self, when: datetime) -> int:
+        """הסרת הפוסטים שפורסמו לפני when (ופוסטים ללא תאריך). מחזיר כמה הוסרו."""
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        stale = [doc_id for doc_id, document in self.documents.items()
+                 if document['date'] is None or document['date'] < when]
+        for doc_id in stale:
+            self.remove(doc_id)
+        return len(stale)
+
+    def _expand(self, token: str) -> Dict[str, float]:
+        """מונחי האינדקס שמתאימים למילת חיפוש: התאמה מלאה (משקל 1) או השלמת קידומת (משקל 0.5)."""
+        matches = {term: 1.0 for term in term_variants(token) if term in self.postings}
+        if len(token) >= 3:
+            if self._sorted_terms is None:
+                self._sorted_terms = sorted(self.postings)
+            start = bisect.bisect_left(self._sorted_terms, token)
+            for term in self._sorted_terms[start:start + MAX_PREFIX_EXPANSIONS]:
+                if not term.startswith(token):
+                    break
+                matches.setdefault(term, 0.5)
+        return matches
+
+    def search(self, query: str, limit: int = 5, offset: int = 0) -> Tuple[int, List[Dict]]:
+        """
+        חיפוש בכל מילות השאילתה (AND), מדורג לפי BM25 ובשוויון לפי תאריך (חדש קודם).
+        מחזיר (מספר התוצאות הכולל, רשימת הפוסטים בעמוד המבוקש).
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens or not self.documents:
+            return 0, []
+
+        doc_count = len(self.documents)
+        avg_length = self._total_length / doc_count if doc_count else 0
+        scores: Optional[Dict[int, float]] = None
+
+        for token in query_tokens:
+            token_scores: Dict[int, float] = {}
+            for term, weight in self._expand(token).items():
+                docs = self.postings[term]
+                idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    length_norm = 1 - self.b + self.b * self.documents[doc_id]['length'] / (avg_length or 1)
+                    score = weight * idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+                    token_scores[doc_id] = max(token_scores.get(doc_id, 0.0), score)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {doc_id: scores[doc_id] + s for doc_id, s in token_scores.items() if doc_id in scores}
+            if not scores:
+                return 0, []
+
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (item[1], self.documents[item[0]]['date'] is not None, self.documents[item[0]]['date'] or 0),
+            reverse=True
+        )
+        page = [self.documents[doc_id] for doc_id, _ in ranked[offset:offset + limit]]
+        return len(ranked), page
@@ -0,0 +1,538 @@
+"""
+שכבת אחסון ניתנת להחלפה: פוסטים, טיוטת הסיכום הממתינה, התזמון השבועי, מוני סטטיסטיקה,
+תקצירים מדורגים (rollups) ורישומי צריכת LLM.
+MongoStorage הוא המימוש הקיים (Atlas), ו-SQLiteStorage הוא מימוש מקומי בקובץ יחיד (WAL, אינדקס על date,
+כתיבות מקובצות) לפריסות קטנות ולהרצה מקומית ללא שירותים חיצוניים.
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import MongoClient
+
+logger = logging.getLogger(__name__)
+
+DRAFT_KEY = "draft"
+SCHEDULE_KEY = "weekly_schedule"
+
+POSTS_LAYOUT_PLAIN = "plain"
+POSTS_LAYOUT_TIMESERIES = "timeseries"
+TIMESERIES_COLLECTION = "posts_ts"
+
+
+def ensure_timeseries_collection(db, name: str = TIMESERIES_COLLECTION):
+    """
+    יצירת קולקציית time-series לפוסטים (אם אינה קיימת): date כ-timeField והערוץ כ-metaField,
+    כך ש-MongoDB שומר את הפוסטים בדליים לפי ערוץ וזמן ושאילתות חלון זמן קוראות רק את הדליים הרלוונטיים.
+    """
+    if name not in db.list_collection_names():
+        db.create_collection(name, timeseries={'timeField': 'date', 'metaField': 'channel', 'granularity': 'hours'})
+        logger.info(f"Created time-series collection '{name}'.")
+    collection = db[name]
+    collection.create_index([('channel', 1), ('date', 1)])
+    # לבדיקת כפילויות בהעברות (מילוי לאחור). אינדקס משני על שדה מדידה נתמך החל מ-MongoDB 6.0
+    collection.create_index([('channel', 1), ('message_id', 1)])
+    return collection
+
+
+def _to_utc(value: datetime) -> datetime:
+    """תאריך ללא אזור זמן נחשב UTC (כך MongoDB מחזיר אותו)."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _nest(flat: Dict[str, Any]) -> Dict[str, Any]:
+    """המרת שדות עם נקודות ('per_day.2024-01-07') למבנה מקונן, כמו שמסמך Mongo נראה אחרי $inc."""
+    nested: Dict[str, Any] = {}
+    for path, value in flat.items():
+        node = nested
+        *parents, leaf = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return nested
+
+
+class Storage(ABC):
+    """
+    ממשק האחסון. כל המתודות סינכרוניות, כמו הקריאות הישירות ל-pymongo שהחליפו.
+    מימוש שחסרה בו מתודה מופשטת נכשל כבר ביצירה ולא באמצע handler.
+    """
+
+    name = "base"
+
+    # --- פוסטים ---
+    @abstractmethod
+    def insert_post(self, post: Dict):
+        """שמירת פוסט חדש מהערוץ."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_post(self, post: Dict) -> bool:
+        """שמירת פוסט רק אם ה-message_id שלו לא קיים. מחזיר True אם נוסף."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def posts_between(self, start: datetime, end: Optional[datetime] = None) -> List[Dict]:
+        """פוסטים בטווח [start, end), מהישן לחדש."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def all_posts(self) -> Iterable[Dict]:
+        """כל הפוסטים (message_id, date, text) לבניית אינדקס החיפוש."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_posts(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear_posts(self, before: Optional[datetime] = None) -> int:
+        """מחיקת כל הפוסטים (או רק אלה שלפני before). מחזיר את מספר הפוסטים שנמחקו."""
+        raise NotImplementedError
+
+    # --- מצב: טיוטה ותזמון ---
+    @abstractmethod
+    def get_state(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_state(self, key: str, value: Optional[Dict]):
+        """שמירת ערך מצב (None מוחק אותו)."""
+        raise NotImplementedError
+
+    def save_draft(self, text: Optional[str], window_days: Optional[int] = None,
+                   candidates: Optional[List[str]] = None):
+        """שמירת הטיוטה הממתינה יחד עם סיכומים חלופיים מוכנים שעוד לא הוצגו."""
+        if text is None:
+            self.set_state(DRAFT_KEY, None)
+        else:
+            self.set_state(DRAFT_KEY, {'text': text, 'window_days': window_days, 'candidates': list(candidates or []),
+                                       'saved_at': datetime.now(timezone.utc).isoformat()})
+
+    def load_draft(self) -> Optional[Dict]:
+        return self.get_state(DRAFT_KEY)
+
+    def save_schedule(self, time_str: Optional[str]):
+        self.set_state(SCHEDULE_KEY, {'time': time_str} if time_str else None)
+
+    def load_schedule(self) -> Optional[str]:
+        state = self.get_state(SCHEDULE_KEY)
+        return state.get('time') if state else None
+
+    # --- סטטיסטיקה ---
+    @abstractmethod
+    def increment_stats(self, name: str, counters: Dict[str, float], values: Optional[Dict[str, Any]] = None):
+        """הגדלת מונים (שמות עם נקודות יוצרים מבנה מקונן) ועדכון שדות ערך במסמך סטטיסטיקה אחד."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_stats(self, name: str) -> Dict:
+        raise NotImplementedError
+
+    # --- תקצירים מדורגים ---
+    @abstractmethod
+    def get_rollup(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_rollup(self, digest: Dict):
+        raise NotImplementedError
+
+    # --- צריכת LLM ---
+    @abstractmethod
+    def record_usage(self, entry: Dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def usage_since(self, since: datetime) -> List[Dict]:
+        raise NotImplementedError
+
+    def flush(self):
+        """כתיבת כל מה שממתין בזיכרון. במימושים ללא חציצה אין מה לעשות."""
+
+    def close(self):
+        self.flush()
+
+
+class MongoStorage(Storage):
+    """
+    המימוש הקיים: מסד telegram_bot_db ב-MongoDB.
+    posts_layout="timeseries" שומר את הפוסטים בקולקציית time-series (posts_ts) עם הערוץ כ-metaField,
+    וכל שאילתות הפוסטים מסוננות לפי הערוץ. להעברת פוסטים קיימים: migrate_posts_timeseries.py.
+    """
+
+    name = "mongo"
+
+    def __init__(self, uri: str, database: str = "telegram_bot_db", posts_layout: str = POSTS_LAYOUT_PLAIN,
+                 channel: Optional[str] = None):
+        self.client = MongoClient(uri)
+        self.db = self.client[database]
+        self.timeseries = posts_layout == POSTS_LAYOUT_TIMESERIES
+        if self.timeseries:
+            if not channel:
+                raise ValueError("The time-series posts layout requires a channel name")
+            self.channel = channel
+            self.posts = ensure_timeseries_collection(self.db)
+            self.name = "mongo-timeseries"
+        elif posts_layout == POSTS_LAYOUT_PLAIN:
+            self.channel = None
+            self.posts = self.db.posts
+        else:
+            raise ValueError(f"Unknown posts layout '{posts_layout}' (expected 'plain' or 'timeseries')")
+        self.state = self.db.bot_state
+        self.stats = self.db.stats
+        self.rollups = self.db.rollups
+        self.usage = self.db.llm_usage
+
+    def _posts_filter(self, **conditions) -> Dict:
+        # בקולקציית time-series כל השאילתות מסוננות לפי ה-metaField, כך שנקראים רק הדליים של הערוץ
+        if self.timeseries:
+            conditions['channel'] = self.channel
+        return conditions
+
+    def insert_post(self, post: Dict):
+        self.posts.insert_one(self._posts_filter(**post))
+
+    def upsert_post(self, post: Dict) -> bool:
+        if self.timeseries:
+            # קולקציות time-series לא תומכות ב-upsert - בדיקה ואז הכנסה (הבוט הוא הכותב היחיד)
+            if self.posts.find_one(self._posts_filter(message_id=post['message_id']), {'_id': 1}):
+                return False
+            self.insert_post(post)
+            return True
+        result = self.posts.update_one(
+            {'message_id': post['message_id']},
+            {'$setOnInsert': dict(post)},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    def posts_between(self, start: datetime, end: Optional[datetime] = None) -> List[Dict]:
+        query = {'$gte': start}
+        if end is not None:
+            query['$lt'] = end
+        return list(self.posts.find(self._posts_filter(date=query)).sort('date', 1))
+
+    def all_posts(self) -> Iterable[Dict]:
+        return self.posts.find(self._posts_filter(), {'message_id': 1, 'date': 1, 'text': 1})
+
+    def count_posts(self) -> int:
+        return self.posts.count_documents(self._posts_filter())
+
+    def clear_posts(self, before: Optional[datetime] = None) -> int:
+        if before is not None:
+            return self.posts.delete_many(self._posts_filter(date={'$lt': before})).deleted_count
+        return self.posts.delete_many(self._posts_filter()).deleted_count
+
+    def get_state(self, key: str) -> Optional[Dict]:
+        document = self.state.find_one({'_id': key})
+        return document.get('value') if document else None
+
+    def set_state(self, key: str, value: Optional[Dict]):
+        if value is None:
+            self.state.delete_one({'_id': key})
+        else:
+            self.state.replace_one({'_id': key}, {'_id': key, 'value': value}, upsert=True)
+
+    def increment_stats(self, name: str, counters: Dict[str, float], values: Optional[Dict[str, Any]] = None):
+        update = {}
+        if counters:
+            update['$inc'] = counters
+        if values:
+            update['$set'] = values
+        if update:
+            self.stats.update_one({'_id': name}, update, upsert=True)
+
+    def get_stats(self, name: str) -> Dict:
+        return self.stats.find_one({'_id': name}) or {}
+
+    def get_rollup(self, key: str) -> Optional[Dict]:
+        return self.rollups.find_one({'_id': key})
+
+    def save_rollup(self, digest: Dict):
+        self.rollups.replace_one({'_id': digest['_id']}, digest, upsert=True)
+
+    def record_usage(self, entry: Dict):
+        self.usage.insert_one(dict(entry))
+
+    def usage_since(self, since: datetime) -> List[Dict]:
+        return list(self.usage.find({'at': {'$gte': since}}))
+
+
+class SQLiteStorage(Storage):
+    """
+    מימוש מקומי ב-SQLite. מצב WAL מאפשר קריאות במקביל לכתיבה, ופוסטים נכנסים ועדכוני המונים שלהם נאספים
+    בזיכרון ונכתבים בטרנזקציה אחת (כשנאספו batch_size פוסטים, אחרי flush_interval שניות, או לפני כל קריאה).
+    החיבור משותף בין ה-threads (הבוט, ה-scheduler ו-Flask) ומוגן בנעילה.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS posts (
+            message_id INTEGER PRIMARY KEY,
+            date REAL NOT NULL,
+            text TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS posts_date ON posts (date);
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT NOT NULL,
+            field TEXT NOT NULL,
+            number REAL,
+            value TEXT,
+            PRIMARY KEY (name, field)
+        );
+        CREATE TABLE IF NOT EXISTS rollups (
+            key TEXT PRIMARY KEY,
+            level TEXT NOT NULL,
+            start TEXT NOT NULL,
+            text TEXT NOT NULL,
+            post_count INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            at REAL NOT NULL,
+            entry TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS llm_usage_at ON llm_usage (at);
+    """
+
+    def __init__(self, path: str = "sammery.db", batch_size: int = 50, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._pending_posts: List[tuple] = []
+        self._pending_stats: List[tuple] = []
+        self._pending_since = 0.0
+
+        # isolation_level=None: ניהול טרנזקציות ידני עם BEGIN/COMMIT סביב כל batch
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+        # כתיבה של batch שנשאר פתוח גם כשאין פוסטים חדשים שיפעילו אותה
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="SQLiteFlushThread", daemon=True)
+        self._flusher.start()
+        logger.info(f"SQLite storage opened at {path} (WAL, batch size {batch_size}).")
+
+    # --- כתיבות מקובצות ---
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush pending posts to SQLite: {e}", exc_info=True)
+
+    def _queued(self):
+        """נקרא אחרי הוספת כתיבה לתור: כתיבה מיידית אם ה-batch מלא או ותיק מדי."""
+        if len(self._pending_posts) + len(self._pending_stats) == 1:
+            self._pending_since = time.monotonic()
+        if (len(self._pending_posts) >= self.batch_size
+                or time.monotonic() - self._pending_since >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending_posts and not self._pending_stats:
+                return
+            batch, self._pending_posts = self._pending_posts, []
+            stats_batch, self._pending_stats = self._pending_stats, []
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR IGNORE INTO posts (message_id, date, text) VALUES (?, ?, ?)", batch)
+                for name, counters, values in stats_batch:
+                    self._write_stats(name, counters, values)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                self._pending_posts = batch + self._pending_posts
+                self._pending_stats = stats_batch + self._pending_stats
+                raise
+            logger.debug(f"Flushed {len(batch)} posts and {len(stats_batch)} stats updates to SQLite.")
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+    @staticmethod
+    def _post_row(post: Dict) -> tuple:
+        return post['message_id'], _to_utc(post['date']).timestamp(), post['text']
+
+    @staticmethod
+    def _post_from_row(row) -> Dict:
+        return {
+            'message_id': row['message_id'],
+            'date': datetime.fromtimestamp(row['date'], tz=timezone.utc),
+            'text': row['text'],
+        }
+
+    # --- פוסטים ---
+    def insert_post(self, post: Dict):
+        with self._lock:
+            self._pending_posts.append(self._post_row(post))
+            self._queued()
+
+    def upsert_post(self, post: Dict) -> bool:
+        with self._lock:
+            self.flush()
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO posts (message_id, date, text) VALUES (?, ?, ?)", self._post_row(post)
+            )
+            return cursor.rowcount == 1
+
+    def posts_between(self, start: datetime, end: Optional[datetime] = None) -> List[Dict]:
+        with self._lock:
+            self.flush()
+            if end is None:
+                rows = self.conn.execute(
+                    "SELECT * FROM posts WHERE date >= ? ORDER BY date", (_to_utc(start).timestamp(),)
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT * FROM posts WHERE date >= ? AND date < ? ORDER BY date",
+                    (_to_utc(start).timestamp(), _to_utc(end).timestamp())
+                ).fetchall()
+        return [self._post_from_row(row) for row in rows]
+
+    def all_posts(self) -> Iterable[Dict]:
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute("SELECT * FROM posts").fetchall()
+        return [self._post_from_row(row) for row in rows]
+
+    def count_posts(self) -> int:
+        with self._lock:
+            self.flush()
+            return self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def clear_posts(self, before: Optional[datetime] = None) -> int:
+        with self._lock:
+            self.flush()
+            if before is not None:
+                return self.conn.execute("DELETE FROM posts WHERE date < ?", (_to_utc(before).timestamp(),)).rowcount
+            return self.conn.execute("DELETE FROM posts").rowcount
+
+    # --- מצב ---
+    def get_state(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def set_state(self, key: str, value: Optional[Dict]):
+        with self._lock:
+            if value is None:
+                self.conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False))
+                )
+
+    # --- סטטיסטיקה ---
+    def increment_stats(self, name: str, counters: Dict[str, float], values: Optional[Dict[str, Any]] = None):
+        # העדכונים נכנסים לתור ונכתבים יחד עם ה-batch של הפוסטים, לפי סדר הגעתם
+        with self._lock:
+            self._pending_stats.append((name, dict(counters), dict(values or {})))
+            self._queued()
+
+    def _write_stats(self, name: str, counters: Dict[str, float], values: Dict[str, Any]):
+        self.conn.executemany(
+            "INSERT INTO stats (name, field, number) VALUES (?, ?, ?) "
+            "ON CONFLICT (name, field) DO UPDATE SET number = COALESCE(number, 0) + excluded.number",
+            [(name, field, amount) for field, amount in counters.items()]
+        )
+        # ערך מספרי נשמר בעמודת number כדי שאפשר יהיה להמשיך להגדיל אותו
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO stats (name, field, number, value) VALUES (?, ?, ?, ?)",
+            [
+                (name, field, value, None) if isinstance(value, (int, float)) and not isinstance(value, bool)
+                else (name, field, None, self._encode_value(value))
+                for field, value in values.items()
+            ]
+        )
+
+    @staticmethod
+    def _encode_value(value: Any) -> str:
+        if isinstance(value, datetime):
+            return json.dumps({'$date': _to_utc(value).timestamp()})
+        return json.dumps(value, ensure_ascii=False)
+
+    @staticmethod
+    def _decode_value(raw: str) -> Any:
+        value = json.loads(raw)
+        if isinstance(value, dict) and set(value) == {'$date'}:
+            return datetime.fromtimestamp(value['$date'], tz=timezone.utc)
+        return value
+
+    def get_stats(self, name: str) -> Dict:
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute("SELECT field, number, value FROM stats WHERE name = ?", (name,)).fetchall()
+        flat = {}
+        for row in rows:
+            if row['value'] is not None:
+                flat[row['field']] = self._decode_value(row['value'])
+            else:
+                number = row['number']
+                flat[row['field']] = int(number) if float(number).is_integer() else number
+        return _nest(flat)
+
+    # --- תקצירים מדורגים ---
+    def get_rollup(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM rollups WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        return {
+            '_id': row['key'],
+            'level': row['level'],
+            'start': row['start'],
+            'text': row['text'],
+            'post_count': row['post_count'],
+            'created_at': datetime.fromtimestamp(row['created_at'], tz=timezone.utc),
+        }
+
+    def save_rollup(self, digest: Dict):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rollups (key, level, start, text, post_count, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest['_id'], digest['level'], digest['start'], digest['text'], digest['post_count'],
+                 _to_utc(digest['created_at']).timestamp())
+            )
+
+    # --- צריכת LLM ---
+    def record_usage(self, entry: Dict):
+        row = {key: value for key, value in entry.items() if key != 'at'}
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO llm_usage (at, entry) VALUES (?, ?)",
+                (_to_utc(entry['at']).timestamp(), json.dumps(row, ensure_ascii=False))
+            )
+
+    def usage_since(self, since: datetime) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT at, entry FROM llm_usage WHERE at >= ? ORDER BY at", (_to_utc(since).timestamp(),)
+            ).fetchall()
+        return [
+            {'at': datetime.fromtimestamp(row['at'], tz=timezone.utc), **json.loads(row['entry'])}
+            for row in rows
+        ]
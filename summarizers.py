@@ -0,0 +1,214 @@
+"""
+מנועי סיכום מקומיים - ממשק אחיד למנועי סיכום ומנוע חילוצי (extractive) שרץ ללא רשת.
+המנוע החילוצי משמש לטיוטה מיידית לאדמין ולגיבוי כאשר OpenAI איטי או לא זמין.
+"""
+import re
+import html
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ניקוד וטעמים בעברית (U+0591-U+05C7) - מוסרים לפני חלוקה למילים
+NIQQUD_RE = re.compile(r"[\u0591-\u05C7]")
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD_RE = re.compile(r"[a-z0-9\u05D0-\u05EA]+")
+URL_RE = re.compile(r"https?://\S+")
+
+# מילות קישור נפוצות שאין להן משקל בדירוג
+STOPWORDS = {
+    "של", "את", "על", "עם", "זה", "זו", "גם", "כל", "לא", "כי", "אם", "או", "הוא", "היא",
+    "הם", "הן", "אני", "אתם", "יש", "אין", "מה", "כמו", "רק", "עוד", "אבל", "אז", "כבר",
+    "the", "a", "an", "and", "or", "of", "to", "in", "is", "for", "on", "with", "it", "this",
+}
+
+PARAGRAPH_EMOJIS = ["📱", "🤖", "🚀", "💡", "🔥", "🧠", "⚡", "🛠️", "📢", "✨"]
+
+# מגבלת האורך של הודעת טקסט בטלגרם (send_message)
+TELEGRAM_MESSAGE_LIMIT = 4096
+SUMMARY_HEADER = "<b>אז מה היה לנו השבוע? 🔥</b>"
+SUMMARY_FOOTER = "מוזמנים לעקוב גם בשבוע הבא 🙌"
+PARAGRAPH_SEPARATOR = "\n\n"
+
+
+class Summarizer(ABC):
+    """ממשק בסיס למנוע סיכום: מקבל רשימת פוסטים ומחזיר סיכום בפורמט HTML של טלגרם."""
+
+    name = "base"
+
+    @abstractmethod
+    def summarize(self, posts: List[Dict]) -> str:
+        """סיכום רשימת הפוסטים ל-HTML של טלגרם."""
+        raise NotImplementedError
+
+
+class ExtractiveSummarizer(Summarizer):
+    """
+    סיכום חילוצי: TF-IDF על משפטים + TextRank (וקטורי ב-NumPy), ובחירת משפט פתיחה לכל פוסט.
+    כל פוסט מקבל פסקה נפרדת, בדומה לפורמט שמחזיר GPT.
+    הסיכום לא חורג מ-max_chars: כשהתקציב נגמר, הפסקאות הבאות מקוצרות לכותרת וקישור,
+    וכשגם אלה לא נכנסים - מצוין כמה פוסטים נוספים לא נכללו.
+    """
+
+    name = "extractive"
+
+    def __init__(self, channel_username: Optional[str] = None, sentences_per_post: int = 1,
+                 damping: float = 0.85, max_iterations: int = 50, title_max_chars: int = 80,
+                 max_chars: int = TELEGRAM_MESSAGE_LIMIT):
+        self.channel_username = channel_username
+        self.sentences_per_post = sentences_per_post
+        self.damping = damping
+        self.max_iterations = max_iterations
+        self.title_max_chars = title_max_chars
+        self.max_chars = max_chars
+
+    # --- עיבוד טקסט ---
+
+    @staticmethod
+    def _split_sentences(text: str) -> List[str]:
+        text = URL_RE.sub("", text)
+        return [s.strip() for s in SENTENCE_SPLIT_RE.split(text) if s and len(s.strip()) > 1]
+
+    @staticmethod
+    def _tokenize(sentence: str) -> List[str]:
+        words = WORD_RE.findall(NIQQUD_RE.sub("", sentence).lower())
+        return [w for w in words if w not in STOPWORDS and len(w) > 1]
+
+    def _shorten(self, text: str) -> str:
+        if len(text) <= self.title_max_chars:
+            return text
+        cut = text[:self.title_max_chars].rsplit(" ", 1)[0]
+        return f"{cut}…"
+
+    # --- דירוג ---
+
+    def _textrank_scores(self, tokenized: List[List[str]]) -> np.ndarray:
+        """מחזיר ציון TextRank לכל משפט, על בסיס דמיון קוסינוס בין וקטורי TF-IDF."""
+        n = len(tokenized)
+        if n == 0:
+            return np.zeros(0)
+
+        vocabulary: Dict[str, int] = {}
+        rows, cols = [], []
+        for i, tokens in enumerate(tokenized):
+            for token in tokens:
+                rows.append(i)
+                cols.append(vocabulary.setdefault(token, len(vocabulary)))
+        if not vocabulary:
+            return np.full(n, 1.0 / n)
+
+        tf = np.zeros((n, len(vocabulary)), dtype=np.float64)
+        np.add.at(tf, (np.array(rows), np.array(cols)), 1.0)
+
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+        tfidf = tf * idf
+        norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+        tfidf = np.divide(tfidf, norms, out=np.zeros_like(tfidf), where=norms > 0)
+
+        similarity = tfidf @ tfidf.T
+        np.fill_diagonal(similarity, 0.0)
+
+        # מטריצת מעברים: משפט ללא קשרים מפזר את המשקל שלו באופן אחיד
+        row_sums = similarity.sum(axis=1, keepdims=True)
+        transition = np.where(row_sums > 0, similarity / np.where(row_sums > 0, row_sums, 1.0), 1.0 / n)
+
+        scores = np.full(n, 1.0 / n)
+        for _ in range(self.max_iterations):
+            updated = (1.0 - self.damping) / n + self.damping * (transition.T @ scores)
+            if np.abs(updated - scores).sum() < 1e-6:
+                scores = updated
+                break
+            scores = updated
+        return scores
+
+    # --- בניית הסיכום ---
+
+    def _post_link(self, post: Dict) -> str:
+        message_id = post.get('message_id')
+        if not self.channel_username or not message_id:
+            return ""
+        return f'<a href="https://t.me/{self.channel_username}/{message_id}">לכל הפרטים בפוסט המלא</a>'
+
+    def summarize(self, posts: List[Dict]) -> str:
+        if not posts:
+            return "לא נמצאו פוסטים רלוונטיים לסיכום."
+
+        post_sentences = [self._split_sentences(post.get('text') or "") for post in posts]
+        flat = [(p, s) for p, sentences in enumerate(post_sentences) for s in range(len(sentences))]
+        scores = self._textrank_scores([self._tokenize(post_sentences[p][s]) for p, s in flat])
+
+        ranked_by_post: Dict[int, List[tuple]] = {}
+        for (p, s), score in zip(flat, scores):
+            ranked_by_post.setdefault(p, []).append((score, s))
+
+        # תקציב לפסקאות: המגבלה פחות הכותרת, הסיום והמפרידים שלהם, ושורה על פוסטים שהושמטו
+        budget = (self.max_chars - len(SUMMARY_HEADER) - len(SUMMARY_FOOTER) - 2 * len(PARAGRAPH_SEPARATOR)
+                  - len(PARAGRAPH_SEPARATOR) - len(self._omitted_line(len(posts))))
+        used = 0
+        paragraphs = []
+        omitted = 0
+        for p, post in enumerate(posts):
+            sentences = post_sentences[p]
+            if not sentences:
+                continue
+
+            # משפט הפתיחה של הפוסט משמש ככותרת, ושאר המשפטים נבחרים לפי הדירוג
+            lead = sentences[0]
+            title = self._shorten(lead)
+            candidates = sorted((item for item in ranked_by_post.get(p, []) if item[1] != 0), reverse=True)
+            chosen = sorted(s for _, s in candidates[:self.sentences_per_post])
+            body_sentences = [sentences[s] for s in chosen]
+            if title != lead:
+                body_sentences.insert(0, lead)
+
+            emoji = PARAGRAPH_EMOJIS[len(paragraphs) % len(PARAGRAPH_EMOJIS)]
+            heading = f"{emoji} <b>{html.escape(title, quote=False)}</b>"
+            link = self._post_link(post)
+            lines = [heading]
+            if body_sentences:
+                lines.append(html.escape(" ".join(body_sentences), quote=False))
+            if link:
+                lines.append(link)
+            paragraph = "\n".join(lines)
+            separator = len(PARAGRAPH_SEPARATOR) if paragraphs else 0
+            if used + separator + len(paragraph) > budget:
+                # אין מקום לפסקה המלאה - כותרת וקישור בלבד
+                paragraph = "\n".join(line for line in (heading, link) if line)
+                if omitted or used + separator + len(paragraph) > budget:
+                    omitted += 1
+                    continue
+            paragraphs.append(paragraph)
+            used += separator + len(paragraph)
+
+        if not paragraphs:
+            return "לא נמצאו פוסטים רלוונטיים לסיכום."
+
+        if omitted:
+            logger.info(f"Extractive summary reached {self.max_chars} characters. {omitted} posts were left out.")
+            paragraphs.append(self._omitted_line(omitted))
+        body = PARAGRAPH_SEPARATOR.join(paragraphs)
+        return f"{SUMMARY_HEADER}{PARAGRAPH_SEPARATOR}{body}{PARAGRAPH_SEPARATOR}{SUMMARY_FOOTER}"
+
+    @staticmethod
+    def _omitted_line(count: int) -> str:
+        return f"➕ ועוד {count} פוסטים נוספים בערוץ השבוע."
+
+
+SUMMARIZERS = {
+    ExtractiveSummarizer.name: ExtractiveSummarizer,
+}
+
+
+def create_summarizer(name: Optional[str], **kwargs) -> Optional[Summarizer]:
+    """יצירת מנוע סיכום לפי שם. מחזיר None אם המנוע כובה ('none' או ריק)."""
+    if not name or name.strip().lower() in ("none", "off", "false"):
+        return None
+    engine_cls = SUMMARIZERS.get(name.strip().lower())
+    if engine_cls is None:
+        logger.warning(f"Unknown summarizer engine '{name}'. Falling back to '{ExtractiveSummarizer.name}'.")
+        engine_cls = ExtractiveSummarizer
+    return engine_cls(**kwargs)
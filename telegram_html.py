@@ -0,0 +1,324 @@
+"""
+מאמת ומתקן HTML עבור תת-הקבוצה שטלגרם תומך בה (parse_mode=HTML), במעבר יחיד על הטקסט.
+ממיר שאריות Markdown (**, __, `, ```, [טקסט](קישור), # כותרות), מאזן וסוגר תגיות, מסלק תגיות
+לא נתמכות, מחליף < ו-& בודדים בישויות ומאמת קישורי href - כדי ששליחת הסיכום לא תיכשל בגלל פלט של GPT.
+
+הרצת הקובץ ישירות מודדת את זמן התיקון של סיכום ארוך:  python telegram_html.py
+קורפוס ה-fuzz רץ כבדיקה ב-tests/test_telegram_html.py.
+"""
+import re
+import html
+import bisect
+from typing import List, Optional, Tuple
+
+# תגיות נתמכות -> השם הקנוני שלהן בטלגרם
+TAG_ALIASES = {
+    "b": "b", "strong": "b",
+    "i": "i", "em": "i",
+    "u": "u", "ins": "u",
+    "s": "s", "strike": "s", "del": "s",
+    "a": "a", "code": "code", "pre": "pre",
+    "tg-spoiler": "tg-spoiler", "span": "span",
+    "blockquote": "blockquote", "tg-emoji": "tg-emoji",
+}
+# תגיות HTML נפוצות שאינן נתמכות אך יש להן תרגום טקסטואלי סביר
+BLOCK_TAGS = {"p", "div", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr"}
+SAFE_ENTITIES = {"lt", "gt", "amp", "quot"}
+ALLOWED_SCHEMES = ("http://", "https://", "tg://", "mailto:")
+
+# תווים שיכולים לפתוח אסימון. הסריקה מדלגת ביניהם במהירות, ורק בהם מנסים להתאים אסימון מלא
+# ** ו-__ מסמנים הדגשה רק בגבול מילה: סימן פותח אחרי רווח או תחילת טקסט ולפני תו שאינו רווח,
+# וסימן סוגר אחרי תו שאינו רווח ולפני רווח, פיסוק או סוף הטקסט. כך obj.__init__ ו-2**10 נשארים כמו שהם
+BOLD_OPEN = r"""(?<![^\s(\[{"'>-])(?:\*\*|__)(?=\S)"""
+BOLD_CLOSE = r"""(?<=\S)(?:\*\*|__)(?![^\s.,:;!?)\]}"'<-])"""
+BOLD_OPEN_RE = re.compile(BOLD_OPEN)
+BOLD_CLOSE_RE = re.compile(BOLD_CLOSE)
+CANDIDATE_RE = re.compile(r"[<>&`\[*_#]")
+CODE_CANDIDATE_RE = re.compile(r"[<>&]")
+TOKEN_RE = re.compile(
+    r"(?P<fence>```[^\n`]*\n?(?P<fence_body>.*?)(?:```|\Z))"
+    r"|(?P<icode>`(?P<icode_body>[^`\n<>&]+)`)"
+    r"|(?P<tag><(?P<close>/?)(?P<name>[a-zA-Z][a-zA-Z0-9-]*)(?P<attrs>(?:\s[^<>]*?)?)\s*/?>)"
+    r"|(?P<entity>&(?P<entity_body>#\d{1,7}|#[xX][0-9a-fA-F]{1,6}|[a-zA-Z]{2,8});)"
+    r"|(?P<mdlink>\[(?P<link_text>[^\[\]\n]+)\]\((?P<link_url>[^()\s]+)\))"
+    r"|(?P<heading>^#{1,6}[ \t]+(?P<heading_body>[^\n]*))"
+    r"|(?P<bullet>^\*[ \t]+)"
+    r"|(?P<bold>" + BOLD_OPEN + "|" + BOLD_CLOSE + ")"
+    r"|(?P<stray>[<>&])",
+    re.DOTALL | re.MULTILINE
+)
+# בתוך code/pre לא ממירים Markdown - מזהים רק תגיות, ישויות ותווים בודדים
+CODE_TOKEN_RE = re.compile(
+    r"(?P<tag><(?P<close>/?)(?P<name>[a-zA-Z][a-zA-Z0-9-]*)(?P<attrs>(?:\s[^<>]*?)?)\s*/?>)"
+    r"|(?P<entity>&(?P<entity_body>#\d{1,7}|#[xX][0-9a-fA-F]{1,6}|[a-zA-Z]{2,8});)"
+    r"|(?P<stray>[<>&])"
+)
+ATTR_RE = re.compile(r"""([a-zA-Z-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+STRAY_ESCAPES = {"<": "&lt;", ">": "&gt;", "&": "&amp;"}
+
+
+def _parse_attrs(raw: str) -> dict:
+    attrs = {}
+    for match in ATTR_RE.finditer(raw or ""):
+        value = next((group for group in match.groups()[1:] if group is not None), "")
+        attrs[match.group(1).lower()] = html.unescape(value)
+    return attrs
+
+
+def sanitize_href(url: Optional[str]) -> Optional[str]:
+    """מחזיר קישור מוכן לשימוש בתכונת href, או None אם הקישור לא תקין."""
+    if not url:
+        return None
+    url = url.strip()
+    if not url.lower().startswith(ALLOWED_SCHEMES) or any(ch in url for ch in ' \t\n"<>'):
+        return None
+    return html.escape(url, quote=True)
+
+
+class _Repairer:
+    def __init__(self, text: str):
+        self.text = text
+        self.out: List[str] = []
+        # מחסנית של (שם קנוני, תגית פתיחה מלאה, מקור) - המקור הוא 'html' או סימן ה-Markdown שפתח אותה
+        self.stack: List[Tuple[str, str, str]] = []
+        self.code_depth = 0
+        # ספירת תגיות פתיחה שסולקו (למשל <a> בתוך <a>), כדי לסלק גם את תגית הסגירה המתאימה
+        self.dropped = {}
+        # מיקומי הסימנים שיכולים לסגור הדגשה - סימן פותח בלי סוגר אחריו מסולק
+        self.bold_closers = {"**": [], "__": []}
+        for match in BOLD_CLOSE_RE.finditer(text):
+            self.bold_closers[match.group(0)].append(match.start())
+
+    # --- ניהול המחסנית ---
+
+    def _in_code(self) -> bool:
+        return self.code_depth > 0
+
+    def _open(self, name: str, open_tag: str, source: str = "html"):
+        self.out.append(open_tag)
+        self.stack.append((name, open_tag, source))
+        if name in ("code", "pre"):
+            self.code_depth += 1
+
+    def _close_to(self, index: int):
+        """סגירת התגית במיקום index במחסנית. תגיות שנפתחו אחריה נסגרות ונפתחות מחדש כדי לשמור על קינון תקין."""
+        reopen = self.stack[index + 1:]
+        for name, _, _ in reversed(self.stack[index:]):
+            self.out.append(f"</{name}>")
+            if name in ("code", "pre"):
+                self.code_depth -= 1
+        del self.stack[index:]
+        for name, open_tag, source in reopen:
+            self._open(name, open_tag, source)
+
+    def _find(self, name: str, source: Optional[str] = None) -> int:
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == name and (source is None or self.stack[index][2] == source):
+                return index
+        return -1
+
+    # --- טיפול בתגיות HTML ---
+
+    def _handle_tag(self, match):
+        raw_name = match.group("name").lower()
+        closing = bool(match.group("close"))
+
+        if self._in_code():
+            # בתוך code/pre מותרות רק סגירת התגית הפתוחה ו-<code> ישירות בתוך <pre>
+            top = self.stack[-1][0]
+            name = TAG_ALIASES.get(raw_name)
+            if closing and name == top:
+                self._close_to(len(self.stack) - 1)
+            elif not closing and name == "code" and top == "pre":
+                self._open_tag(name, match.group("attrs"))
+            else:
+                self.out.append(html.escape(match.group(0), quote=False))
+            return
+
+        if raw_name in BLOCK_TAGS:
+            if raw_name in ("br", "hr") or (closing and raw_name in ("p", "div", "li")):
+                self.out.append("\n")
+            elif raw_name.startswith("h"):
+                if closing:
+                    index = self._find("b", source="heading-tag")
+                    if index >= 0:
+                        self._close_to(index)
+                    self.out.append("\n")
+                else:
+                    self._open("b", "<b>", "heading-tag")
+            elif raw_name == "li" and not closing:
+                self.out.append("• ")
+            return
+
+        name = TAG_ALIASES.get(raw_name)
+        if name is None:
+            return  # תגית לא נתמכת - מסולקת, התוכן שלה נשמר
+
+        if closing:
+            if self.dropped.get(name):
+                self.dropped[name] -= 1
+                return
+            index = self._find(name)
+            if index >= 0:
+                self._close_to(index)
+            return
+
+        self._open_tag(name, match.group("attrs"))
+
+    def _open_tag(self, name: str, raw_attrs: str):
+        attrs = _parse_attrs(raw_attrs)
+        if name in ("a", "pre", "code") and self._find(name) >= 0:
+            # טלגרם לא מאפשר קינון של קישור בתוך קישור או קוד בתוך קוד
+            self.dropped[name] = self.dropped.get(name, 0) + 1
+            return
+
+        if name == "a":
+            href = sanitize_href(attrs.get("href"))
+            if href is None:
+                self.dropped["a"] = self.dropped.get("a", 0) + 1
+                return
+            open_tag = f'<a href="{href}">'
+        elif name == "span":
+            if attrs.get("class") != "tg-spoiler":
+                self.dropped["span"] = self.dropped.get("span", 0) + 1
+                return
+            open_tag = '<span class="tg-spoiler">'
+        elif name == "code" and attrs.get("class", "").startswith("language-"):
+            open_tag = f'<code class="{html.escape(attrs["class"], quote=True)}">'
+        elif name == "blockquote" and "expandable" in (raw_attrs or ""):
+            open_tag = "<blockquote expandable>"
+        elif name == "tg-emoji":
+            emoji_id = attrs.get("emoji-id", "")
+            if not emoji_id.isdigit():
+                self.dropped["tg-emoji"] = self.dropped.get("tg-emoji", 0) + 1
+                return
+            open_tag = f'<tg-emoji emoji-id="{emoji_id}">'
+        else:
+            open_tag = f"<{name}>"
+        self._open(name, open_tag)
+
+    # --- טיפול בשאריות Markdown ---
+
+    def _handle_bold(self, match):
+        marker, start = match.group(0), match.start()
+        index = self._find("b", source=marker)
+        if index >= 0 and BOLD_CLOSE_RE.match(self.text, start):
+            self._close_to(index)
+        elif BOLD_OPEN_RE.match(self.text, start):
+            closers = self.bold_closers[marker]
+            if bisect.bisect_right(closers, start) < len(closers):
+                self._open("b", "<b>", marker)
+            # סימן פותח ללא סימן סוגר בהמשך - מסולק
+        else:
+            # סימן סוגר בלי הדגשה פתוחה (למשל בסוף obj.__init__) הוא חלק מהטקסט
+            self.out.append(marker)
+
+    def _handle_link(self, match):
+        text = html.escape(match.group("link_text"), quote=False)
+        href = sanitize_href(match.group("link_url"))
+        if href is None or self._find("a") >= 0:
+            self.out.append(text)
+        else:
+            self.out.append(f'<a href="{href}">{text}</a>')
+
+    # --- מעבר יחיד ---
+
+    def run(self) -> str:
+        text = self.text
+        position = 0
+        while True:
+            in_code = self._in_code()
+            candidate = (CODE_CANDIDATE_RE if in_code else CANDIDATE_RE).search(text, position)
+            if candidate is None:
+                break
+            match = (CODE_TOKEN_RE if in_code else TOKEN_RE).match(text, candidate.start())
+            if match is None:
+                # תו כמו * או _ בודד - נשאר כטקסט רגיל
+                self.out.append(text[position:candidate.end()])
+                position = candidate.end()
+                continue
+            self.out.append(text[position:match.start()])
+            position = match.end()
+            kind = match.lastgroup
+
+            if kind == "fence":
+                language = match.group(0)[3:].split("\n", 1)[0].strip()
+                body = html.escape(match.group("fence_body").rstrip("\n"), quote=False)
+                code_class = f' class="language-{html.escape(language, quote=True)}"' if language.isidentifier() else ""
+                self.out.append(f"<pre><code{code_class}>{body}</code></pre>")
+            elif kind == "icode":
+                self.out.append(f"<code>{html.escape(match.group('icode_body'), quote=False)}</code>")
+            elif kind == "tag":
+                self._handle_tag(match)
+            elif kind == "entity":
+                body = match.group("entity_body")
+                self.out.append(match.group(0) if body.startswith("#") or body in SAFE_ENTITIES else "&amp;" + match.group(0)[1:])
+            elif kind == "mdlink":
+                self._handle_link(match)
+            elif kind == "heading":
+                self.out.append(f"<b>{repair_telegram_html(match.group('heading_body'))}</b>")
+            elif kind == "bullet":
+                self.out.append("• ")
+            elif kind == "bold":
+                self._handle_bold(match)
+            else:
+                self.out.append(STRAY_ESCAPES[match.group(0)])
+
+        self.out.append(text[position:])
+        # סגירת כל התגיות שנשארו פתוחות
+        for name, _, _ in reversed(self.stack):
+            self.out.append(f"</{name}>")
+        return "".join(self.out)
+
+
+def repair_telegram_html(text: str) -> str:
+    """מחזיר גרסה של הטקסט שטלגרם יקבל ב-parse_mode=HTML."""
+    if not text:
+        return text
+    return _Repairer(text).run()
+
+
+VALIDATION_RE = re.compile(r"<(/?)([a-z-]+)([^<>]*)>|&(#\d+|#x[0-9a-fA-F]+|[a-z]+);|[<>&]")
+
+
+def is_valid_telegram_html(text: str) -> bool:
+    """בדיקה מחמירה: רק תגיות נתמכות, מקוננות ומאוזנות, וללא < > & בודדים."""
+    stack = []
+    for match in VALIDATION_RE.finditer(text or ""):
+        token = match.group(0)
+        if token in "<>&":
+            return False
+        if token.startswith("&"):
+            body = match.group(4)
+            if not (body.startswith("#") or body in SAFE_ENTITIES):
+                return False
+            continue
+        closing, name = match.group(1), match.group(2)
+        if TAG_ALIASES.get(name) != name:
+            return False
+        if closing:
+            if not stack or stack.pop() != name:
+                return False
+        else:
+            if name in ("a", "code", "pre") and name in stack and not (name == "code" and stack[-1] == "pre"):
+                return False
+            stack.append(name)
+    return not stack
+
+
+BENCHMARK_SUMMARY = ("<b>אז מה היה לנו השבוע? 🔥</b>\n\n📱 **Gemini** חדש <i>לאנדרואיד</i> & עוד.\n"
+                     "<a href=\"https://t.me/AndroidAndAI/1\">לכל הפרטים</a>\n\n") * 120
+
+
+def benchmark(rounds: int = 200) -> float:
+    """זמן ממוצע (בשניות) לתיקון סיכום של כ-15 אלף תווים עם שאריות Markdown."""
+    import time
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        repair_telegram_html(BENCHMARK_SUMMARY)
+    return (time.perf_counter() - started) / rounds
+
+
+if __name__ == "__main__":
+    print(f"Repair of {len(BENCHMARK_SUMMARY)} chars: {benchmark() * 1000:.2f}ms per call")
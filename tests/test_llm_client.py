@@ -0,0 +1,165 @@
+import time
+import asyncio
+
+import pytest
+
+from llm_client import (
+    CircuitBreaker, CircuitOpenError, LLMError, LocalStubProvider, ResilientLLMClient,
+)
+
+MESSAGES = [{"role": "system", "content": "הנחיות קבועות"}, {"role": "user", "content": "פוסטים"}]
+
+
+def make_client(provider, **kwargs):
+    options = dict(model="primary", attempt_timeout=1.0, total_deadline=5.0, max_retries=3,
+                   backoff_base=0.01, backoff_cap=0.02, breaker=CircuitBreaker(failure_threshold=10))
+    options.update(kwargs)
+    return ResilientLLMClient(provider, **options)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_retries_retryable_errors_until_success():
+    provider = LocalStubProvider(script=["500", "429", "ok"])
+    client = make_client(provider)
+    result = run(client.complete(MESSAGES))
+    assert result.attempts == 3
+    assert [call["mode"] for call in provider.calls] == ["500", "429", "ok"]
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.breaker.failures == 0
+
+
+def test_non_retryable_error_is_raised_immediately():
+    provider = LocalStubProvider(script=["error"])
+    client = make_client(provider)
+    with pytest.raises(LLMError) as excinfo:
+        run(client.complete(MESSAGES))
+    assert excinfo.value.status_code == 400
+    assert len(provider.calls) == 1
+    # שגיאת בקשה אינה נספרת ככשל של הספק
+    assert client.breaker.failures == 0
+
+
+def test_retries_are_exhausted():
+    provider = LocalStubProvider(default_mode="503")
+    client = make_client(provider, max_retries=2)
+    with pytest.raises(LLMError) as excinfo:
+        run(client.complete(MESSAGES))
+    assert excinfo.value.status_code == 503
+    assert len(provider.calls) == 3
+
+
+def test_hang_is_cut_by_attempt_timeout_and_total_deadline():
+    provider = LocalStubProvider(default_mode="hang")
+    client = make_client(provider, attempt_timeout=0.2, total_deadline=0.5, max_retries=10)
+    started = time.monotonic()
+    with pytest.raises(LLMError):
+        run(client.complete(MESSAGES))
+    elapsed = time.monotonic() - started
+    assert elapsed < 0.9
+    assert 2 <= len(provider.calls) <= 3
+
+
+def test_slow_primary_is_hedged_to_fast_fallback():
+    provider = LocalStubProvider(per_model={"primary": ["slow:0.6"]})
+    client = make_client(provider, fallback_model="fast", hedge_after=0.1, attempt_timeout=2.0)
+
+    async def timed():
+        # נמדד בתוך הלולאה: asyncio.run ממתין בסיום גם ל-thread של הבקשה האיטית שבוטלה
+        started = time.monotonic()
+        result = await client.complete(MESSAGES)
+        return result, time.monotonic() - started
+
+    result, elapsed = run(timed())
+    assert elapsed < 0.5
+    assert result.hedged
+    assert result.model == "fast"
+
+
+def test_fast_primary_is_not_hedged():
+    provider = LocalStubProvider()
+    client = make_client(provider, fallback_model="fast", hedge_after=0.3)
+    result = run(client.complete(MESSAGES))
+    assert not result.hedged
+    assert result.model == "primary"
+    assert [call["model"] for call in provider.calls] == ["primary"]
+
+
+def test_breaker_opens_then_half_open_trial_closes_it():
+    provider = LocalStubProvider(script=["500", "500"])
+    client = make_client(provider, max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            run(client.complete(MESSAGES))
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        run(client.complete(MESSAGES))
+    assert len(provider.calls) == 2
+
+    time.sleep(0.25)
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    run(client.complete(MESSAGES))
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_failed_trial_reopens_and_allows_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    time.sleep(0.15)
+    assert breaker.allow_request()
+    # רק בקשת ניסיון אחת במצב half-open
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_cancelled_half_open_trial_is_released():
+    provider = LocalStubProvider(script=["500", "slow:0.3"])
+    client = make_client(provider, max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+    with pytest.raises(LLMError):
+        run(client.complete(MESSAGES))
+    time.sleep(0.15)
+
+    async def cancel_trial():
+        task = asyncio.create_task(client.complete(MESSAGES))
+        await asyncio.sleep(0.05)
+        assert not client.breaker.allow_request()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(cancel_trial())
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    # הניסיון שבוטל לא תופס את ה-half-open - הבקשה הבאה יוצאת וסוגרת את המפסק
+    run(client.complete(MESSAGES))
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_unexpected_provider_exception_counts_as_failure():
+    class BrokenProvider:
+        def complete(self, model, messages, timeout, **params):
+            raise ValueError("unexpected response shape")
+
+    client = make_client(BrokenProvider(), breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+    with pytest.raises(ValueError):
+        run(client.complete(MESSAGES))
+    assert client.breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.15)
+    with pytest.raises(ValueError):
+        run(client.complete(MESSAGES))
+    # הניסיון שנכשל שוחרר ופתח מחדש את המפסק
+    assert client.breaker.state == CircuitBreaker.OPEN
+    assert not client.breaker._trial_in_flight
+
+
+def test_stub_simulates_prefix_cache_and_multiple_choices():
+    provider = LocalStubProvider()
+    first = provider.complete("primary", MESSAGES, timeout=1.0)
+    second = provider.complete("primary", MESSAGES, timeout=1.0, n=3)
+    assert first.cached_tokens == 0
+    assert second.cached_tokens > 0
+    assert len(second.texts) == 3
@@ -0,0 +1,13 @@
+from load_replay import UpdateRecorder, load_recorded_updates, synthetic_updates, update_kind
+
+
+def test_recorder_writes_in_background_and_round_trips(tmp_path):
+    path = tmp_path / "updates.jsonl"
+    updates = synthetic_updates(6, "AndroidAndAI", admin_id=1, kinds=("channel_post", "forward", "callback"))
+    recorder = UpdateRecorder(str(path))
+    for data in updates:
+        recorder.record(data)
+    recorder.close()
+
+    assert load_recorded_updates(str(path)) == updates
+    assert [update_kind(data) for data in updates] == ["channel_post", "forward", "callback"] * 2
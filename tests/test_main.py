@@ -0,0 +1,413 @@
+import os
+import runpy
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+import schedule
+
+os.environ["SAMMERY_AUTOSTART"] = "false"
+
+import main  # noqa: E402
+
+# הבדיקות לא מדווחות פעילות למסד הניטור של הפרודקשן
+main.reporter.connected = False
+
+
+class FakeTelegram:
+    """מחליף את application.bot: שומר את ההודעות במקום לשלוח אותן."""
+
+    def __init__(self):
+        self.messages = []
+        self.delay = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.messages.append({'chat_id': chat_id, 'text': text})
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        self.messages.append({'chat_id': chat_id, 'text': caption})
+
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = FakeTelegram()
+        self.updater = None
+        self.running = False
+        self.shut_down = False
+
+    async def shutdown(self):
+        self.shut_down = True
+
+
+@pytest.fixture
+def make_bot(tmp_path, monkeypatch):
+    """יוצר בוט עם SQLite זמני וספק LLM מקומי. יש לקרוא לו מתוך קורוטינה (הבוט שומר את ה-event loop)."""
+    bots = []
+
+    def factory(**env):
+        values = {
+            'TELEGRAM_BOT_TOKEN': '123:abc',
+            'ADMIN_CHAT_ID': '1',
+            'LLM_PROVIDER': 'stub',
+            'STORAGE_BACKEND': 'sqlite',
+            'SQLITE_PATH': str(tmp_path / "bot.db"),
+            'LLM_ATTEMPT_TIMEOUT_SECONDS': '1',
+            'LLM_MAX_RETRIES': '0',
+        }
+        values.update(env)
+        for name, value in values.items():
+            monkeypatch.setenv(name, value)
+        bot = main.TelegramSummaryBot()
+        bot.application = FakeApplication()
+        bots.append(bot)
+        return bot
+
+    yield factory
+    for bot in bots:
+        bot.storage.close()
+    schedule.clear()
+
+
+def add_posts(bot, count):
+    now = datetime.now(timezone.utc)
+    for i in range(count):
+        bot.storage.insert_post({'message_id': i + 1, 'date': now - timedelta(hours=i + 1),
+                                 'text': f"עדכון חדש לאנדרואיד מספר {i}. פרטים נוספים בפוסט."})
+
+
+def test_fallback_summary_is_attributed_to_the_local_engine(make_bot):
+    async def scenario():
+        bot = make_bot(LLM_STUB_SCRIPT='error')
+        add_posts(bot, 3)
+        posts = await bot.get_channel_posts()
+
+        summaries = await bot.create_summary_candidates(posts)
+        assert bot.last_summary_engine == "extractive"
+        assert "t.me/AndroidAndAI/1" in summaries[0]
+        assert "extractive" in bot._engine_notice()
+
+        await bot.create_summary_candidates(posts)
+        assert bot.last_summary_engine == main.LLM_SUMMARY_ENGINE
+        assert bot._engine_notice() == ""
+
+    asyncio.run(scenario())
+
+
+def test_auto_publish_notification_names_the_fallback_engine(make_bot):
+    async def scenario():
+        bot = make_bot(LLM_STUB_SCRIPT='error', RETAIN_POSTS='true')
+        add_posts(bot, 2)
+        bot.auto_publish_enabled = True
+
+        await bot.scheduled_summary()
+        channel, admin = bot.application.bot.messages
+        assert channel['chat_id'] == "@AndroidAndAI"
+        assert admin['text'].startswith("✅ הסיכום השבועי פורסם אוטומטית בהצלחה!")
+        assert "במנוע המקומי (extractive)" in admin['text']
+
+    asyncio.run(scenario())
+
+
+def test_publish_clears_published_posts_in_the_background(make_bot):
+    async def scenario():
+        bot = make_bot()
+        add_posts(bot, 3)
+        bot.pending_summary = "<b>סיכום</b>"
+
+        assert await bot.publish_summary()
+        assert not bot.publish_lock.locked()
+        # פוסט שנקלט אחרי הפרסום נשאר לסיכום הבא
+        bot.storage.insert_post({'message_id': 99, 'date': datetime.now(timezone.utc), 'text': "פוסט חדש"})
+        await bot._post_publish_task
+
+        remaining = bot.storage.posts_between(datetime.now(timezone.utc) - timedelta(days=7))
+        assert [post['message_id'] for post in remaining] == [99]
+        assert bot.storage.get_state(main.POSTS_CLEARED_KEY)
+        assert bot.storage.get_stats('bot')['stored_posts'] == 1
+        # בלי סיכומי חלון זמן לא נבנים תקצירים לפני המחיקה
+        assert bot.llm_client.provider.calls == []
+
+    asyncio.run(scenario())
+
+
+def test_daily_rollups_are_cached_before_clearing_once_windows_are_used(make_bot):
+    async def scenario():
+        bot = make_bot()
+        posted = datetime.now(timezone.utc) - timedelta(days=2)
+        bot.storage.insert_post({'message_id': 1, 'date': posted, 'text': "עדכון אנדרואיד"})
+        bot.storage.set_state(main.ROLLUPS_USED_KEY, {'at': posted.isoformat()})
+        bot.pending_summary = "<b>סיכום</b>"
+
+        assert await bot.publish_summary()
+        day = posted.astimezone(bot.israel_tz).date()
+        assert bot.storage.get_rollup(bot.rollups._cache_key(main.LEVEL_DAY, day)) is None
+        await bot._post_publish_task
+
+        assert bot.storage.get_rollup(bot.rollups._cache_key(main.LEVEL_DAY, day))
+        assert bot.storage.count_posts() == 0
+
+    asyncio.run(scenario())
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def reply_photo(self, photo, caption=None, **kwargs):
+        self.replies.append(caption)
+
+
+async def press(bot, data):
+    """לחיצה של האדמין על כפתור. מחזיר את ההודעות שנשלחו בתגובה."""
+    async def answer():
+        pass
+
+    message = FakeMessage()
+    query = SimpleNamespace(data=data, message=message, answer=answer)
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1), callback_query=query)
+    await bot.button_callback(update, None)
+    return message.replies
+
+
+async def generate(bot):
+    message = FakeMessage()
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=message)
+    await bot.generate_summary_command(update, SimpleNamespace(args=[]))
+    return message.replies
+
+
+def test_regenerate_cycles_through_candidates_and_prefetches_the_next_round(make_bot):
+    async def scenario():
+        bot = make_bot(SUMMARY_CANDIDATES='3')
+        add_posts(bot, 2)
+        provider = bot.llm_client.provider
+
+        await generate(bot)
+        first, second, third = bot.pending_summary, *bot.candidate_queue
+        assert len({first, second, third}) == 3
+        assert len(provider.calls) == 1
+
+        replies = await press(bot, "regenerate")
+        assert bot.pending_summary == second
+        assert "נותרו עוד 1" in replies[-1]
+        assert bot._prefetch_task is None
+
+        # המועמד האחרון המוכן מוצג - הסבב הבא מוכן ברקע
+        await press(bot, "regenerate")
+        assert bot.pending_summary == third
+        await bot._prefetch_task
+        assert len(bot.candidate_queue) == 3
+
+        await press(bot, "regenerate")
+        assert len(provider.calls) == 2
+        assert len(bot.candidate_queue) == 2
+
+    asyncio.run(scenario())
+
+
+def test_regenerate_waits_for_the_prefetch_in_flight(make_bot):
+    async def scenario():
+        bot = make_bot(SUMMARY_CANDIDATES='2', LLM_STUB_SCRIPT='ok,slow:0.3')
+        add_posts(bot, 2)
+        await generate(bot)
+        await press(bot, "regenerate")
+        assert bot._prefetch_task and not bot._prefetch_task.done()
+
+        replies = await press(bot, "regenerate")
+        assert replies[0].startswith("סיכומים חדשים כבר בהכנה")
+        assert replies[-1].startswith("סיכום חלופי מוכן")
+        # הלחיצה השתמשה בתוצאת ההכנה ברקע ולא שלחה בקשה נוספת
+        assert len(bot.llm_client.provider.calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_prefetched_candidates_are_discarded_when_the_draft_changes(make_bot):
+    async def scenario():
+        bot = make_bot(SUMMARY_CANDIDATES='2', LLM_STUB_SCRIPT='ok,slow:0.2')
+        add_posts(bot, 2)
+        await generate(bot)
+        await press(bot, "regenerate")
+        prefetch = bot._prefetch_task
+
+        bot._set_draft("<b>טיוטה אחרת</b>", window_days=3)
+        await prefetch
+        assert bot.candidate_queue == []
+        assert bot.storage.load_draft()['candidates'] == []
+
+    asyncio.run(scenario())
+
+
+def test_regenerate_falls_back_to_a_new_request_when_the_prefetch_is_cancelled(make_bot):
+    async def scenario():
+        bot = make_bot(SUMMARY_CANDIDATES='2', LLM_STUB_SCRIPT='ok,slow:0.3')
+        add_posts(bot, 2)
+        await generate(bot)
+        await press(bot, "regenerate")
+
+        pressed = asyncio.create_task(press(bot, "regenerate"))
+        await asyncio.sleep(0.05)
+        bot._cancel_prefetch()
+        replies = await pressed
+        assert "יוצר סיכום חדש... ⏳" in replies
+        assert replies[-1].startswith("סיכום חדש נוצר")
+        assert len(bot.llm_client.provider.calls) == 3
+
+    asyncio.run(scenario())
+
+
+def batch_bot(make_bot, outcome, **env):
+    return make_bot(LLM_STUB_BATCH_OUTCOME=outcome, LLM_STUB_BATCH_READY_SECONDS='0',
+                    SUMMARY_BATCH_POLL_SECONDS='0.01', SUMMARY_BATCH_LEAD_HOURS='2', **env)
+
+
+def test_completed_batch_is_used_by_the_scheduled_run(make_bot):
+    async def scenario():
+        bot = batch_bot(make_bot, 'completed', SUMMARY_CANDIDATES='2')
+        add_posts(bot, 2)
+        await bot.submit_summary_batch()
+        await bot._batch_poll_task
+        assert bot.storage.get_state(main.BATCH_STATE_KEY)['status'] == main.STATE_COMPLETED
+
+        await bot.scheduled_summary()
+        assert "במצב batch" in bot.pending_summary
+        assert len(bot.candidate_queue) == 1
+        assert bot.llm_client.provider.calls == []
+        assert bot.storage.get_state(main.BATCH_STATE_KEY) is None
+        assert bot.application.bot.messages[-1]['text'].startswith("סיכום שבועי אוטומטי מוכן!")
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_falls_back_to_the_live_path(make_bot):
+    async def scenario():
+        bot = batch_bot(make_bot, 'failed')
+        add_posts(bot, 2)
+        await bot.submit_summary_batch()
+        await bot._batch_poll_task
+        job = bot.storage.get_state(main.BATCH_STATE_KEY)
+        assert (job['status'], job['error']) == ("failed", "Stub batch failed")
+
+        await bot.scheduled_summary()
+        assert "במצב batch" not in bot.pending_summary
+        assert len(bot.llm_client.provider.calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_batch_still_pending_at_the_deadline_is_cancelled(make_bot):
+    async def scenario():
+        bot = batch_bot(make_bot, 'pending')
+        add_posts(bot, 2)
+        await bot.submit_summary_batch()
+        batch_id = bot.storage.get_state(main.BATCH_STATE_KEY)['batch_id']
+        poller = bot._batch_poll_task
+        await asyncio.sleep(0.05)
+        assert not poller.done()
+
+        assert await bot._take_batch_summaries() is None
+        await asyncio.sleep(0)
+        assert poller.cancelled()
+        assert bot.batch_provider.jobs[batch_id]['cancelled']
+        assert bot.storage.get_state(main.BATCH_STATE_KEY) is None
+
+    asyncio.run(scenario())
+
+
+def test_stale_batch_results_are_ignored(make_bot):
+    async def scenario():
+        bot = batch_bot(make_bot, 'completed')
+        add_posts(bot, 2)
+        await bot.submit_summary_batch()
+        await bot._batch_poll_task
+        # תוצאה ממועד שהוחמץ (למשל כשהבוט היה כבוי) לא נכנסת לסיכום של השבוע הזה
+        job = bot.storage.get_state(main.BATCH_STATE_KEY)
+        job['submitted_at'] = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+        bot.storage.set_state(main.BATCH_STATE_KEY, job)
+
+        assert await bot._take_batch_summaries() is None
+        assert bot.storage.get_state(main.BATCH_STATE_KEY) is None
+        # ואותה תוצאה לא נלקחת פעמיים
+        assert await bot._take_batch_summaries() is None
+
+    asyncio.run(scenario())
+
+
+def channel_update(message_id, date, text):
+    return SimpleNamespace(channel_post=SimpleNamespace(message_id=message_id, date=date, text=text, caption=None))
+
+
+def forward_update(message_id, date, text, channel="AndroidAndAI"):
+    origin = SimpleNamespace(chat=SimpleNamespace(username=channel), message_id=message_id, date=date)
+    message = FakeMessage()
+    message.forward_origin, message.text, message.caption = origin, text, None
+    return SimpleNamespace(effective_user=SimpleNamespace(id=1), message=message)
+
+
+def test_ingest_updates_counters_and_stats_histogram(make_bot):
+    async def scenario():
+        bot = make_bot()
+        now = datetime.now(timezone.utc)
+        await bot.handle_new_channel_post(channel_update(1, now, "א" * 100), None)
+        await bot.handle_new_channel_post(channel_update(2, now - timedelta(days=1), "ב" * 50), None)
+        await bot.handle_forwarded_post(forward_update(3, now - timedelta(days=1), "ג" * 30), None)
+        await bot.handle_forwarded_post(forward_update(3, now - timedelta(days=1), "ג" * 30), None)
+
+        stats = bot.storage.get_stats('bot')
+        assert stats['ingest'] == {'total': 3, 'channel': 2, 'backfill': 1, 'forwards': 2,
+                                   'duplicates': 1, 'chars': 180}
+        assert stats['stored_posts'] == 3
+        today = now.astimezone(bot.israel_tz)
+        yesterday = (now - timedelta(days=1)).astimezone(bot.israel_tz)
+        assert stats['per_day'][today.strftime('%Y-%m-%d')] == 1
+        assert stats['per_day'][yesterday.strftime('%Y-%m-%d')] == 2
+        assert sum(stats['per_hour'].values()) == 3
+        assert len(bot.search_index) == 3
+
+        message = FakeMessage()
+        await bot.show_stats(SimpleNamespace(effective_user=SimpleNamespace(id=1), message=message), None)
+        text = message.replies[0]
+        assert "פוסטים שנקלטו: 3 (מהערוץ: 2, מילוי לאחור: 1)" in text
+        assert "הודעות מועברות: 2 (כפולות: 1)" in text
+        assert "אורך פוסט ממוצע: 60 תווים" in text
+        rows = text.split("<pre>")[1].split("</pre>")[0].split("\n")
+        assert len(rows) == 7
+        # היום האחרון בהיסטוגרמה הוא היום, והיום שלפניו הוא השיא
+        assert rows[-1].startswith(f"{today.strftime('%d/%m')}", 2) and rows[-1].endswith(" 1")
+        assert rows[-2].endswith(f"{'▇' * 10} 2")
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_waits_for_an_in_flight_publish_and_cancels_the_prefetch(make_bot):
+    async def scenario():
+        bot = make_bot(RETAIN_POSTS='true', SHUTDOWN_TIMEOUT_SECONDS='5')
+        bot.pending_summary = "<b>סיכום</b>"
+        bot.application.bot.delay = 0.3
+        publishing = asyncio.create_task(bot.publish_summary())
+        prefetch = asyncio.create_task(asyncio.sleep(10))
+        bot._prefetch_task = prefetch
+        await asyncio.sleep(0.05)
+        assert bot.publish_lock.locked()
+
+        await bot.shutdown()
+        assert publishing.done() and publishing.result() is True
+        assert bot.application.bot.messages[0]['chat_id'] == "@AndroidAndAI"
+        await asyncio.sleep(0)
+        assert prefetch.cancelled()
+        assert bot.application.shut_down
+        assert bot._scheduler_stop.is_set()
+
+    asyncio.run(scenario())
+
+
+def test_gunicorn_waits_for_the_bot_but_exits_before_render_kills_it(monkeypatch):
+    monkeypatch.delenv('SHUTDOWN_TIMEOUT_SECONDS', raising=False)
+    graceful_timeout = runpy.run_path(os.path.join(os.path.dirname(main.__file__), "gunicorn.conf.py"))['graceful_timeout']
+    # shutdown_bot ממתין עד SHUTDOWN_TIMEOUT_SECONDS (15) ועוד 5 שניות, ו-Render הורג אחרי 30
+    assert 15 + 5 < graceful_timeout < 30
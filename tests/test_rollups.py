@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytz
+
+from rollups import LEVEL_DAY, LEVEL_WEEK, RollupEngine, parse_window, plan_units
+from storage import SQLiteStorage
+
+TZ = pytz.timezone('Asia/Jerusalem')
+
+
+class Channel:
+    """פוסטים בזיכרון עם מחיקה כמו אחרי פרסום, ורישום הקריאות למנוע הסיכום."""
+
+    def __init__(self):
+        self.posts = []
+        self.cleared_at = None
+        self.summaries = []
+
+    async def fetch(self, start, end):
+        return [post for post in self.posts if start <= post['date'] < end]
+
+    async def summarize(self, level, items):
+        self.summaries.append((level, len(items)))
+        return f"{level}:{len(items)}"
+
+    def clear(self):
+        self.posts = []
+        self.cleared_at = datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def store(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "rollups.db"))
+    yield storage
+    storage.close()
+
+
+def make_engine(store, channel):
+    return RollupEngine(store, fetch_posts=channel.fetch, summarize=channel.summarize, tz=TZ,
+                        cache_tag="t", history_start=lambda: channel.cleared_at)
+
+
+def local_noon(day):
+    return TZ.localize(datetime.combine(day, datetime.min.time()) + timedelta(hours=12)).astimezone(timezone.utc)
+
+
+def last_complete_week(engine):
+    """תחילת השבוע המיושר האחרון שהסתיים לפני היום."""
+    today = engine.today()
+    units = [unit for unit in plan_units(today - timedelta(days=20), today, today) if unit[0] == LEVEL_WEEK]
+    return units[-1][1]
+
+
+def test_parse_window():
+    assert parse_window("3d") == 3
+    assert parse_window("2w") == 14
+    assert parse_window("month") == 30
+    with pytest.raises(ValueError):
+        parse_window("500d")
+
+
+def test_completed_day_is_cached(store):
+    channel = Channel()
+    engine = make_engine(store, channel)
+    yesterday = engine.today() - timedelta(days=1)
+    channel.posts = [{'message_id': 1, 'date': local_noon(yesterday), 'text': 'a'}]
+
+    digest = asyncio.run(engine.get_digest(LEVEL_DAY, yesterday))
+    assert digest['post_count'] == 1 and not digest['partial']
+    asyncio.run(engine.get_digest(LEVEL_DAY, yesterday))
+    assert channel.summaries == [(LEVEL_DAY, 1)]
+
+
+def test_day_before_clear_is_partial_and_not_cached(store):
+    channel = Channel()
+    engine = make_engine(store, channel)
+    yesterday = engine.today() - timedelta(days=1)
+    channel.posts = [{'message_id': 1, 'date': local_noon(yesterday), 'text': 'a'}]
+    channel.clear()
+    channel.posts = [{'message_id': 2, 'date': local_noon(yesterday), 'text': 'b'}]
+    channel.cleared_at = local_noon(yesterday) - timedelta(hours=1)
+
+    digest = asyncio.run(engine.get_digest(LEVEL_DAY, yesterday))
+    assert digest['partial']
+    assert store.get_rollup(engine._cache_key(LEVEL_DAY, yesterday)) is None
+
+
+def test_week_with_missing_children_after_clear_is_not_cached(store):
+    channel = Channel()
+    engine = make_engine(store, channel)
+    week_start = last_complete_week(engine)
+    channel.posts = [{'message_id': i, 'date': local_noon(week_start + timedelta(days=i)), 'text': 'x'} for i in range(7)]
+    channel.clear()
+
+    digest = asyncio.run(engine.get_digest(LEVEL_WEEK, week_start))
+    assert digest is None
+    assert store.get_rollup(engine._cache_key(LEVEL_WEEK, week_start)) is None
+
+
+def test_days_cached_before_clear_keep_the_week_complete(store):
+    channel = Channel()
+    engine = make_engine(store, channel)
+    week_start = last_complete_week(engine)
+    channel.posts = [{'message_id': i, 'date': local_noon(week_start + timedelta(days=i)), 'text': 'x'} for i in range(7)]
+
+    asyncio.run(engine.cache_completed_days(week_start))
+    channel.clear()
+
+    digest = asyncio.run(engine.get_digest(LEVEL_WEEK, week_start))
+    assert digest['post_count'] == 7 and not digest['partial']
+    assert store.get_rollup(engine._cache_key(LEVEL_WEEK, week_start)) is not None
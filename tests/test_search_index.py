@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from search_index import SearchIndex, term_variants, tokenize
+
+NOW = datetime(2026, 3, 6, 12, 0, tzinfo=timezone.utc)
+
+
+def post(message_id, text, hours_ago=0, naive=False):
+    date = NOW - timedelta(hours=hours_ago)
+    return {'message_id': message_id, 'text': text, 'date': date.replace(tzinfo=None) if naive else date}
+
+
+def ids(page):
+    return [document['message_id'] for document in page]
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.rebuild([
+        post(1, "גוגל הכריזה על אנדרואיד 15 עם שיפורים בסוללה", hours_ago=30),
+        post(2, "אנדרואיד אנדרואיד אנדרואיד - כל מה שחדש באנדרואיד השבוע", hours_ago=20),
+        post(3, "OpenAI משיקה מודל חדש לתכנות", hours_ago=10),
+        post(4, "סקירה: המודלים של גוגל מול OpenAI בבינה מלאכותית", hours_ago=5),
+    ])
+    return index
+
+
+def test_normalization_strips_niqqud_and_final_letters():
+    assert tokenize("שָׁלוֹם Android") == ["שלומ", "android"]
+
+
+def test_term_variants_strip_up_to_two_prefix_letters():
+    assert term_variants("והאנדרואיד") == {"והאנדרואיד", "האנדרואיד", "אנדרואיד"}
+    # גזע קצר מדי לא נחתך
+    assert term_variants("של") == {"של"}
+
+
+def test_bm25_ranks_the_more_relevant_post_first(index):
+    total, page = index.search("אנדרואיד")
+    assert total == 2
+    assert ids(page) == [2, 1]
+
+
+def test_query_with_prefix_letters_matches_the_bare_word(index):
+    # "באנדרואיד" בשאילתה מוצא גם את הפוסט שבו מופיע רק "אנדרואיד"
+    total, page = index.search("באנדרואיד")
+    assert total == 2
+    assert set(ids(page)) == {1, 2}
+
+
+def test_all_query_words_must_match(index):
+    total, page = index.search("גוגל OpenAI")
+    assert (total, ids(page)) == (1, [4])
+    assert index.search("גוגל אייפון") == (0, [])
+
+
+def test_prefix_expansion_matches_longer_words(index):
+    total, page = index.search("מוד")
+    assert set(ids(page)) == {3, 4}
+    # התאמה מלאה מקבלת משקל גבוה מהשלמת קידומת
+    expansions = index._expand("מודל")
+    assert (expansions["מודל"], expansions["מודלימ"]) == (1.0, 0.5)
+    # מילים קצרות משלוש אותיות לא מורחבות
+    assert index.search("מו") == (0, [])
+
+
+def test_naive_dates_are_treated_as_utc_and_ties_prefer_newer_posts():
+    index = SearchIndex()
+    index.add(post(1, "עדכון אבטחה", hours_ago=3))
+    index.add(post(2, "עדכון אבטחה", hours_ago=1, naive=True))
+    index.add({'message_id': 3, 'text': "עדכון אבטחה"})
+    assert index.documents[2]['date'].tzinfo == timezone.utc
+    total, page = index.search("אבטחה")
+    # אותו ציון: החדש קודם, ופוסט ללא תאריך אחרון
+    assert (total, ids(page)) == (3, [2, 1, 3])
+
+
+def test_paging_returns_the_total_and_the_requested_slice():
+    index = SearchIndex()
+    index.rebuild(post(i, "עדכון שבועי", hours_ago=i) for i in range(1, 13))
+    total, first = index.search("עדכון", limit=5)
+    _, second = index.search("עדכון", limit=5, offset=5)
+    _, last = index.search("עדכון", limit=5, offset=10)
+    assert total == 12
+    assert ids(first) == [1, 2, 3, 4, 5]
+    assert ids(second) == [6, 7, 8, 9, 10]
+    assert ids(last) == [11, 12]
+
+
+def test_updating_and_removing_posts_keeps_the_index_consistent(index):
+    index.add(post(3, "פוסט ערוך בלי המילה", hours_ago=10))
+    assert index.search("OpenAI")[0] == 1
+    index.remove(4)
+    assert index.search("OpenAI") == (0, [])
+    assert "openai" not in index.postings
+    assert len(index) == 3
+
+
+def test_remove_before_keeps_newer_posts(index):
+    assert index.remove_before((NOW - timedelta(hours=15)).replace(tzinfo=None)) == 2
+    assert sorted(index.documents) == [3, 4]
+    assert index.search("אנדרואיד") == (0, [])
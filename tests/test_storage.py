@@ -0,0 +1,113 @@
+import time
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from storage import SQLiteStorage, Storage
+
+NOW = datetime(2024, 5, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def post(message_id, date=NOW, text="פוסט"):
+    return {'message_id': message_id, 'date': date, 'text': text}
+
+
+def committed_posts(path):
+    """ספירת הפוסטים שכבר נכתבו לקובץ, מחיבור נפרד (בלי לגרום ל-flush)."""
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "storage.db")
+
+
+def test_backend_missing_a_method_fails_on_construction():
+    class Incomplete(Storage):
+        def insert_post(self, post):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_posts_are_written_in_batches(path):
+    storage = SQLiteStorage(path, batch_size=3, flush_interval=60)
+    storage.insert_post(post(1))
+    storage.insert_post(post(2))
+    assert committed_posts(path) == 0
+    storage.insert_post(post(3))
+    assert committed_posts(path) == 3
+    storage.close()
+
+
+def test_pending_batch_is_flushed_by_timer_and_on_close(path):
+    storage = SQLiteStorage(path, batch_size=100, flush_interval=0.1)
+    storage.insert_post(post(1))
+    time.sleep(0.5)
+    assert committed_posts(path) == 1
+
+    storage.flush_interval = 60
+    storage.insert_post(post(2))
+    storage.close()
+    assert committed_posts(path) == 2
+
+
+def test_reads_see_pending_posts_and_upsert_skips_duplicates(path):
+    storage = SQLiteStorage(path, batch_size=100, flush_interval=60)
+    storage.insert_post(post(1, NOW - timedelta(days=2)))
+    storage.insert_post(post(2, NOW))
+    assert storage.upsert_post(post(2)) is False
+    assert storage.upsert_post(post(3, NOW + timedelta(hours=1))) is True
+
+    window = storage.posts_between(NOW - timedelta(days=1))
+    assert [p['message_id'] for p in window] == [2, 3]
+    assert window[0]['date'] == NOW
+    assert storage.posts_between(NOW - timedelta(days=3), NOW)[0]['message_id'] == 1
+    assert storage.count_posts() == 3
+    assert storage.clear_posts(before=NOW) == 1
+    assert storage.clear_posts() == 2
+    assert storage.count_posts() == 0
+    storage.close()
+
+
+def test_stats_are_nested_and_numeric_values_keep_incrementing(path):
+    storage = SQLiteStorage(path, batch_size=100, flush_interval=60)
+    storage.increment_stats('bot', {'ingest.total': 1, 'per_day.2024-05-10': 1}, {'last_ingest_at': NOW})
+    storage.increment_stats('bot', {'ingest.total': 2, 'stored_posts': 1})
+    storage.increment_stats('bot', {}, {'stored_posts': 10})
+    storage.increment_stats('bot', {'stored_posts': 1})
+
+    stats = storage.get_stats('bot')
+    assert stats['ingest'] == {'total': 3}
+    assert stats['per_day'] == {'2024-05-10': 1}
+    assert stats['stored_posts'] == 11
+    assert stats['last_ingest_at'] == NOW
+    assert storage.get_stats('missing') == {}
+    storage.close()
+
+
+def test_draft_schedule_rollup_and_usage_survive_reopen(path):
+    storage = SQLiteStorage(path)
+    storage.save_draft("<b>טיוטה</b>", window_days=14, candidates=["a", "b"])
+    storage.save_schedule("10:30")
+    storage.save_rollup({'_id': 'day:2024-05-10:t', 'level': 'day', 'start': '2024-05-10', 'text': 'תקציר',
+                         'post_count': 4, 'created_at': NOW})
+    storage.record_usage({'at': NOW, 'purpose': 'manual', 'cost_usd': 0.5})
+    storage.close()
+
+    storage = SQLiteStorage(path)
+    draft = storage.load_draft()
+    assert (draft['text'], draft['window_days'], draft['candidates']) == ("<b>טיוטה</b>", 14, ["a", "b"])
+    assert storage.load_schedule() == "10:30"
+    assert storage.get_rollup('day:2024-05-10:t')['post_count'] == 4
+    assert [entry['purpose'] for entry in storage.usage_since(NOW - timedelta(days=1))] == ['manual']
+    assert storage.usage_since(NOW + timedelta(days=1)) == []
+
+    storage.save_draft(None)
+    storage.save_schedule(None)
+    assert storage.load_draft() is None
+    assert storage.load_schedule() is None
+    storage.close()
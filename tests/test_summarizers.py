@@ -0,0 +1,48 @@
+import pytest
+
+from summarizers import ExtractiveSummarizer, Summarizer, TELEGRAM_MESSAGE_LIMIT, create_summarizer
+
+
+def make_posts(count, sentences=6):
+    posts = []
+    for i in range(count):
+        text = f"עדכון גדול לאנדרואיד מספר {i} עם תכונות חדשות. " + " ".join(
+            f"משפט {j} על מודל בינה מלאכותית חדש של גוגל ו-OpenAI שמשפר את הביצועים בטלפון." for j in range(sentences)
+        ) + f" https://example.com/{i}"
+        posts.append({'message_id': 100 + i, 'text': text})
+    return posts
+
+
+def test_summary_has_paragraph_and_link_per_post():
+    summary = ExtractiveSummarizer(channel_username="AndroidAndAI").summarize(make_posts(3))
+    assert summary.startswith("<b>אז מה היה לנו השבוע? 🔥</b>")
+    assert summary.endswith("מוזמנים לעקוב גם בשבוע הבא 🙌")
+    for message_id in (100, 101, 102):
+        assert f"https://t.me/AndroidAndAI/{message_id}" in summary
+
+
+def test_large_input_stays_within_telegram_limit():
+    summary = ExtractiveSummarizer(channel_username="AndroidAndAI", sentences_per_post=3).summarize(make_posts(200))
+    assert len(summary) <= TELEGRAM_MESSAGE_LIMIT
+    assert "ועוד" in summary
+    assert summary.endswith("מוזמנים לעקוב גם בשבוע הבא 🙌")
+
+
+def test_single_huge_post_is_reduced_to_title_and_link():
+    posts = [{'message_id': 1, 'text': "כותרת קצרה. " + "מילה " * 3000}]
+    summary = ExtractiveSummarizer(channel_username="c", sentences_per_post=2).summarize(posts)
+    assert len(summary) <= TELEGRAM_MESSAGE_LIMIT
+    assert "https://t.me/c/1" in summary
+
+
+def test_empty_input_and_disabled_engine():
+    assert ExtractiveSummarizer().summarize([]) == "לא נמצאו פוסטים רלוונטיים לסיכום."
+    assert create_summarizer("none") is None
+
+
+def test_engine_without_summarize_fails_on_construction():
+    class Incomplete(Summarizer):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
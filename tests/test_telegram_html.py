@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from telegram_html import BENCHMARK_SUMMARY, benchmark, is_valid_telegram_html, repair_telegram_html
+
+FRAGMENTS = [
+    "<b>", "</b>", "<i>", "</i>", "<strong>", "</em>", "<a href=\"https://t.me/x?a=1&b=2\">", "</a>",
+    "<a href=\"javascript:alert(1)\">", "<a>", "<code>", "</code>", "<pre>", "</pre>", "<br>", "<br/>",
+    "<p>", "</p>", "<div class='x'>", "<h2>", "</h2>", "<script>", "</script>", "<span class=\"tg-spoiler\">",
+    "</span>", "<tg-spoiler>", "</tg-spoiler>", "<blockquote>", "</blockquote>", "**", "__", "`", "```py\n",
+    "```", "[קישור](https://example.com)", "[bad](ftp://x)", "\n# כותרת\n", "\n* פריט\n", "&", "&amp;",
+    "&nbsp;", "&#128293;", "<", ">", "a < b", "שלום", "🔥", " ", "\n", "טקסט עברי רגיל", "x", "<<b>>",
+]
+
+
+def random_valid_html(rng, depth=0):
+    """HTML תקין לטלגרם (ללא סימני Markdown) - תיקון שלו חייב להחזיר אותו ללא שינוי."""
+    texts = ["שלום", "a &lt; b", "&amp;", "🔥", "טקסט\n", "x", "&#128293;", " "]
+    tags = ["<b>", "<i>", "<u>", "<s>", "<tg-spoiler>", '<span class="tg-spoiler">', "<blockquote>",
+            '<a href="https://t.me/AndroidAndAI/1?x=1&amp;y=2">', "<code>"]
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        if depth < 3 and rng.random() < 0.5:
+            tag = rng.choice(tags)
+            name = tag[1:].split(" ")[0].rstrip(">")
+            inner = rng.choice(texts) if name in ("a", "code") else random_valid_html(rng, depth + 1)
+            parts.append(f"{tag}{inner}</{name}>")
+        else:
+            parts.append(rng.choice(texts))
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("seed", [7, 11, 23])
+def test_fuzz_corpus_repairs_to_valid_html(seed):
+    rng = random.Random(seed)
+    for _ in range(5000):
+        sample = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 40)))
+        repaired = repair_telegram_html(sample)
+        assert is_valid_telegram_html(repaired), (sample, repaired)
+        assert is_valid_telegram_html(repair_telegram_html(repaired)), (sample, repaired)
+
+
+@pytest.mark.parametrize("seed", [7, 11])
+def test_valid_html_is_unchanged(seed):
+    rng = random.Random(seed)
+    for _ in range(5000):
+        valid = random_valid_html(rng)
+        assert is_valid_telegram_html(valid), valid
+        assert repair_telegram_html(valid) == valid
+
+
+def test_markdown_and_unsafe_links_are_repaired():
+    repaired = repair_telegram_html('**כותרת** [קישור](https://example.com) <a href="javascript:x">רע</a> a < b')
+    assert "<b>כותרת</b>" in repaired
+    assert '<a href="https://example.com">קישור</a>' in repaired
+    assert "javascript" not in repaired
+    assert "a &lt; b" in repaired
+
+
+@pytest.mark.parametrize("text", ["obj.__init__ חדש", "קראו ל-obj.__init__.", "2**10 זה 1024", "snake__case"])
+def test_markers_inside_words_are_not_bold(text):
+    assert repair_telegram_html(text) == text
+
+
+def test_bold_markers_at_word_boundaries_are_converted():
+    assert repair_telegram_html("(**מודגש**) ו-__גם__.") == "(<b>מודגש</b>) ו-<b>גם</b>."
+    assert repair_telegram_html("**פתוח בלבד") == "פתוח בלבד"
+
+
+def test_repair_of_long_summary_stays_fast():
+    # נמדד כאן כ-3-6ms לקריאה; הגבול משאיר מרווח למכונות CI איטיות
+    assert len(BENCHMARK_SUMMARY) > 14000
+    assert benchmark(rounds=20) < 0.05
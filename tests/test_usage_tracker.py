@@ -0,0 +1,39 @@
+import pytest
+import pytz
+
+from storage import SQLiteStorage
+from usage_tracker import BATCH_DISCOUNT, BudgetGuard, UsageTracker, estimate_cost
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "usage.db"))
+    yield UsageTracker(storage)
+    storage.close()
+
+
+def test_estimate_cost_prices_cached_tokens_and_longest_prefix():
+    # gpt-4o-mini ולא gpt-4o: נבחרת התחילית הארוכה ביותר
+    assert estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0) == pytest.approx(0.15)
+    assert estimate_cost("gpt-4o-mini", 1_000_000, 0, cached_tokens=1_000_000) == pytest.approx(0.075)
+    assert estimate_cost("unknown-model", 1000, 1000) == 0.0
+
+
+def test_summary_and_batch_discount(tracker):
+    tracker.record("manual", "gpt-4o", 1.0, prompt_tokens=1_000_000)
+    tracker.record("scheduled:batch", "gpt-4o", 0.0, prompt_tokens=1_000_000, batch=True)
+    summary = tracker.summarize_since(BudgetGuard(tracker, None, "x", pytz.UTC).month_start())
+    assert summary['calls'] == 2
+    assert summary['cost_usd'] == pytest.approx(2.50 * (1 + BATCH_DISCOUNT))
+    assert set(summary['by_purpose']) == {"manual", "scheduled:batch"}
+
+
+def test_budget_guard_reacts_after_invalidate(tracker):
+    guard = BudgetGuard(tracker, monthly_budget=1.0, cheap_model="gpt-4o-mini", tz=pytz.UTC)
+    assert guard.decide() == (None, False)
+
+    tracker.record("manual", "gpt-4o", 1.0, prompt_tokens=1_000_000)
+    # בלי invalidate ההוצאה נקראת מהמטמון
+    assert guard.decide() == (None, False)
+    guard.invalidate()
+    assert guard.decide() == ("gpt-4o-mini", True)
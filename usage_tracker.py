@@ -0,0 +1,145 @@
+"""
+מעקב צריכת טוקנים ועלות לכל קריאת LLM, ושומר תקציב שעובר למודל זול יותר או לפרומפט מכווץ
+כשההוצאה החודשית מגיעה לסף שהוגדר.
+"""
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# מחיר לכל מיליון טוקנים בדולרים: (קלט, קלט ממטמון הקידומת, פלט).
+# מזוהה לפי התחילית הארוכה ביותר של שם המודל. למודלים ללא prompt caching מחיר המטמון זהה לקלט
+MODEL_PRICES = {
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+# בקשות שנשלחות דרך Batch API מחויבות בחצי מחיר
+BATCH_DISCOUNT = 0.5
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """עלות משוערת בדולרים. cached_tokens הם חלק מ-prompt_tokens. מודל לא מוכר נספר בעלות 0 (ונרשם בלוג)."""
+    matches = [name for name in MODEL_PRICES if (model or "").startswith(name)]
+    if not matches:
+        logger.warning(f"No price configured for model '{model}'. Counting its cost as 0.")
+        return 0.0
+    input_price, cached_price, output_price = MODEL_PRICES[max(matches, key=len)]
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+class UsageTracker:
+    """רושם כל קריאת LLM דרך שכבת האחסון (record_usage/usage_since) ומחשב סיכומים לתקופה."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def record(self, purpose: str, model: str, latency: float, post_count: int = 0, input_bytes: int = 0,
+               prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0, attempts: int = 1,
+               hedged: bool = False, success: bool = True, error: Optional[str] = None,
+               prompt_version: Optional[str] = None, batch: bool = False):
+        entry = {
+            'at': datetime.now(timezone.utc),
+            'purpose': purpose,
+            'model': model,
+            'prompt_version': prompt_version,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+            'cost_usd': estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens) * (BATCH_DISCOUNT if batch else 1),
+            'batch': batch,
+            'latency': latency,
+            'attempts': attempts,
+            'hedged': hedged,
+            'post_count': post_count,
+            'input_bytes': input_bytes,
+            'success': success,
+            'error': error,
+        }
+        try:
+            self.store.record_usage(entry)
+        except Exception as e:
+            # רישום הצריכה לא אמור להכשיל את יצירת הסיכום
+            logger.error(f"Failed to record LLM usage: {e}")
+        return entry
+
+    def summarize_since(self, since: datetime) -> Dict:
+        """סיכום הקריאות מאז since: מספר קריאות, כשלונות, טוקנים, עלות, השהיה ממוצעת ופילוח לפי מטרה."""
+        entries: List[Dict] = self.store.usage_since(since)
+        summary = {
+            'calls': len(entries),
+            'failed': sum(1 for e in entries if not e.get('success', True)),
+            'prompt_tokens': sum(e.get('prompt_tokens', 0) for e in entries),
+            'completion_tokens': sum(e.get('completion_tokens', 0) for e in entries),
+            'cached_tokens': sum(e.get('cached_tokens', 0) for e in entries),
+            'cost_usd': sum(e.get('cost_usd', 0.0) for e in entries),
+            'avg_latency': sum(e.get('latency', 0.0) for e in entries) / len(entries) if entries else 0.0,
+            'posts': sum(e.get('post_count', 0) for e in entries),
+            'input_bytes': sum(e.get('input_bytes', 0) for e in entries),
+            'by_purpose': {},
+        }
+        for entry in entries:
+            bucket = summary['by_purpose'].setdefault(entry.get('purpose', '?'), {'calls': 0, 'cost_usd': 0.0, 'tokens': 0})
+            bucket['calls'] += 1
+            bucket['cost_usd'] += entry.get('cost_usd', 0.0)
+            bucket['tokens'] += entry.get('prompt_tokens', 0) + entry.get('completion_tokens', 0)
+        return summary
+
+
+class BudgetGuard:
+    """
+    בודק את ההוצאה מתחילת החודש (לפי אזור הזמן שסופק). מעל הסף מחזיר מודל חלופי זול יותר
+    ובקשה לכווץ את הפרומפט. ההוצאה נשמרת במטמון לזמן קצר כדי לא לשאול את המאגר בכל קריאה.
+    """
+
+    def __init__(self, tracker: UsageTracker, monthly_budget: Optional[float], cheap_model: str, tz,
+                 cache_seconds: float = 60.0):
+        self.tracker = tracker
+        self.monthly_budget = monthly_budget
+        self.cheap_model = cheap_model
+        self.tz = tz
+        self.cache_seconds = cache_seconds
+        self._cached_spend: Optional[Tuple[float, float]] = None
+
+    def month_start(self) -> datetime:
+        now = datetime.now(self.tz)
+        return self.tz.localize(datetime(now.year, now.month, 1)).astimezone(timezone.utc)
+
+    def month_spend(self) -> float:
+        if self._cached_spend and time.monotonic() - self._cached_spend[0] < self.cache_seconds:
+            return self._cached_spend[1]
+        spend = self.tracker.summarize_since(self.month_start())['cost_usd']
+        self._cached_spend = (time.monotonic(), spend)
+        return spend
+
+    def invalidate(self):
+        """נקרא אחרי רישום קריאה בתשלום, כדי שחציית התקציב תזוהה כבר בקריאה הבאה."""
+        self._cached_spend = None
+
+    def decide(self) -> Tuple[Optional[str], bool]:
+        """מחזיר (מודל חלופי או None, האם לכווץ את הפרומפט)."""
+        if not self.monthly_budget:
+            return None, False
+        spend = self.month_spend()
+        if spend < self.monthly_budget:
+            return None, False
+        logger.warning(
+            f"Monthly LLM spend ${spend:.2f} reached the budget of ${self.monthly_budget:.2f}. "
+            f"Switching to {self.cheap_model} with a compacted prompt."
+        )
+        return self.cheap_model, True
+
+
+def period_starts(now: Optional[datetime] = None) -> Dict[str, datetime]:
+    """תחילת השבוע והחודש האחרונים (7 ו-30 ימים) לצורך דוח /usage."""
+    now = now or datetime.now(timezone.utc)
+    return {'week': now - timedelta(days=7), 'month': now - timedelta(days=30)}